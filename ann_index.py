@@ -0,0 +1,265 @@
+"""
+Approximate nearest-neighbour backends for the embedding index.
+
+The exact scan in EmbeddingIndex.score_many costs one dot product per phrase
+row, which grows linearly with the catalog. For merged multi-hospital
+catalogs an ANN backend first retrieves the `candidates` most similar phrase
+rows per query; EmbeddingIndex then re-ranks only the tests owning those rows
+with exact cosine scores, so reported scores are unchanged and only recall
+(tests that were never retrieved) is traded for speed.
+
+Backends:
+    "ivf"   - pure NumPy inverted file (spherical k-means); knobs: nlist, nprobe
+    "hnsw"  - hnswlib graph (optional dependency); knobs: m, ef_construction, ef
+    "faiss" - faiss-cpu IVF-Flat (optional dependency); knobs: nlist, nprobe
+
+Every backend indexes the rows of EmbeddingIndex.matrix by row number and
+supports appending rows, which is how copy-on-write upserts keep it current.
+The backend is shared by an index and the copies derived from it, so add()
+may run while other threads search: each backend serializes the two itself
+(hnswlib and faiss indexes are not safe for concurrent add and search).
+"""
+
+import threading
+import numpy as np
+from typing import Dict, Any, List, Optional
+
+try:
+    import hnswlib
+except ImportError:  # Optional dependency
+    hnswlib = None
+
+try:
+    import faiss
+except ImportError:  # Optional dependency
+    faiss = None
+
+
+def _topk_rows(scores: np.ndarray, rows: np.ndarray, k: int) -> np.ndarray:
+    """Rows with the k highest scores (unordered), for one query"""
+    if len(rows) <= k:
+        return rows
+    return rows[np.argpartition(-scores, k - 1)[:k]]
+
+
+class IVFBackend:
+    """
+    Inverted-file index in pure NumPy.
+
+    Rows are clustered around `nlist` unit centroids (spherical k-means on a
+    sample). A query scores the centroids, then exactly scores only the rows
+    of its `nprobe` closest lists. Recall grows with nprobe / nlist.
+
+    Args:
+        matrix: Unit-normalized (rows, dim) matrix to index
+        nlist: Number of clusters (default ~4 * sqrt(rows))
+        nprobe: Clusters scanned per query
+        iterations: k-means iterations
+        sample_size: Rows used to train the centroids
+        seed: Random seed for training
+    """
+
+    name = "ivf"
+    knobs = ("nlist", "nprobe", "iterations", "sample_size", "seed")
+
+    def __init__(self, matrix: np.ndarray, nlist: Optional[int] = None, nprobe: int = 8,
+                 iterations: int = 10, sample_size: int = 20000, seed: int = 0):
+        rows = matrix.shape[0]
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+
+        rng = np.random.default_rng(seed)
+        sample = matrix if rows <= sample_size else matrix[np.sort(rng.choice(rows, sample_size, replace=False))]
+        sample = np.asarray(sample, dtype=np.float32)
+        # Centroids are seeded from distinct sample rows, so there can be at most len(sample) lists
+        self.nlist = max(1, min(nlist or int(4 * np.sqrt(rows)), len(sample)))
+        centroids = sample[rng.choice(len(sample), self.nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assign, kind="stable")
+            clusters, starts = np.unique(assign[order], return_index=True)
+            sums = np.zeros_like(centroids)
+            sums[clusters] = np.add.reduceat(sample[order], starts, axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty clusters with random sample rows
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = sums / norms
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+
+        assign = self._assign(matrix)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+        # Lists are replaced, never mutated, so searches need no lock (add() holds it against other writers)
+        self._lists: List[np.ndarray] = [order[bounds[i]:bounds[i + 1]] for i in range(self.nlist)]
+        self.size = rows
+
+    def _assign(self, vectors: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+        """Nearest centroid of every row"""
+        assign = np.empty(vectors.shape[0], dtype=np.int64)
+        for start in range(0, vectors.shape[0], batch_size):
+            block = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+            assign[start:start + batch_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return assign
+
+    def add(self, start_row: int, vectors: np.ndarray):
+        """Index rows start_row.. start_row + len(vectors) - 1"""
+        assign = self._assign(vectors)
+        with self._lock:
+            for cluster in np.unique(assign):
+                new_rows = start_row + np.nonzero(assign == cluster)[0]
+                self._lists[cluster] = np.concatenate([self._lists[cluster], new_rows])
+            self.size = max(self.size, start_row + len(vectors))
+
+    def search(self, matrix: np.ndarray, queries: np.ndarray, k: int) -> List[np.ndarray]:
+        """
+        Retrieve the k most similar rows of each query among the probed lists.
+
+        Args:
+            matrix: The indexed matrix (rows are scored exactly)
+            queries: Unit-normalized (num_queries, dim) queries
+            k: Rows to return per query
+
+        Returns:
+            One array of row numbers per query
+        """
+        nprobe = min(self.nprobe, self.nlist)
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        results = []
+        for query, probe in zip(queries, probes):
+            rows = np.concatenate([self._lists[c] for c in probe])
+            rows = rows[rows < matrix.shape[0]]
+            results.append(_topk_rows(matrix[rows] @ query, rows, k))
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "rows": self.size, "nlist": self.nlist, "nprobe": self.nprobe}
+
+
+class HNSWBackend:
+    """
+    hnswlib HNSW graph over the matrix rows (inner product on unit vectors).
+
+    Args:
+        matrix: Unit-normalized (rows, dim) matrix to index
+        m: Graph degree (memory / recall)
+        ef_construction: Build-time beam width
+        ef: Query-time beam width (recall / latency knob)
+    """
+
+    name = "hnsw"
+    knobs = ("m", "ef_construction", "ef")
+
+    def __init__(self, matrix: np.ndarray, m: int = 16, ef_construction: int = 200, ef: int = 64):
+        if hnswlib is None:
+            raise ImportError("ANN backend 'hnsw' requires hnswlib (pip install hnswlib)")
+        rows, dim = matrix.shape
+        self.ef = ef
+        self._lock = threading.Lock()
+        self._index = hnswlib.Index(space="ip", dim=dim)
+        self._index.init_index(max_elements=max(rows, 1), ef_construction=ef_construction, M=m)
+        if rows:
+            self._index.add_items(np.asarray(matrix, dtype=np.float32), np.arange(rows))
+        self._index.set_ef(ef)
+
+    @property
+    def size(self) -> int:
+        return self._index.get_current_count()
+
+    def add(self, start_row: int, vectors: np.ndarray):
+        with self._lock:
+            needed = start_row + len(vectors)
+            if needed > self._index.get_max_elements():
+                self._index.resize_index(max(needed, 2 * self._index.get_max_elements()))
+            self._index.add_items(np.asarray(vectors, dtype=np.float32), np.arange(start_row, needed))
+
+    def search(self, matrix: np.ndarray, queries: np.ndarray, k: int) -> List[np.ndarray]:
+        k = min(k, self.size)
+        if k == 0:
+            return [np.zeros(0, dtype=np.int64) for _ in queries]
+        with self._lock:
+            # ef below k is invalid in hnswlib
+            self._index.set_ef(max(self.ef, k))
+            labels, _ = self._index.knn_query(queries, k=k)
+        return [row[row < matrix.shape[0]].astype(np.int64) for row in labels]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "rows": self.size, "ef": self.ef}
+
+
+class FaissBackend:
+    """
+    faiss-cpu IVF-Flat index with inner-product metric.
+
+    Args:
+        matrix: Unit-normalized (rows, dim) matrix to index
+        nlist: Number of clusters (default ~4 * sqrt(rows))
+        nprobe: Clusters scanned per query
+    """
+
+    name = "faiss"
+    knobs = ("nlist", "nprobe")
+
+    def __init__(self, matrix: np.ndarray, nlist: Optional[int] = None, nprobe: int = 8):
+        if faiss is None:
+            raise ImportError("ANN backend 'faiss' requires faiss-cpu (pip install faiss-cpu)")
+        rows, dim = matrix.shape
+        self.nlist = max(1, min(nlist or int(4 * np.sqrt(rows)), rows))
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._quantizer = faiss.IndexFlatIP(dim)
+        self._index = faiss.IndexIVFFlat(self._quantizer, dim, self.nlist, faiss.METRIC_INNER_PRODUCT)
+        vectors = np.ascontiguousarray(matrix, dtype=np.float32)
+        self._index.train(vectors)
+        self._index.add(vectors)
+        self._index.nprobe = nprobe
+
+    @property
+    def size(self) -> int:
+        return self._index.ntotal
+
+    def add(self, start_row: int, vectors: np.ndarray):
+        # faiss assigns sequential ids, which match matrix rows as long as rows are only appended
+        with self._lock:
+            if start_row != self._index.ntotal:
+                raise ValueError(f"faiss backend expects row {self._index.ntotal}, got {start_row}")
+            self._index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+
+    def search(self, matrix: np.ndarray, queries: np.ndarray, k: int) -> List[np.ndarray]:
+        with self._lock:
+            _, labels = self._index.search(np.ascontiguousarray(queries, dtype=np.float32), k)
+        return [row[(row >= 0) & (row < matrix.shape[0])].astype(np.int64) for row in labels]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "rows": self.size, "nlist": self.nlist, "nprobe": self.nprobe}
+
+
+ANN_BACKENDS = {
+    "ivf": IVFBackend,
+    "hnsw": HNSWBackend,
+    "faiss": FaissBackend,
+}
+
+
+def build_ann_backend(name: str, matrix: np.ndarray, **params):
+    """
+    Build an ANN backend over an embedding matrix.
+
+    Args:
+        name: One of ANN_BACKENDS ("ivf", "hnsw", "faiss")
+        matrix: Unit-normalized (rows, dim) matrix, e.g. EmbeddingIndex.matrix
+        **params: Backend knobs (nlist/nprobe, m/ef_construction/ef); None values and
+            knobs of other backends are ignored, so one config can serve every backend
+
+    Returns:
+        Backend instance
+
+    Raises:
+        ValueError: Unknown backend name
+        ImportError: The backend's optional dependency is not installed
+    """
+    if name not in ANN_BACKENDS:
+        raise ValueError(f"Unknown ANN backend '{name}' (expected one of {', '.join(ANN_BACKENDS)})")
+    backend = ANN_BACKENDS[name]
+    return backend(matrix, **{k: v for k, v in params.items() if v is not None and k in backend.knobs})
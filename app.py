@@ -1,103 +1,459 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
+import time
+_IMPORT_STARTED = time.perf_counter()  # Reference point of the startup breakdown in /api/status
+
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
-from sentence_transformers import SentenceTransformer
+import asyncio
 import json
+import logging
+import numpy as np
 import os
-import time
-from openai import OpenAI
+import threading
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
 
 from utils import (
-    normalize_text,
     split_into_chunks,
-    is_order_intent,
-    has_test_reference,
-    extract_negated_tests,
-    embedding_match,
-    llm_fallback,
-    NEGATION_WORDS,
-    SYMPTOM_WORDS
+    classify_chunk,
+    embedding_match_batch,
+    embedding_match_cascade,
+    llm_fallback_async,
+    parse_batch_line,
+    add_timing
 )
-from database import init_db, get_db, get_db_session, TestRepository
+from database import (
+    init_db, get_db, get_db_session, Test, TestRepository, PhraseRepository, LLMDecisionCache, EMBEDDING_STORAGE
+)
+from embedding_index import EmbeddingIndex
+from ann_index import build_ann_backend
+from embedding_snapshot import write_snapshot, load_snapshot, read_snapshot_header
+from lexical_index import LexicalIndex
+from catalog import Catalog
+from jobs import EmbeddingJobManager
+from encoders import CachedEncoder, LazyEncoder, load_encoder
+from sessions import MatchSession, parse_session_message
+from metrics import REGISTRY, CONTENT_TYPE, Counter, Gauge, Histogram
 
 load_dotenv()
 
-MODEL_NAME = "all-mpnet-base-v2"
-
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Sentence embedding model and the backend running it: torch (sentence-transformers)
+# or onnx (int8 export from export_onnx.py, run by onnxruntime; see encoders.py)
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2")
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR")  # Default: models/<model>-onnx-int8
+ONNX_THREADS = int(os.getenv("ONNX_THREADS")) if os.getenv("ONNX_THREADS") else None
+
+# Optional two-tier cascade: CASCADE_MODEL (e.g. all-MiniLM-L6-v2) scores every chunk first and
+# only chunks with a test inside the fast-score band CASCADE_BAND=low,high go to MODEL_NAME
+CASCADE_MODEL = os.getenv("CASCADE_MODEL", "")
+CASCADE_BAND = tuple(float(x) for x in os.getenv("CASCADE_BAND", "0.5,0.8").split(","))
+
+# The model loads in a background thread at startup (MODEL_PRELOAD=0: on first use instead).
+# Matching requests wait up to MODEL_READY_TIMEOUT seconds for it, then get a 503.
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "1").lower() not in ("0", "false", "no")
+MODEL_READY_TIMEOUT = float(os.getenv("MODEL_READY_TIMEOUT", "30"))
+
+# Optional memory-mapped embedding snapshot shared by all workers (disabled if unset)
+EMBEDDING_SNAPSHOT_PATH = os.getenv("EMBEDDING_SNAPSHOT_PATH")
+
+# Optional approximate nearest-neighbour search for large catalogs (see ann_index.py):
+# ANN_BACKEND=ivf|hnsw|faiss, used once the catalog has at least ANN_MIN_ROWS phrase rows
+ANN_BACKEND = os.getenv("ANN_BACKEND", "").lower()
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "50000"))
+ANN_CANDIDATES = int(os.getenv("ANN_CANDIDATES", "100"))  # Rows retrieved per query before exact re-rank
+ANN_PARAMS = {
+    "nlist": int(os.getenv("ANN_NLIST")) if os.getenv("ANN_NLIST") else None,
+    "nprobe": int(os.getenv("ANN_NPROBE")) if os.getenv("ANN_NPROBE") else None,
+    "ef": int(os.getenv("ANN_EF")) if os.getenv("ANN_EF") else None,
+}
+
+# Optional quantized scan of the embedding matrix: none, float16 or int8 (see quantization.py).
+# Full-precision rows move to a memory-mapped file and are only read to re-score candidates.
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "none").lower()
+QUANTIZATION_RESCORE_TOP = int(os.getenv("QUANTIZATION_RESCORE_TOP", "16"))
+
+# OpenAI-compatible endpoint for the LLM fallback; default: the OpenAI API.
+# Point it at the local stub for offline load tests (python -m benchmarks.llm_stub).
+# OPENAI_MAX_RETRIES: SDK retries (with backoff) of failed calls; 0 for load tests, so injected
+# stub errors reach the app's llm_error path instead of being hidden behind retries.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+async_openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=OPENAI_BASE_URL,
+                                  max_retries=OPENAI_MAX_RETRIES)
+
+# Optional JSONL log of /match_stream request bodies, replayable with benchmarks/load_test.py
+MATCH_REQUEST_LOG = os.getenv("MATCH_REQUEST_LOG")
+_request_log_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+# /match_batch: transcripts matched per embedding stage pass, and per request
+MATCH_BATCH_SIZE = int(os.getenv("MATCH_BATCH_SIZE", "256"))
+MATCH_BATCH_MAX = int(os.getenv("MATCH_BATCH_MAX", "10000"))
+
+# Cap on concurrent OpenAI fallback calls across all in-flight requests
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# Persistent cache of LLM fallback decisions (llm_decisions table), default TTL 7 days
+llm_cache = LLMDecisionCache(ttl_seconds=int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))))
 
 app = FastAPI()
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Initialize database on startup
+# Startup breakdown (ms) for /api/status; model timings are filled in by the loader
+_startup = {"app_import_ms": None, "db_init_ms": None, "serving_after_ms": None, "cache_warm_ms": None}
+_model_timings = {}
+
+# Initialize database on startup; the catalog and the model load in background threads
 @app.on_event("startup")
 def startup_event():
+    start = time.perf_counter()
     init_db()
+    _startup["db_init_ms"] = round((time.perf_counter() - start) * 1000, 1)
     print("Database initialized")
-    # Warm up cache in background
-    warm_cache()
+    threading.Thread(target=warm_cache, name="cache-warmup", daemon=True).start()
+    if MODEL_PRELOAD:
+        model.start()
+    _startup["serving_after_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+
+# Sentence embedding model, loaded lazily (see MODEL_PRELOAD); encode() blocks until it is ready
+model = LazyEncoder(
+    lambda: load_encoder(MODEL_NAME, ENCODER_BACKEND, ONNX_MODEL_DIR, ONNX_THREADS, timings=_model_timings)
+)
 
-model = SentenceTransformer(MODEL_NAME)
+# LRU cache of chunk embeddings in front of the model, used for query-time encoding only
+query_encoder = CachedEncoder(
+    model,
+    max_entries=int(os.getenv("QUERY_CACHE_SIZE", "4096")),
+    max_bytes=int(os.getenv("QUERY_CACHE_MAX_MB", "64")) * 1024 * 1024
+)
+
+# Small cascade model (same backend), loaded in the background once it is first needed
+fast_model = LazyEncoder(lambda: load_encoder(CASCADE_MODEL, ENCODER_BACKEND, None, ONNX_THREADS))
+fast_query_encoder = CachedEncoder(
+    fast_model,
+    max_entries=query_encoder.max_entries,
+    max_bytes=query_encoder.max_bytes
+)
+_fast_index_lock = threading.Lock()  # Single-flight guard for cascade index builds
+_cascade_stats = {"fast": 0, "full": 0, "index_builds": 0, "last_build_ms": None}
+_session_stats = {"active": 0, "total": 0, "fragments": 0}  # /ws/session connections and fragments
+
+# Prometheus metrics served at /metrics (see metrics.py). Stages of the matching pipeline:
+# chunking, lexical (gates), encode (query embeddings), scan (index scoring), llm (fallback phase)
+MATCH_STAGES = ("chunking", "lexical", "encode", "scan", "llm")
+STAGE_SECONDS = Histogram("medtest_stage_seconds", "Time per matching stage and request (cache_reload: per reload)",
+                          ("stage",))
+REQUEST_SECONDS = Histogram("medtest_request_seconds", "Matching latency per request (match_batch: per slice)", ("endpoint",))
+CHUNKS_TOTAL = Counter("medtest_chunks_total", "Resolved chunks by trace method and skip reason", ("method", "reason"))
+LLM_CALLS_TOTAL = Counter("medtest_llm_calls_total", "LLM fallbacks by outcome (ok, cached, error)", ("outcome",))
+LLM_CALL_SECONDS = Histogram("medtest_llm_call_seconds", "OpenAI fallback call latency")
+LLM_QUEUE_SECONDS = Histogram("medtest_llm_queue_seconds", "Wait for an LLM concurrency slot (LLM_MAX_CONCURRENCY)")
+
+
+def _cache_counters(field: str) -> dict:
+    """Per-cache value of a stats() field, keyed by cache label"""
+    caches = {"query": query_encoder.stats(), "llm": llm_cache.stats()}
+    if CASCADE_MODEL:
+        caches["fast_query"] = fast_query_encoder.stats()
+    return {(name,): stats[field] for name, stats in caches.items()}
+
+
+Gauge("medtest_cache_hits_total", "Cache hits (query embeddings, LLM decisions)", ("cache",),
+      callback=lambda: _cache_counters("hits"), kind="counter")
+Gauge("medtest_cache_misses_total", "Cache misses (query embeddings, LLM decisions)", ("cache",),
+      callback=lambda: _cache_counters("misses"), kind="counter")
+Gauge("medtest_cache_hit_ratio", "Cache hit ratio since start", ("cache",),
+      callback=lambda: _cache_counters("hit_ratio"))
+Gauge("medtest_catalog_reloads_total", "Full catalog reloads", callback=lambda: {(): _reload_stats["reloads"]},
+      kind="counter")
+Gauge("medtest_catalog_stale_served_total", "Requests served from the previous catalog during a reload",
+      callback=lambda: {(): _reload_stats["stale_served"]}, kind="counter")
+Gauge("medtest_model_ready", "1 once the embedding model is loaded", callback=lambda: {(): int(model.ready)})
+Gauge("medtest_sessions_active", "Open /ws/session connections", callback=lambda: {(): _session_stats["active"]})
 
 # Enhanced caching system with smart invalidation
-_tests_cache = None
+_catalog = None  # Catalog: cached tests plus their embedding and lexical indexes
+_catalog_lock = threading.Lock()  # Serializes incremental catalog updates
+_catalog_version = 0  # Bumped (under _catalog_lock) by every incremental update and invalidation
+_reload_lock = threading.Lock()  # Single-flight guard for full reloads
+_reload_stats = {
+    "reloads": 0,
+    "in_progress": False,
+    "last_duration_ms": None,
+    "max_duration_ms": 0.0,
+    "stale_served": 0,  # Requests answered from the previous catalog during a reload
+    "coalesced_waiters": 0  # Requests that waited for another caller's reload (cold start)
+}
 _cache_valid = False
 _cache_timestamp = 0
 _cache_ttl = 300  # 5 minutes TTL for cache
+RELOAD_ATTEMPTS = 3  # Reloads repeated when a CRUD update interleaves (see _reload_cache)
 
-def get_tests_with_embeddings(db: Session = None) -> List[dict]:
-    """Get tests with embeddings, using optimized cache"""
-    global _tests_cache, _cache_valid, _cache_timestamp
+_snapshot_version = None  # Version of the mapped snapshot file
+_snapshot_stat = None  # (inode, mtime_ns) of the mapped snapshot file
+
+def _snapshot_file_stat():
+    """Identity of the snapshot file currently at EMBEDDING_SNAPSHOT_PATH"""
+    try:
+        st = os.stat(EMBEDDING_SNAPSHOT_PATH)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns)
+
+def _snapshot_changed() -> bool:
+    """Check whether another worker published a new snapshot (one stat call)"""
+    return bool(EMBEDDING_SNAPSHOT_PATH) and _snapshot_file_stat() != _snapshot_stat
+
+def publish_snapshot(db: Session, source: Optional[int] = None) -> int:
+    """Export the catalog from the database as a new snapshot version
+    
+    The database fingerprint is taken before the tests are read: a change
+    landing in between only makes the next check republish once more.
+    """
+    if source is None:
+        source = TestRepository.get_catalog_fingerprint(db)
+    tests = TestRepository.get_tests_with_embeddings(db)
+    version = write_snapshot(EMBEDDING_SNAPSHOT_PATH, tests, source=source)
+    print(f"Published embedding snapshot version {version}: {len(tests)} tests")
+    return version
+
+def _reload_cache(db: Session, current_time: float) -> Catalog:
+    """Reload tests from the database (or shared snapshot) and rebuild the catalog indexes
     
-    current_time = time.time()
+    A CRUD change that lands while the reload reads the database would be
+    applied to the outgoing catalog and then overwritten by the reloaded one.
+    _catalog_version detects that: the reload is repeated (with a fresh
+    session, which sees the committed change) until no update interleaved.
+    After RELOAD_ATTEMPTS the last result is kept but left invalid, so the
+    next request reloads again.
+    """
+    global _catalog, _cache_valid, _cache_timestamp
+
+    for attempt in range(RELOAD_ATTEMPTS):
+        version = _catalog_version
+        if attempt == 0:
+            catalog = _load_catalog_source(db)
+        else:
+            retry_db = get_db_session()
+            try:
+                catalog = _load_catalog_source(retry_db)
+            finally:
+                retry_db.close()
+        with _catalog_lock:
+            unchanged = _catalog_version == version
+            if unchanged or attempt == RELOAD_ATTEMPTS - 1:
+                _catalog = catalog
+                _cache_valid = unchanged
+                _cache_timestamp = current_time
+                return catalog
+        print("Catalog changed during reload; reloading again")
+
+def _load_catalog_source(db: Session) -> Catalog:
+    """Build a catalog from the database (or shared snapshot), with ANN and quantization applied"""
+    global _snapshot_version, _snapshot_stat
+
+    if EMBEDDING_SNAPSHOT_PATH:
+        header = read_snapshot_header(EMBEDDING_SNAPSHOT_PATH)
+        source = TestRepository.get_catalog_fingerprint(db)
+        if header is None or header[1] != source:
+            # Missing, written in an older file format, or exported from another database state
+            publish_snapshot(db, source)
+        # Record the file identity before mapping so a concurrent publish is picked up next call
+        _snapshot_stat = _snapshot_file_stat()
+        tests, index, _snapshot_version = load_snapshot(EMBEDDING_SNAPSHOT_PATH)
+        catalog = Catalog(tests, index)
+    else:
+        catalog = Catalog.from_tests(TestRepository.get_tests_with_embeddings(db))
+    _attach_ann(catalog.index)
+    _quantize(catalog.index)
+    return catalog
+
+def _attach_ann(index: EmbeddingIndex):
+    """Build the configured ANN backend over a freshly loaded index (large catalogs only)"""
+    if not ANN_BACKEND or index.matrix.shape[0] < ANN_MIN_ROWS:
+        return
+    start = time.perf_counter()
+    index.attach_ann(build_ann_backend(ANN_BACKEND, index.matrix, **ANN_PARAMS), candidates=ANN_CANDIDATES)
+    print(f"Built {ANN_BACKEND} ANN index over {index.matrix.shape[0]} rows "
+          f"in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+def _quantize(index: EmbeddingIndex):
+    """Replace the float32 scan with the configured quantized one (exact scans only)"""
+    if EMBEDDING_QUANTIZATION in ("", "none") or index.ann is not None or index.matrix.size == 0:
+        return
+    full_bytes = index.matrix.nbytes
+    index.quantize(EMBEDDING_QUANTIZATION, rescore_top=QUANTIZATION_RESCORE_TOP)
+    print(f"Quantized embedding matrix to {EMBEDDING_QUANTIZATION}: "
+          f"{full_bytes / 2**20:.1f}MB -> {index.quantized.nbytes / 2**20:.1f}MB resident")
+
+def _cache_is_fresh(current_time: float) -> bool:
+    """Cache is valid, not expired and still the latest shared snapshot"""
+    return (_cache_valid and 
+            _catalog is not None and 
+            (current_time - _cache_timestamp) < _cache_ttl and
+            not _snapshot_changed())
+
+def _timed_reload(db: Session, current_time: float) -> Catalog:
+    """Run one reload (caller holds _reload_lock) and record its duration"""
+    _reload_stats["in_progress"] = True
+    started = time.perf_counter()
+    try:
+        if db is None:
+            db = get_db_session()
+            try:
+                catalog = _reload_cache(db, current_time)
+            finally:
+                db.close()
+        else:
+            catalog = _reload_cache(db, current_time)
+    finally:
+        _reload_stats["in_progress"] = False
+
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    STAGE_SECONDS.observe(duration_ms / 1000, stage="cache_reload")
+    _reload_stats["reloads"] += 1
+    _reload_stats["last_duration_ms"] = duration_ms
+    _reload_stats["max_duration_ms"] = max(_reload_stats["max_duration_ms"], duration_ms)
+    print(f"Cache reloaded: {len(catalog)} tests with embeddings in {duration_ms}ms")
+    return catalog
+
+def get_catalog(db: Session = None) -> Catalog:
+    """Get the cached catalog (tests plus indexes), reloading it if needed
+    
+    Reloads are single-flight: when the cache goes stale under load, one
+    caller reloads while concurrent callers keep getting the previous catalog
+    (stale-while-revalidate). Callers only block when there is no previous
+    catalog to serve (cold start).
+    """
+    if _cache_is_fresh(time.time()):
+        return _catalog
     
-    # Check if cache is valid and not expired
-    if (_cache_valid and 
-        _tests_cache is not None and 
-        (current_time - _cache_timestamp) < _cache_ttl):
-        return _tests_cache
+    # Cache miss or expired - one caller reloads from the database
+    if _reload_lock.acquire(blocking=False):
+        try:
+            current_time = time.time()
+            # Another caller may have finished a reload just before we got the lock
+            if _cache_is_fresh(current_time):
+                return _catalog
+            return _timed_reload(db, current_time)
+        finally:
+            _reload_lock.release()
+    
+    # A reload is already running: serve the previous catalog if we have one
+    previous = _catalog
+    if previous is not None:
+        _reload_stats["stale_served"] += 1
+        return previous
+    
+    # Cold start: wait for the running reload instead of starting another
+    _reload_stats["coalesced_waiters"] += 1
+    with _reload_lock:
+        if _catalog is not None:
+            return _catalog
+        # The reload we waited for failed; try once ourselves
+        return _timed_reload(db, time.time())
+
+def get_tests_with_embeddings(db: Session = None) -> List[dict]:
+    """Get tests with embeddings, using optimized cache"""
+    return get_catalog(db).tests
+
+def invalidate_cache():
+    """Smart cache invalidation
     
-    # Cache miss or expired - reload from database
-    if db is None:
+    With a shared snapshot, also publishes a new snapshot version so every
+    worker picks up the change on its next request.
+    """
+    global _cache_valid, _cache_timestamp, _catalog_version
+    with _catalog_lock:
+        _catalog_version += 1
+        _cache_valid = False
+        _cache_timestamp = 0
+
+    if EMBEDDING_SNAPSHOT_PATH:
         db = get_db_session()
         try:
-            _tests_cache = TestRepository.get_tests_with_embeddings(db)
-            _cache_valid = True
-            _cache_timestamp = current_time
-            print(f"Cache reloaded: {len(_tests_cache)} tests with embeddings")
-            return _tests_cache
+            publish_snapshot(db)
         finally:
             db.close()
-    else:
-        _tests_cache = TestRepository.get_tests_with_embeddings(db)
-        _cache_valid = True
-        _cache_timestamp = current_time
-        return _tests_cache
 
-def invalidate_cache():
-    """Smart cache invalidation"""
-    global _cache_valid, _cache_timestamp
-    _cache_valid = False
-    _cache_timestamp = 0
+def refresh_test_in_cache(db: Session, test_id: str):
+    """Apply a single test's change to the cached catalog without a full reload
+    
+    Only that test's rows in the embedding matrix and its lexical patterns are
+    replaced (or dropped, if the test no longer exists or has no embeddings).
+    With a shared snapshot, a new snapshot version is published instead so
+    every worker sees the same catalog.
+    """
+    global _catalog, _catalog_version
+
+    if EMBEDDING_SNAPSHOT_PATH:
+        invalidate_cache()
+        return
+
+    test = TestRepository.get_test_with_embeddings(db, test_id)
+    # Cascade vectors may need encoding: fetch them before taking the lock. If
+    # the fast index appears meanwhile, upsert_test drops it and it is rebuilt.
+    fast_test = None
+    current = _catalog
+    if test is not None and current is not None and current.fast_index is not None:
+        fast_test = PhraseRepository.get_tests_with_vectors(db, [test], fast_model, CASCADE_MODEL)[0][0]
+    with _catalog_lock:
+        # A reload running right now read the database before this change: make it reload again
+        _catalog_version += 1
+        # Nothing cached yet: the next request loads the current state anyway
+        if _catalog is None or not _cache_valid:
+            return
+        if test is None:
+            _catalog = _catalog.delete_test(test_id)
+        else:
+            _catalog = _catalog.upsert_test(test, fast_test)
+
+# Background bulk embedding generation; reload the catalog once a job has written its results
+embedding_jobs = EmbeddingJobManager(
+    model,
+    MODEL_NAME,
+    encode_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "128")),
+    on_complete=lambda job: _on_embedding_job_complete()
+)
+
+def _on_embedding_job_complete():
+    invalidate_cache()
+    _purge_llm_cache()
+
+def _purge_llm_cache():
+    """Drop expired LLM decisions so the table does not grow without bound"""
+    try:
+        deleted = llm_cache.purge_expired()
+        if deleted:
+            print(f"Purged {deleted} expired LLM decisions")
+    except Exception as e:
+        print(f"Failed to purge LLM decisions: {e}")
 
 def warm_cache():
     """Preload cache on startup"""
     try:
+        start = time.perf_counter()
         get_tests_with_embeddings()
+        _startup["cache_warm_ms"] = round((time.perf_counter() - start) * 1000, 1)
         print("Cache warmed up successfully")
     except Exception as e:
         print(f"Failed to warm cache: {e}")
+    _purge_llm_cache()
 
 
 class StreamRequest(BaseModel):
     transcript: str
     threshold: float = 0.75  # Default threshold 0.75 (75%)
+    stream: Optional[str] = None  # "sse" or "ndjson": stream per-chunk events, then the summary
+    timings: bool = False  # Add per-stage timings (ms) to the response
 
 
 class TestCreate(BaseModel):
@@ -113,10 +469,15 @@ class TestUpdate(BaseModel):
 
 
 @app.post("/generate_embeddings")
-def generate_embeddings(test_id: Optional[str] = Query(None), db: Session = Depends(get_db)):
+def generate_embeddings(test_id: Optional[str] = Query(None), regenerate_all: bool = Query(False),
+                        db: Session = Depends(get_db)):
     """Generate embeddings for all tests or a specific test.
     
     Query parameter: test_id (optional) - if provided, only generate for that test
+    Query parameter: regenerate_all (optional) - bulk mode re-encodes every test,
+        not only tests without embeddings
+    
+    Bulk generation is queued as a background job and returns its job_id.
     """
     if test_id:
         # Generate embeddings for a specific test only
@@ -124,138 +485,504 @@ def generate_embeddings(test_id: Optional[str] = Query(None), db: Session = Depe
         if not test:
             raise HTTPException(status_code=404, detail=f"Test with ID '{test_id}' not found")
         
-        embeddings = []
-        # Include the actual test name first
-        name_emb = model.encode(test.name)
-        embeddings.append(name_emb.tolist())
-        # Then include all synonyms
-        for phrase in test.synonyms or []:
-            emb = model.encode(phrase)
-            embeddings.append(emb.tolist())
-        
-        TestRepository.update_test_embeddings(db, test_id, embeddings)
-        invalidate_cache()
-        return {"status": "ok", "message": f"Embeddings generated for test '{test.name}'", "test_id": test_id}
+        # Name first, then synonyms; phrases that already have a stored vector are not re-encoded
+        _, encoded = TestRepository.regenerate_embeddings(db, test, model, MODEL_NAME)
+        refresh_test_in_cache(db, test_id)
+        return {"status": "ok", "message": f"Embeddings generated for test '{test.name}'", "test_id": test_id,
+                "phrases_encoded": encoded}
     else:
-        # Generate embeddings for all tests without embeddings
-        tests = TestRepository.get_all_tests(db)
-        updated = 0
-        
-        for test in tests:
-            if not test.embeddings or len(test.embeddings) == 0:
-                embeddings = []
-                # Include the actual test name first
-                name_emb = model.encode(test.name)
-                embeddings.append(name_emb.tolist())
-                # Then include all synonyms
-                for phrase in test.synonyms or []:
-                    emb = model.encode(phrase)
-                    embeddings.append(emb.tolist())
-                
-                TestRepository.update_test_embeddings(db, test.id, embeddings)
-                updated += 1
-        
-        invalidate_cache()
-        return {"status": "ok", "tests_count": len(tests), "updated": updated}
+        # Bulk generation runs as a background job; poll /generate_embeddings/jobs/{job_id}
+        job = embedding_jobs.submit(only_missing=not regenerate_all)
+        return {"status": "queued", "job_id": job.id, "job": job.to_dict()}
 
 
-@app.post("/match_stream")
-def match_stream(req: StreamRequest, db: Session = Depends(get_db)):
-    tests = get_tests_with_embeddings(db)
+@app.get("/generate_embeddings/jobs")
+def list_embedding_jobs():
+    """List recent embedding generation jobs"""
+    return {"jobs": [job.to_dict() for job in embedding_jobs.list()]}
+
+
+@app.get("/generate_embeddings/jobs/{job_id}")
+def get_embedding_job(job_id: str):
+    """Get progress/ETA of an embedding generation job"""
+    job = embedding_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job.to_dict()
+
+
+def _build_fast_index(catalog: Catalog):
+    """Attach the cascade model's index to a catalog (background thread, holds _fast_index_lock)"""
+    try:
+        start = time.perf_counter()
+        db = get_db_session()
+        try:
+            tests, encoded = PhraseRepository.get_tests_with_vectors(db, catalog.tests, fast_model, CASCADE_MODEL)
+        finally:
+            db.close()
+        catalog.fast_index = EmbeddingIndex.from_tests(tests)
+        _cascade_stats["index_builds"] += 1
+        _cascade_stats["last_build_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        print(f"Built {CASCADE_MODEL} cascade index over {len(tests)} tests "
+              f"({encoded} phrases encoded) in {_cascade_stats['last_build_ms']:.0f}ms")
+    except Exception as e:
+        print(f"Failed to build cascade index: {e}")
+    finally:
+        _fast_index_lock.release()
+
+def _cascade_index(catalog: Catalog) -> Optional[EmbeddingIndex]:
+    """The catalog's cascade index, or None while it is unavailable
+    
+    Never blocks a request: the small model and its index are prepared in
+    background threads, and chunks go straight to the main model meanwhile.
+    """
+    if not CASCADE_MODEL:
+        return None
+    if catalog.fast_index is not None:
+        return catalog.fast_index
+    if not fast_model.ready:
+        if fast_model.error is None:
+            fast_model.start()
+        return None
+    if _fast_index_lock.acquire(blocking=False):
+        threading.Thread(target=_build_fast_index, args=(catalog,), name="cascade-index", daemon=True).start()
+    return None
+
+
+def _load_catalog(db: Session):
+    """Get (tests, embedding index, lexical index, cascade index or None), or an error body if nothing is matchable"""
+    catalog = get_catalog(db)
+    tests, index, lexical_index = catalog.tests, catalog.index, catalog.lexical_index
     if not tests:
         # Check if any tests exist at all
         total_tests = TestRepository.get_all_tests(db)
         if not total_tests:
-            return {"error": "No tests found in database. Please run migration first."}
+            return None, {"error": "No tests found in database. Please run migration first."}
         else:
-            return {
+            return None, {
                 "error": f"No tests with embeddings found. Found {len(total_tests)} tests without embeddings. Please run /generate_embeddings first.",
                 "total_tests": len(total_tests),
                 "tests_with_embeddings": 0
             }
+    return (tests, index, lexical_index, _cascade_index(catalog)), None
 
-    transcript = req.transcript
-    chunks = split_into_chunks(transcript)
 
-    aggregated_matches = {}
-    removed_tests = set()
-    detailed = []
-
-    for chunk in chunks:
-        norm_chunk = normalize_text(chunk)
-
-        # Check for negation/cancellation
-        if any(word in norm_chunk for word in NEGATION_WORDS):
-            negated = extract_negated_tests(chunk, tests)
-            if negated:
-                for test_name in negated:
-                    removed_tests.add(test_name)
-                    aggregated_matches.pop(test_name, None)
-                detailed.append({"chunk": chunk, "method": "negation", "removed_tests": negated})
+def _embedding_stage(chunks: List[str], tests: List[dict], index: EmbeddingIndex,
+                     lexical_index: LexicalIndex, threshold: float,
+                     fast_index: Optional[EmbeddingIndex] = None, timings: Optional[dict] = None):
+    """Run lexical gates and batched embedding matching over all chunks
+    
+    With a cascade index, the small model decides clear-cut chunks and the
+    trace entry records the deciding tier ("fast" or "full"). Stage times
+    ("lexical_ms", "encode_ms", "scan_ms") are added to timings if given.
+    
+    Returns:
+        Tuple (detailed, fallbacks): per-chunk trace entries (None where the
+        LLM still has to decide) and a list of (chunk position, query embedding)
+        for those chunks
+    """
+    # Pass 1: lexical gates resolve negations and skips without embeddings
+    started = time.perf_counter()
+    detailed = [classify_chunk(chunk, tests, lexical_index) for chunk in chunks]
+    add_timing(timings, "lexical_ms", started)
+    pending = [i for i, entry in enumerate(detailed) if entry is None]
+    fallbacks = []
+
+    # Pass 2: encode all surviving chunks in one batch and score them together
+    if pending:
+        texts = [chunks[i] for i in pending]
+        if fast_index is not None:
+            batch_matches, query_embs, tiers = embedding_match_cascade(
+                texts, tests, query_encoder, fast_query_encoder, index, fast_index,
+                threshold=threshold, band=CASCADE_BAND, timings=timings
+            )
+            for tier in tiers:
+                _cascade_stats[tier] += 1
+        else:
+            batch_matches, query_embs = embedding_match_batch(
+                texts, tests, query_encoder, threshold=threshold, index=index, timings=timings
+            )
+            tiers = ["full"] * len(texts)
+        for j, i in enumerate(pending):
+            if batch_matches[j]:
+                detailed[i] = {"chunk": chunks[i], "method": "embedding", "matches": batch_matches[j]}
+                if CASCADE_MODEL:
+                    detailed[i]["tier"] = tiers[j]
             else:
-                detailed.append({"chunk": chunk, "method": "skipped", "reason": "negation_no_test"})
-            continue
+                fallbacks.append((i, query_embs[j]))
 
-        if any(word in norm_chunk for word in SYMPTOM_WORDS):
-            detailed.append({"chunk": chunk, "method": "skipped", "reason": "symptom_not_test"})
-            continue
+    return detailed, fallbacks
 
-        if not is_order_intent(chunk):
-            if not has_test_reference(chunk, tests):
-                detailed.append({"chunk": chunk, "method": "skipped", "reason": "no_intent"})
-                continue
-        else:
-            if not has_test_reference(chunk, tests):
-                detailed.append({"chunk": chunk, "method": "skipped", "reason": "action_without_test"})
-                continue
 
-        emb_matches = embedding_match(chunk, tests, model, threshold=req.threshold)
-        if emb_matches:
-            for m in emb_matches:
-                # Don't add tests that were previously removed
-                if m["name"] not in removed_tests:
-                    # Keep highest score if test detected multiple times
-                    if m["name"] not in aggregated_matches or m["score"] > aggregated_matches[m["name"]]["score"]:
-                        aggregated_matches[m["name"]] = {
-                            "method": "embedding",
-                            "score": m["score"]
-                        }
-            detailed.append({"chunk": chunk, "method": "embedding", "matches": emb_matches})
-            continue
-
-        llm_result = llm_fallback(chunk, tests, model, openai_client, top_k=5)
-        if llm_result["matches"] == ["Other"]:
-            detailed.append({"chunk": chunk, "method": "skipped", "reason": "no_clear_test"})
-            continue
-        for m in llm_result["matches"]:
-            # Don't add tests that were previously removed
-            if m not in removed_tests:
-                # Don't overwrite embedding matches with LLM matches
-                if m not in aggregated_matches:
-                    aggregated_matches[m] = {
-                        "method": "llm",
-                        "score": None
-                    }
-        detailed.append({"chunk": chunk, "method": "llm", "matches": llm_result["matches"]})
-
-    # Format detected tests with metadata
-    detected_tests_with_metadata = [
-        {
-            "name": test_name,
-            "method": metadata["method"],
-            "score": metadata["score"]
-        }
-        for test_name, metadata in sorted(aggregated_matches.items())
-    ]
+def _llm_trace_entry(chunk: str, llm_result: dict) -> dict:
+    """Turn an LLM fallback result into a trace entry"""
+    if llm_result["matches"] == ["Other"]:
+        return {"chunk": chunk, "method": "skipped", "reason": "no_clear_test"}
+    return {"chunk": chunk, "method": "llm", "matches": llm_result["matches"]}
+
+
+def _build_match_response(transcript: str, detailed: List[dict]) -> dict:
+    """Merge trace entries in transcript order and format the response body"""
+    # Merge in transcript order so negations keep their semantics
+    session = MatchSession()
+    session.apply(transcript, detailed)
+    return session.summary(transcript)
+
+
+async def _require_model():
+    """Wait (bounded) for the embedding model; 503 with Retry-After while it is still loading"""
+    if model.ready:
+        return
+    model.start()
+    if not await run_in_threadpool(model.wait, MODEL_READY_TIMEOUT):
+        detail = f"Embedding model failed to load: {model.error}" if model.error else "Embedding model is loading"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+
+
+def _count_chunk(entry: dict) -> dict:
+    """Count a resolved chunk by method and skip reason"""
+    CHUNKS_TOTAL.inc(method=entry["method"], reason=entry.get("reason", ""))
+    return entry
+
+
+async def _resolve_chunks(chunks: List[str], threshold: float, catalog: tuple, use_llm: bool = True,
+                          timings: Optional[dict] = None):
+    """Run the full matching pipeline over chunks
+    
+    Without use_llm, chunks the embedding stage leaves undecided are skipped
+    (reason "llm_disabled") instead of going to the LLM fallback. Stage times
+    (ms, see MATCH_STAGES) are added to timings if given; "llm_ms" is the
+    wall time of the whole concurrent fallback phase.
+    
+    Yields:
+        (chunk position, trace entry) as each chunk resolves: lexical and
+        embedding decisions right after the batched embedding stage, then
+        LLM fallbacks in completion order
+    """
+    tests, index, lexical_index, fast_index = catalog
+    timings = timings if timings is not None else {}
+
+    # Embedding stage for every chunk first (CPU-bound, kept off the event loop)
+    detailed, fallbacks = await run_in_threadpool(
+        _embedding_stage, chunks, tests, index, lexical_index, threshold, fast_index, timings
+    )
+    for i, entry in enumerate(detailed):
+        if entry is not None:
+            yield i, _count_chunk(entry)
+
+    if not use_llm:
+        for i, _ in fallbacks:
+            yield i, _count_chunk({"chunk": chunks[i], "method": "skipped", "reason": "llm_disabled"})
+        return
+
+    # Then all needed LLM fallbacks concurrently, capped by llm_semaphore
+    async def fallback(i, query_emb):
+        call_timings = {}
+        outcome = "error"
+        try:
+            llm_result = await llm_fallback_async(chunks[i], tests, query_encoder, async_openai_client, top_k=5,
+                                                  index=index, query_emb=query_emb, cache=llm_cache,
+                                                  semaphore=llm_semaphore, timings=call_timings)
+            outcome = "ok" if "llm_ms" in call_timings else "cached"
+        except Exception as e:
+            # One failed call only costs its own chunk, not the whole response
+            print(f"LLM fallback failed for chunk {i}: {type(e).__name__}: {e}")
+            return i, {"chunk": chunks[i], "method": "skipped", "reason": "llm_error"}
+        finally:
+            LLM_CALLS_TOTAL.inc(outcome=outcome)
+            if "llm_ms" in call_timings:
+                LLM_CALL_SECONDS.observe(call_timings["llm_ms"] / 1000)
+                LLM_QUEUE_SECONDS.observe(call_timings["llm_queue_ms"] / 1000)
+            timings["scan_ms"] = timings.get("scan_ms", 0.0) + call_timings.get("scan_ms", 0.0)
+        return i, _llm_trace_entry(chunks[i], llm_result)
+
+    if fallbacks:
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(fallback(i, query_emb)) for i, query_emb in fallbacks]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                i, entry = await next_done
+                yield i, _count_chunk(entry)
+        finally:
+            # The consumer went away (client disconnect) or failed: drop the calls still running
+            for task in tasks:
+                task.cancel()
+        add_timing(timings, "llm_ms", started)
+
+
+async def _match_chunks(chunks: List[str], threshold: float, db: Session, timings: Optional[dict] = None):
+    """Run the full matching pipeline over chunks
+    
+    Returns:
+        Tuple (detailed, error): per-chunk trace entries in chunk order, or
+        an error body if the catalog has nothing to match against
+    """
+    catalog, error = await run_in_threadpool(_load_catalog, db)
+    if error:
+        return None, error
+    detailed = [None] * len(chunks)
+    async for i, entry in _resolve_chunks(chunks, threshold, catalog, timings=timings):
+        detailed[i] = entry
+    return detailed, None
+
+
+def _split_chunks(transcript: str, timings: dict) -> List[str]:
+    """split_into_chunks, timed as the "chunking" stage"""
+    started = time.perf_counter()
+    chunks = split_into_chunks(transcript)
+    add_timing(timings, "chunking_ms", started)
+    return chunks
+
+
+def _observe_request(endpoint: str, timings: dict, started: float) -> dict:
+    """Record a finished request's stage and total latency; returns its timings block (ms)"""
+    total_ms = (time.perf_counter() - started) * 1000
+    REQUEST_SECONDS.observe(total_ms / 1000, endpoint=endpoint)
+    block = {}
+    for stage in MATCH_STAGES:
+        if f"{stage}_ms" in timings:
+            STAGE_SECONDS.observe(timings[f"{stage}_ms"] / 1000, stage=stage)
+            block[f"{stage}_ms"] = round(timings[f"{stage}_ms"], 2)
+    block["total_ms"] = round(total_ms, 2)
+    return block
+
 
+STREAM_MEDIA_TYPES = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+
+def _format_event(event: str, data: dict, stream_format: str) -> str:
+    """Serialize one stream event as an SSE message or an NDJSON line"""
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, "data": data}) + "\n"
+
+
+def _chunk_event(i: int, entry: dict) -> dict:
+    """Chunk event body: the trace entry plus the tests it detects or removes"""
     return {
-        "transcript": transcript,
-        "detected_tests": detected_tests_with_metadata,
-        "removed_tests": sorted(list(removed_tests)),
-        "trace": detailed
+        "index": i,
+        "entry": entry,
+        "detected": [m["name"] if isinstance(m, dict) else m for m in entry.get("matches", [])],
+        "removed": entry.get("removed_tests", [])
     }
 
 
+async def _match_event_stream(transcript: str, chunks: List[str], threshold: float, catalog: tuple,
+                              stream_format: str, timings: dict, started: float, include_timings: bool = False):
+    """Stream a "chunks" event, one "chunk" event per chunk as it resolves, then the "summary"
+    
+    Chunk events arrive in resolution order, so a slow LLM fallback does not
+    hold back fast matches. Negations only take full effect in transcript
+    order, which the summary (the regular /match_stream body) applies.
+    """
+    yield _format_event("chunks", {"transcript": transcript, "chunks": chunks}, stream_format)
+    detailed = [None] * len(chunks)
+    async for i, entry in _resolve_chunks(chunks, threshold, catalog, timings=timings):
+        detailed[i] = entry
+        yield _format_event("chunk", _chunk_event(i, entry), stream_format)
+    response = _build_match_response(transcript, detailed)
+    timings_block = _observe_request("match_stream", timings, started)
+    if include_timings:
+        response["timings"] = timings_block
+    yield _format_event("summary", response, stream_format)
+
+
+def _log_request(path: str, body: dict, ts: float):
+    """Append a request to MATCH_REQUEST_LOG as {"ts", "path", "body"} (blocking: run it off the event loop)"""
+    line = json.dumps({"ts": round(ts, 3), "path": path, "body": body}) + "\n"
+    try:
+        with _request_log_lock, open(MATCH_REQUEST_LOG, "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError as e:
+        logger.warning("Could not write request log %s: %s", MATCH_REQUEST_LOG, e)
+
+
+@app.post("/match_stream")
+async def match_stream(req: StreamRequest, request: Request, db: Session = Depends(get_db)):
+    stream_format = req.stream
+    if stream_format is None and "text/event-stream" in request.headers.get("accept", ""):
+        stream_format = "sse"
+    if stream_format is not None and stream_format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"stream must be one of: {', '.join(STREAM_MEDIA_TYPES)}")
+
+    started = time.perf_counter()
+    timings = {}
+    if MATCH_REQUEST_LOG:
+        await asyncio.to_thread(_log_request, "/match_stream", req.model_dump(), time.time())
+    await _require_model()
+    transcript = req.transcript
+    chunks = _split_chunks(transcript, timings)
+    if stream_format is None:
+        detailed, error = await _match_chunks(chunks, req.threshold, db, timings)
+        if error:
+            return error
+        response = _build_match_response(transcript, detailed)
+        timings_block = _observe_request("match_stream", timings, started)
+        if req.timings:
+            response["timings"] = timings_block
+        return response
+
+    # Load the catalog before streaming starts, so errors keep the plain JSON body
+    catalog, error = await run_in_threadpool(_load_catalog, db)
+    if error:
+        return error
+    return StreamingResponse(
+        _match_event_stream(transcript, chunks, req.threshold, catalog, stream_format, timings, started, req.timings),
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def match_transcripts(transcripts: List[str], threshold: float = 0.75, use_llm: bool = True) -> List[dict]:
+    """Match many transcripts against one catalog snapshot (/match_batch and match_batch.py)
+    
+    The chunks of all transcripts go through a single embedding stage, so
+    they are encoded and scored in large batches.
+    
+    Returns:
+        One /match_stream response body per transcript, in input order (the
+        error body for every transcript if nothing is matchable)
+    """
+    started = time.perf_counter()
+    timings = {}
+    db = get_db_session()
+    try:
+        catalog, error = await run_in_threadpool(_load_catalog, db)
+    finally:
+        db.close()
+    if error:
+        return [dict(error) for _ in transcripts]
+
+    chunk_lists = [_split_chunks(transcript, timings) for transcript in transcripts]
+    chunks = [chunk for transcript_chunks in chunk_lists for chunk in transcript_chunks]
+    detailed = [None] * len(chunks)
+    async for i, entry in _resolve_chunks(chunks, threshold, catalog, use_llm, timings):
+        detailed[i] = entry
+    _observe_request("match_batch", timings, started)
+
+    results, start = [], 0
+    for transcript, transcript_chunks in zip(transcripts, chunk_lists):
+        results.append(_build_match_response(transcript, detailed[start:start + len(transcript_chunks)]))
+        start += len(transcript_chunks)
+    return results
+
+
+@app.post("/match_batch")
+async def match_batch(request: Request, threshold: float = Query(0.75), llm: bool = Query(True)):
+    """Match many transcripts: JSONL in, JSONL out
+    
+    Each input line is {"id": ..., "transcript": ...} (or a bare JSON string).
+    Each output line is {"id": ..., **match_stream body}, or {"id", "error"}
+    for an unreadable line, in input order. Transcripts are matched in
+    slices of MATCH_BATCH_SIZE; throughput is returned in the
+    X-Transcripts-Per-Second header.
+    """
+    lines = [line for line in (await request.body()).decode("utf-8").splitlines() if line.strip()]
+    if len(lines) > MATCH_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {MATCH_BATCH_MAX} transcripts per request")
+    await _require_model()
+
+    started = time.perf_counter()
+    outputs = [None] * len(lines)
+    items = []
+    for line_no, line in enumerate(lines, 1):
+        try:
+            items.append((line_no - 1, *parse_batch_line(line, line_no)))
+        except ValueError as e:
+            outputs[line_no - 1] = {"id": line_no, "error": str(e)}
+    for start in range(0, len(items), MATCH_BATCH_SIZE):
+        batch = items[start:start + MATCH_BATCH_SIZE]
+        results = await match_transcripts([transcript for _, _, transcript in batch], threshold, llm)
+        for (position, item_id, _), result in zip(batch, results):
+            outputs[position] = dict({"id": item_id}, **result)
+
+    elapsed = time.perf_counter() - started
+    throughput = len(items) / elapsed if elapsed > 0 else 0.0
+    print(f"Batch matched {len(items)} transcripts in {elapsed:.2f}s ({throughput:.1f} transcripts/s)")
+    return Response(
+        "".join(json.dumps(output) + "\n" for output in outputs),
+        media_type="application/x-ndjson",
+        headers={"X-Transcripts": str(len(items)), "X-Elapsed-Ms": f"{elapsed * 1000:.1f}",
+                 "X-Transcripts-Per-Second": f"{throughput:.2f}"}
+    )
+
+
+async def _session_fragment(session: MatchSession, text: str) -> dict:
+    """Match only a newly arrived fragment and return the session delta"""
+    started = time.perf_counter()
+    timings = {}
+    await _require_model()
+    db = get_db_session()
+    try:
+        detailed, error = await _match_chunks(_split_chunks(text, timings), session.threshold, db, timings)
+    finally:
+        db.close()
+    if error:
+        return dict(error, type="error")
+    delta = session.apply(text, detailed)
+    _observe_request("ws_session", timings, started)
+    return delta
+
+
+@app.websocket("/ws/session")
+async def match_session(websocket: WebSocket):
+    """Streaming transcript session: match each new fragment once and push deltas
+    
+    Client messages (JSON):
+        {"type": "text", "text": "...", "threshold": 0.75}  threshold optional, kept for later fragments
+        {"type": "summary"}                                 full result in the /match_stream format
+        {"type": "reset"}                                   start a new transcript
+    
+    Server events: "session" on connect, "delta" per fragment (new trace
+    entries, tests added/updated/removed), "summary", "reset" and "error".
+    """
+    await websocket.accept()
+    session = MatchSession()
+    _session_stats["active"] += 1
+    _session_stats["total"] += 1
+    session_id = _session_stats["total"]
+    try:
+        await websocket.send_json({"type": "session", "session_id": session_id})
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            try:
+                message = parse_session_message(frame.get("text") if frame.get("text") is not None
+                                                else frame.get("bytes"))
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "status": 400, "detail": str(e)})
+                continue
+            kind = message["type"]
+            if kind == "text":
+                if message["threshold"] is not None:
+                    session.threshold = message["threshold"]
+                text = message["text"]
+                if not text:
+                    continue
+                try:
+                    event = await _session_fragment(session, text)
+                except HTTPException as e:
+                    event = {"type": "error", "status": e.status_code, "detail": e.detail}
+                _session_stats["fragments"] += 1
+                await websocket.send_json(dict(event, fragment=text))
+            elif kind == "summary":
+                await websocket.send_json(dict(session.summary(), type="summary"))
+            elif kind == "reset":
+                session.reset()
+                await websocket.send_json({"type": "reset", "session_id": session_id})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _session_stats["active"] -= 1
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics of this worker (text exposition format)"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 @app.get("/")
 def root():
     return FileResponse("static/index.html")
@@ -267,6 +994,35 @@ def get_tests(db: Session = Depends(get_db)):
     simplified_tests = TestRepository.get_tests_metadata_only(db)
     return simplified_tests
 
+@app.get("/api/ready")
+def api_ready():
+    """Readiness probe: 200 once the embedding model is loaded, 503 before"""
+    body = {"ready": model.ready, "model": model.stats()}
+    return body if model.ready else JSONResponse(status_code=503, content=body)
+
+def _startup_stats() -> dict:
+    """Startup-time breakdown in ms, relative to the start of the app import"""
+    model_stats = dict(model.stats(), **_model_timings)
+    model_stats["ready_after_ms"] = (round((model.ready_at - _IMPORT_STARTED) * 1000, 1)
+                                     if model.ready_at is not None else None)
+    return dict(_startup, model=model_stats)
+
+def _cascade_status() -> Optional[dict]:
+    """Cascade model readiness and how many chunks each tier decided"""
+    if not CASCADE_MODEL:
+        return None
+    fast_index = _catalog.fast_index if _catalog is not None else None
+    decided = _cascade_stats["fast"] + _cascade_stats["full"]
+    return dict(
+        _cascade_stats,
+        model=CASCADE_MODEL,
+        band=list(CASCADE_BAND),
+        model_ready=fast_model.ready,
+        index_tests=len(fast_index) if fast_index is not None else 0,
+        fast_ratio=round(_cascade_stats["fast"] / decided, 3) if decided else 0.0,
+        query_cache=fast_query_encoder.stats()
+    )
+
 @app.get("/api/status")  
 def api_status(db: Session = Depends(get_db)):
     # Use optimized count queries instead of loading all data
@@ -276,17 +1032,37 @@ def api_status(db: Session = Depends(get_db)):
     # Check cache status
     cache_status = {
         "valid": _cache_valid,
-        "size": len(_tests_cache) if _tests_cache else 0,
-        "age_seconds": int(time.time() - _cache_timestamp) if _cache_timestamp > 0 else 0
+        "size": len(_catalog) if _catalog else 0,
+        "index_rows": _catalog.index.total_rows if _catalog is not None else 0,
+        "index_unique_rows": int(_catalog.index.matrix.shape[0]) if _catalog is not None else 0,
+        "lexical_patterns": _catalog.lexical_index.pattern_count if _catalog is not None else 0,
+        "ann": _catalog.index.ann.stats() if _catalog is not None and _catalog.index.ann is not None else None,
+        "quantization": _catalog.index.quantized.stats()
+            if _catalog is not None and _catalog.index.quantized is not None else None,
+        "matrix_bytes": int(_catalog.index.matrix.nbytes) if _catalog is not None else 0,
+        "matrix_mapped": isinstance(_catalog.index.matrix, np.memmap) if _catalog is not None else False,
+        "age_seconds": int(time.time() - _cache_timestamp) if _cache_timestamp > 0 else 0,
+        "snapshot_path": EMBEDDING_SNAPSHOT_PATH,
+        "snapshot_version": _snapshot_version,
+        "reload": dict(_reload_stats)
     }
     
     return {
         "status": "running",
         "model": MODEL_NAME,
+        "encoder_backend": ENCODER_BACKEND,
+        "model_ready": model.ready,
+        "startup": _startup_stats(),
         "tests_total": total_count,
         "tests_with_embeddings": embeddings_count,
         "database_ready": embeddings_count > 0,
+        "embedding_storage": EMBEDDING_STORAGE,
+        "phrase_store": PhraseRepository.get_stats(db),
         "cache_status": cache_status,
+        "query_cache": query_encoder.stats(),
+        "cascade": _cascade_status(),
+        "llm_cache": llm_cache.stats(),
+        "sessions": dict(_session_stats),
         "performance_mode": "optimized"
     }
 
@@ -314,17 +1090,12 @@ def regenerate_embeddings_for_test(db: Session, test_id: str):
     if not test:
         return False
     
-    embeddings = []
-    # Include the actual test name first
-    name_emb = model.encode(test.name)
-    embeddings.append(name_emb.tolist())
-    # Then include all synonyms
-    for phrase in test.synonyms or []:
-        emb = model.encode(phrase)
-        embeddings.append(emb.tolist())
+    # Name first, then synonyms; only phrases without a stored vector are encoded
+    phrases, encoded = TestRepository.regenerate_embeddings(db, test, model, MODEL_NAME)
+    print(f"Regenerated embeddings for '{test.name}': {encoded}/{phrases} phrases encoded")
     
-    TestRepository.update_test_embeddings(db, test_id, embeddings)
-    invalidate_cache()
+    refresh_test_in_cache(db, test_id)
+    llm_cache.invalidate_tests([test.name])
     return True
 
 
@@ -378,18 +1149,23 @@ def update_test(test_id: str, test_data: TestUpdate, db: Session = Depends(get_d
     if test_data.synonyms is not None:
         update_data["synonyms"] = test_data.synonyms
 
+    # Remember the current name so cached LLM decisions listing it can be dropped
+    existing = TestRepository.get_test_by_id(db, test_id)
+    old_name = existing.name if existing else None
+
     # Update test
     updated_test = TestRepository.update_test(db, test_id, update_data)
     if not updated_test:
         raise HTTPException(status_code=404, detail=f"Test with ID '{test_id}' not found")
 
+    llm_cache.invalidate_tests([old_name, updated_test.name])
+
     # Smart cache invalidation - only invalidate if name or synonyms changed
     should_invalidate_cache = (test_data.name is not None or test_data.synonyms is not None)
     
     # Regenerate embeddings only if name or synonyms changed (embeddings depend on these)
     if should_invalidate_cache:
-        regenerate_embeddings_for_test(db, test_id)
-        invalidate_cache()  # Only invalidate cache when embeddings change
+        regenerate_embeddings_for_test(db, test_id)  # Also updates the cached catalog
     
     return {
         "status": "success",
@@ -413,7 +1189,8 @@ def delete_test(test_id: str, db: Session = Depends(get_db)):
     if not success:
         raise HTTPException(status_code=500, detail="Failed to delete test")
     
-    invalidate_cache()
+    refresh_test_in_cache(db, test_id)
+    llm_cache.invalidate_tests([test_dict["name"]])
 
     return {
         "status": "success",
@@ -476,3 +1253,6 @@ def remove_synonym(test_id: str, synonym: str, db: Session = Depends(get_db)):
         "message": f"Synonym '{synonym}' removed successfully",
         "test": updated_test.to_dict()
     }
+
+
+_startup["app_import_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
@@ -0,0 +1 @@
+"""Benchmark scripts; run from the repository root, e.g. `python -m benchmarks.ann_benchmark`"""
@@ -0,0 +1,120 @@
+"""
+ANN vs. exact scan benchmark.
+
+Builds the embedding index over tests.json (optionally scaled up to simulate
+a merged multi-hospital catalog), then measures per-query scoring latency and
+recall of each ANN backend/knob setting against the exact scan:
+
+    recall@5        - share of the exact top-5 tests also in the ANN top-5
+    match_recall    - share of exact matches at the 0.75 threshold also returned by ANN
+
+Usage:
+    python -m benchmarks.ann_benchmark [--tests tests.json] [--scale 20] [--queries 500]
+        [--nprobe 1,2,4,8,16,32] [--ef 16,32,64,128] [--candidates 100] [--json out.json]
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+
+from ann_index import build_ann_backend, hnswlib, faiss
+from embedding_index import EmbeddingIndex
+from benchmarks.common import (
+    load_tests, catalog_with_embeddings, scale_catalog, sample_queries, encode_cached, percentiles, print_table
+)
+
+THRESHOLD = 0.75
+TOP_K = 5
+
+
+def _measure(index: EmbeddingIndex, query_embs: np.ndarray):
+    """Per-query latency samples (ms) and the (num_queries, num_tests) scores"""
+    samples = []
+    scores = []
+    for query in query_embs:
+        start = time.perf_counter()
+        scores.append(index.score(query))
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples, np.stack(scores)
+
+
+def _recall(exact: np.ndarray, approx: np.ndarray, index: EmbeddingIndex):
+    """Top-k and threshold-match recall of approx scores against exact scores"""
+    topk_hits = 0
+    match_total = 0
+    match_hits = 0
+    for e, a in zip(exact, approx):
+        topk_hits += len(set(index.topk(None, TOP_K, e)) & set(index.topk(None, TOP_K, a)))
+        expected = set(np.nonzero(e >= THRESHOLD)[0])
+        match_total += len(expected)
+        match_hits += len(expected & set(np.nonzero(a >= THRESHOLD)[0]))
+    return (round(topk_hits / (TOP_K * len(exact)), 4),
+            round(match_hits / match_total, 4) if match_total else 1.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tests", default="tests.json")
+    parser.add_argument("--scale", type=int, default=1, help="Replicate the catalog N times (perturbed copies)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--candidates", type=int, default=100, help="Rows retrieved per query before re-rank")
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32")
+    parser.add_argument("--ef", default="16,32,64,128")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results as JSON")
+    args = parser.parse_args()
+
+    tests = scale_catalog(catalog_with_embeddings(load_tests(args.tests)), args.scale)
+    exact_index = EmbeddingIndex.from_tests(tests)
+    query_embs = encode_cached(sample_queries(tests, args.queries))
+    print(f"Catalog: {len(exact_index)} tests, {exact_index.total_rows} rows, "
+          f"{exact_index.matrix.shape[0]} unique phrase rows; {len(query_embs)} queries\n")
+
+    samples, exact_scores = _measure(exact_index, query_embs)
+    results = [dict(backend="exact", knob="-", build_ms=0.0, recall_at_5=1.0, match_recall=1.0,
+                    **percentiles(samples))]
+
+    configs = [("ivf", {"nlist": args.nlist, "nprobe": int(n)}) for n in args.nprobe.split(",")]
+    if hnswlib is not None:
+        configs += [("hnsw", {"ef": int(ef)}) for ef in args.ef.split(",")]
+    if faiss is not None:
+        configs += [("faiss", {"nlist": args.nlist, "nprobe": int(n)}) for n in args.nprobe.split(",")]
+
+    built = {}
+    for name, params in configs:
+        # Build-time knobs are shared across query-time settings; rebuild only when they change
+        build_key = (name, params.get("nlist"))
+        start = time.perf_counter()
+        if build_key not in built:
+            built[build_key] = build_ann_backend(name, exact_index.matrix, **params)
+        ann = built[build_key]
+        build_ms = round((time.perf_counter() - start) * 1000, 1)
+        if "nprobe" in params:
+            ann.nprobe = params["nprobe"]
+        if "ef" in params:
+            ann.ef = params["ef"]
+
+        index = EmbeddingIndex(exact_index.matrix, exact_index.offsets, exact_index.ids, exact_index.names,
+                               exact_index.rows, exact_index.phrase_keys)
+        index.attach_ann(ann, candidates=args.candidates)
+        samples, approx_scores = _measure(index, query_embs)
+        recall_at_5, match_recall = _recall(exact_scores, approx_scores, exact_index)
+        knob = ", ".join(f"{k}={v}" for k, v in ann.stats().items() if k not in ("backend", "rows"))
+        results.append(dict(backend=name, knob=knob, build_ms=build_ms, recall_at_5=recall_at_5,
+                            match_recall=match_recall, **percentiles(samples)))
+
+    print_table(results, [("backend", "backend"), ("knob", "knobs"), ("build_ms", "build ms"),
+                          ("p50_ms", "p50 ms"), ("p95_ms", "p95 ms"), ("p99_ms", "p99 ms"),
+                          ("recall_at_5", "recall@5"), ("match_recall", f"match recall@{THRESHOLD}")])
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"tests": len(exact_index), "rows": exact_index.total_rows,
+                       "unique_rows": int(exact_index.matrix.shape[0]), "queries": len(query_embs),
+                       "candidates": args.candidates, "results": results}, f, indent=2)
+        print(f"\nWrote {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
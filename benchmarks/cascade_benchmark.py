@@ -0,0 +1,113 @@
+"""
+Encoder cascade calibration benchmark.
+
+Scores dictation-like chunks with the small cascade model and the main model,
+then replays the cascade rule (see utils.embedding_match_cascade) for a grid
+of uncertainty bands, reporting for each (low, high):
+
+    fast_share      - chunks decided by the small model alone
+    agreement       - chunks whose match set equals the main model's
+    fast_agreement  - agreement among the fast-decided chunks only
+    chunk_ms        - estimated mean encode time per chunk (small model for
+                      every chunk, plus the main model for escalated ones)
+
+Pick the band with the highest fast_share at an agreement you accept and
+set CASCADE_BAND=low,high.
+
+Usage:
+    python -m benchmarks.cascade_benchmark [--fast-model all-MiniLM-L6-v2] [--queries 500]
+        [--low 0.4,0.5,0.6] [--high 0.75,0.8,0.85,0.9] [--backend torch] [--json out.json]
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+
+from embedding_index import EmbeddingIndex
+from encoders import load_encoder
+from benchmarks.common import (
+    MODEL_NAME, load_tests, catalog_with_embeddings, sample_queries, encode_cached, print_table
+)
+
+
+def _match_sets(scores: np.ndarray, threshold: float):
+    return [frozenset(np.nonzero(row >= threshold)[0]) for row in scores]
+
+
+def _chunk_latency_ms(model, texts) -> float:
+    """Median single-chunk encode time"""
+    model.encode(texts[0])
+    samples = []
+    for text in texts:
+        start = time.perf_counter()
+        model.encode(text)
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tests", default="tests.json")
+    parser.add_argument("--model", default=MODEL_NAME, help="Main model")
+    parser.add_argument("--fast-model", default="all-MiniLM-L6-v2", help="Small cascade model")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--threshold", type=float, default=0.75, help="Main model match threshold")
+    parser.add_argument("--low", default="0.4,0.5,0.6")
+    parser.add_argument("--high", default="0.75,0.8,0.85,0.9")
+    parser.add_argument("--backend", default="torch", help="Encoder backend for the latency measurement")
+    parser.add_argument("--latency-samples", type=int, default=50)
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results as JSON")
+    args = parser.parse_args()
+
+    tests = load_tests(args.tests)
+    queries = sample_queries(tests, args.queries)
+    # Both indexes list tests in the same order, so positions are comparable
+    full_index = EmbeddingIndex.from_tests(catalog_with_embeddings(tests, args.model))
+    fast_index = EmbeddingIndex.from_tests(catalog_with_embeddings(tests, args.fast_model))
+    full_scores = full_index.score_many(encode_cached(queries, args.model))
+    fast_scores = fast_index.score_many(encode_cached(queries, args.fast_model))
+    expected = _match_sets(full_scores, args.threshold)
+
+    sample = queries[:args.latency_samples]
+    full_ms = _chunk_latency_ms(load_encoder(args.model, args.backend), sample)
+    fast_ms = _chunk_latency_ms(load_encoder(args.fast_model, args.backend), sample)
+    print(f"Catalog: {len(full_index)} tests; {len(queries)} chunks; threshold {args.threshold}")
+    print(f"Single-chunk encode p50 ({args.backend}): {args.model} {full_ms:.1f}ms, "
+          f"{args.fast_model} {fast_ms:.1f}ms\n")
+
+    results = [dict(low="-", high="-", fast_share=0.0, agreement=1.0, fast_agreement="-",
+                    chunk_ms=round(full_ms, 2), saved="-")]
+    for low in (float(x) for x in args.low.split(",")):
+        for high in (float(x) for x in args.high.split(",")):
+            if low >= high:
+                continue
+            decided = (np.any(fast_scores >= high, axis=1)
+                       & ~np.any((fast_scores >= low) & (fast_scores < high), axis=1))
+            fast_sets = _match_sets(fast_scores, high)
+            agree = np.array([fast_sets[i] == expected[i] if decided[i] else True for i in range(len(queries))])
+            share = float(decided.mean())
+            chunk_ms = fast_ms + (1 - share) * full_ms
+            results.append(dict(
+                low=low, high=high,
+                fast_share=round(share, 3),
+                agreement=round(float(agree.mean()), 4),
+                fast_agreement=round(float(agree[decided].mean()), 4) if decided.any() else "-",
+                chunk_ms=round(chunk_ms, 2),
+                saved=f"{(1 - chunk_ms / full_ms) * 100:.0f}%",
+            ))
+
+    print_table(results, [("low", "low"), ("high", "high"), ("fast_share", "fast share"),
+                          ("agreement", "agreement"), ("fast_agreement", "fast agreement"),
+                          ("chunk_ms", "chunk ms"), ("saved", "saved")])
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"tests": len(full_index), "queries": len(queries), "threshold": args.threshold,
+                       "model": args.model, "fast_model": args.fast_model, "full_ms": full_ms,
+                       "fast_ms": fast_ms, "results": results}, f, indent=2)
+        print(f"\nWrote {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
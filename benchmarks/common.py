@@ -0,0 +1,269 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Catalog vectors are encoded once with the real embedding model and cached in
+an .npz file next to the benchmark output, so repeated runs (different knobs)
+skip the encoder.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import resource
+import sys
+import numpy as np
+from types import SimpleNamespace
+from typing import List, Dict, Any, Tuple
+
+from benchmarks.llm_stub import stub_answer
+
+MODEL_NAME = "all-mpnet-base-v2"
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+# Chunk templates modelled on dictated orders ("check CBC", "do an X-ray chest")
+QUERY_TEMPLATES = [
+    "{}",
+    "check {}",
+    "please do {}",
+    "order {} for this patient",
+    "get a {} done",
+    "we need {} today",
+]
+
+
+def load_tests(path: str = "tests.json") -> List[Dict[str, Any]]:
+    """Load a tests.json-style catalog, dropping duplicate ids (first one wins)"""
+    with open(path, "r", encoding="utf-8") as f:
+        return unique_tests(json.load(f))
+
+
+def unique_tests(tests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """tests.json-style entries without duplicate ids (first one wins)"""
+    seen = set()
+    unique = []
+    for test in tests:
+        test_id = test.get("id") or test["name"]
+        if test_id in seen:
+            continue
+        seen.add(test_id)
+        unique.append({"id": test_id, "name": test["name"], "category": test.get("category"),
+                       "synonyms": test.get("synonyms", [])})
+    return unique
+
+
+def load_catalog_source(path: str) -> List[Dict[str, Any]]:
+    """
+    Load tests.json, or a raw data/consolidated.json export.
+
+    Consolidated entries (investigationCode/investigationName) are converted
+    the way convert_tests.py does it, synonyms included.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    if items and "investigationName" in items[0]:
+        from convert_tests import create_id, generate_synonyms
+        items = [
+            {
+                "id": create_id(item.get("investigationCode") or item.get("investigationName", "")),
+                "name": item.get("investigationName", ""),
+                "category": item.get("category", ""),
+                "synonyms": generate_synonyms(item.get("investigationName", ""), item.get("investigationCode", ""),
+                                              item.get("departmentName", ""), item.get("category", "")),
+            }
+            for item in items
+        ]
+    return unique_tests(items)
+
+
+def encode_cached(texts: List[str], model_name: str = MODEL_NAME, batch_size: int = 128) -> np.ndarray:
+    """
+    Encode texts with the sentence-transformers model, caching the result on disk.
+
+    Returns:
+        float32 array (len(texts), dim)
+    """
+    digest = hashlib.sha1(json.dumps([model_name, texts]).encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(CACHE_DIR, f"{model_name.replace('/', '_')}-{digest}.npz")
+    if os.path.exists(path):
+        return np.load(path)["vectors"]
+
+    from sentence_transformers import SentenceTransformer
+    print(f"Encoding {len(texts)} texts with {model_name} (cached in {path})...")
+    vectors = np.asarray(SentenceTransformer(model_name).encode(texts, batch_size=batch_size), dtype=np.float32)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    np.savez(path, vectors=vectors)
+    return vectors
+
+
+def catalog_with_embeddings(tests: List[Dict[str, Any]], model_name: str = MODEL_NAME) -> List[Dict[str, Any]]:
+    """
+    Attach embeddings and phrase ids to tests, one vector per distinct phrase.
+
+    Same row layout as the application: name first, then synonyms.
+    """
+    from utils import normalize_phrase
+
+    phrase_ids: Dict[str, int] = {}
+    for test in tests:
+        for phrase in [test["name"]] + test["synonyms"]:
+            phrase_ids.setdefault(normalize_phrase(phrase), len(phrase_ids))
+    vectors = encode_cached(list(phrase_ids), model_name)
+
+    result = []
+    for test in tests:
+        ids = [phrase_ids[normalize_phrase(p)] for p in [test["name"]] + test["synonyms"]]
+        result.append(dict(test, embeddings=vectors[ids], phrase_ids=ids))
+    return result
+
+
+def scale_catalog(tests: List[Dict[str, Any]], factor: int, noise: float = 0.05,
+                  seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Simulate a merged multi-hospital catalog `factor` times larger.
+
+    Copy c > 0 of every test gets its vectors perturbed with Gaussian noise
+    (relative scale `noise`), its own phrase ids and an id/name suffix.
+    """
+    if factor <= 1:
+        return tests
+    rng = np.random.default_rng(seed)
+    max_phrase = 1 + max(pid for t in tests for pid in t["phrase_ids"])
+    dim = len(tests[0]["embeddings"][0])
+    result = list(tests)
+    for copy in range(1, factor):
+        offset = copy * max_phrase
+        # One perturbation per phrase, so shared phrases stay shared within a copy
+        perturbation = rng.normal(scale=noise / np.sqrt(dim), size=(max_phrase, dim)).astype(np.float32)
+        for test in tests:
+            ids = np.asarray(test["phrase_ids"])
+            embeddings = np.asarray(test["embeddings"], dtype=np.float32)
+            embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True) + perturbation[ids]
+            result.append(dict(test, id=f"{test['id']}#{copy}", name=f"{test['name']} #{copy}",
+                               embeddings=embeddings, phrase_ids=[int(i) + offset for i in ids]))
+    result.sort(key=lambda t: (t["name"], t["id"]))
+    return result
+
+
+def sample_queries(tests: List[Dict[str, Any]], count: int, seed: int = 0) -> List[str]:
+    """Dictation-like chunks built from random names/synonyms of the catalog"""
+    rnd = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        test = rnd.choice(tests)
+        phrase = rnd.choice([test["name"]] + test["synonyms"])
+        queries.append(rnd.choice(QUERY_TEMPLATES).format(phrase))
+    return queries
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean of latency samples in milliseconds"""
+    if not samples_ms:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    values = np.asarray(samples_ms)
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+
+def print_table(rows: List[Dict[str, Any]], columns: List[Tuple[str, str]]):
+    """Print result dicts as an aligned text table ((key, header) columns)"""
+    widths = [max(len(header), *(len(str(row.get(key, ""))) for row in rows)) for key, header in columns]
+    print("  ".join(header.ljust(w) for (_, header), w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row.get(key, "")).ljust(w) for (key, _), w in zip(columns, widths)))
+
+
+# Sentence templates of the synthetic dictation corpus. {a}/{b}/{c} are test
+# names or synonyms; vague orders name no test and so go to the LLM fallback.
+ORDER_SENTENCES = [
+    "Please check {a} and {b}.",
+    "Order {a} for this patient.",
+    "Let's do {a}, {b} and {c}.",
+    "Send {a} today.",
+    "Get a {a} done before the next visit.",
+    "Also add {a}.",
+]
+NEGATION_SENTENCES = [
+    "Don't do {a}.",
+    "No need for {a}, it was already done last week.",
+    "Skip {a} for now.",
+]
+SYMPTOM_SENTENCES = [
+    "Patient complains of chest pain since two days.",
+    "Mild dizziness and fatigue in the mornings.",
+    "Some swelling in both legs.",
+]
+FILLER_SENTENCES = [
+    "Continue the same medicines.",
+    "Review after one week with reports.",
+    "Blood pressure is one forty over ninety.",
+]
+VAGUE_ORDER_SENTENCES = [
+    "Check the usual sugar tests.",
+    "Order the kidney panel we discussed.",
+    "Do the thyroid workup.",
+    "Send the fever profile.",
+]
+
+
+def dictation_corpus(tests: List[Dict[str, Any]], count: int, seed: int = 0) -> List[str]:
+    """
+    Synthetic consultation transcripts built from catalog names and synonyms.
+
+    Each transcript has 2-6 sentences: orders (one to three tests), negations,
+    symptom descriptions, filler and vague orders in roughly the mix of a
+    dictated note, so every pipeline stage (gates, exact, embedding, LLM) is hit.
+    """
+    rnd = random.Random(seed)
+    kinds = [(ORDER_SENTENCES, 5), (NEGATION_SENTENCES, 1), (SYMPTOM_SENTENCES, 1),
+             (FILLER_SENTENCES, 1), (VAGUE_ORDER_SENTENCES, 1)]
+    templates = [t for t, _ in kinds]
+    weights = [w for _, w in kinds]
+
+    def phrase():
+        test = rnd.choice(tests)
+        return rnd.choice([test["name"]] + test["synonyms"])
+
+    corpus = []
+    for _ in range(count):
+        sentences = [
+            rnd.choice(rnd.choices(templates, weights)[0]).format(a=phrase(), b=phrase(), c=phrase())
+            for _ in range(rnd.randint(2, 6))
+        ]
+        corpus.append(" ".join(sentences))
+    return corpus
+
+
+class FakeAsyncOpenAI:
+    """
+    Stand-in for openai.AsyncOpenAI in benchmarks: no network, fixed latency.
+
+    chat.completions.create sleeps `latency_ms` (plus up to `jitter_ms`) and
+    answers the fallback prompt with its first candidate test. For a real
+    HTTP endpoint with error injection see benchmarks.llm_stub.
+    """
+
+    def __init__(self, latency_ms: float = 300.0, jitter_ms: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.calls = 0
+        self._random = random.Random(seed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model: str, messages: List[Dict[str, str]], **kwargs):
+        self.calls += 1
+        await asyncio.sleep((self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000)
+        content = json.dumps({"matches": stub_answer(messages[-1]["content"])})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    return round(peak / 2**20 if sys.platform == "darwin" else peak / 2**10, 1)
@@ -0,0 +1,132 @@
+"""
+Local OpenAI-compatible stub for the LLM fallback, for offline load tests.
+
+Serves POST /v1/chat/completions with configurable latency, error rate and
+answers, so /match_stream's fallback path and LLM_MAX_CONCURRENCY can be
+exercised without the real API. Point the app at it with OPENAI_BASE_URL:
+
+    python -m benchmarks.llm_stub --port 8001 --latency-ms 300 --jitter-ms 100 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub OPENAI_MAX_RETRIES=0 uvicorn app:app
+
+Answers: the first rule of --answers whose pattern matches the doctor's text
+wins; otherwise --default decides ("first" candidate test, or "other").
+Rules file format: [{"pattern": "sugar", "matches": ["RBS", "FBS"]}, ...]
+(patterns are case-insensitive regular expressions).
+
+GET /stats reports calls, errors and the peak number of concurrent calls
+(which should not exceed the app's LLM_MAX_CONCURRENCY per worker).
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+_DOCTOR_TEXT = re.compile(r'Doctor said: "(.*)"')
+_CANDIDATES = re.compile(r"Candidate tests: (.*)")
+
+
+def stub_answer(prompt: str, rules: Optional[List[Dict[str, Any]]] = None, default: str = "first") -> List[str]:
+    """
+    Answer a fallback prompt (see utils.build_llm_prompt) without a model.
+
+    Args:
+        prompt: The user message of the chat completion request
+        rules: Canned answers, [{"pattern": regex, "matches": [...]}], tried in order
+        default: "first" (first candidate test) or "other" when no rule matches
+
+    Returns:
+        The "matches" list to answer with
+    """
+    text = _DOCTOR_TEXT.search(prompt)
+    text = text.group(1) if text else prompt
+    for rule in rules or []:
+        if re.search(rule["pattern"], text, re.IGNORECASE):
+            return list(rule["matches"])
+    candidates = _CANDIDATES.search(prompt)
+    if default == "first" and candidates and candidates.group(1):
+        return [candidates.group(1).split(", ")[0]]
+    return ["Other"]
+
+
+def create_app(latency_ms: float = 300.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+               error_status: int = 500, malformed_rate: float = 0.0,
+               rules: Optional[List[Dict[str, Any]]] = None, default: str = "first", seed: Optional[int] = None):
+    """Build the stub FastAPI app"""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI(title="LLM stub")
+    rnd = random.Random(seed)
+    stats = {"calls": 0, "errors": 0, "malformed": 0, "in_flight": 0, "max_in_flight": 0}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["calls"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep((latency_ms + rnd.uniform(0, jitter_ms)) / 1000)
+        finally:
+            stats["in_flight"] -= 1
+
+        if rnd.random() < error_rate:
+            stats["errors"] += 1
+            return JSONResponse(status_code=error_status, content={
+                "error": {"message": "Injected stub error", "type": "server_error", "code": None}
+            })
+        if rnd.random() < malformed_rate:
+            stats["malformed"] += 1
+            content = "Sorry, I cannot answer in JSON."
+        else:
+            prompt = body["messages"][-1]["content"] if body.get("messages") else ""
+            content = json.dumps({"matches": stub_answer(prompt, rules, default)})
+
+        return {
+            "id": f"chatcmpl-stub-{stats['calls']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    @app.get("/stats")
+    def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Base latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Extra uniform random latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with an error")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of injected errors (e.g. 429)")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of answers that are not JSON")
+    parser.add_argument("--answers", default=None, help="JSON file with canned answer rules")
+    parser.add_argument("--default", choices=["first", "other"], default="first")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    rules = None
+    if args.answers:
+        with open(args.answers, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+
+    import uvicorn
+    uvicorn.run(create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status,
+                           args.malformed_rate, rules, args.default, args.seed),
+                host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
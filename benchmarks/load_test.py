@@ -0,0 +1,244 @@
+"""
+Open-loop load test of a running server, replaying recorded requests.
+
+Sends requests from JSONL logs at a target rate and reports latency
+percentiles, error rates and the achieved throughput. Log lines can be:
+
+    {"ts": ..., "path": "/match_stream", "body": {...}}   (the app's MATCH_REQUEST_LOG)
+    {"transcript": "...", "threshold": 0.75}              (a /match_stream body)
+    "plain transcript text"
+
+Other lines are skipped and counted. With --synthetic N, transcripts come from
+the synthetic dictation corpus (benchmarks.common) instead of a log.
+
+Requests are scheduled at fixed times (--qps, constant or Poisson arrivals)
+regardless of how fast responses come back, so a slow server shows up as
+growing latency instead of a silently lower send rate. Latency is measured
+from the scheduled send time (queueing in the generator included); "service"
+latency from the actual send. Without --qps, logs with timestamps are
+replayed with their recorded spacing divided by --speed.
+
+For offline runs, start the LLM stub and point the app at it:
+
+    python -m benchmarks.llm_stub --port 8001 --latency-ms 300 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub OPENAI_MAX_RETRIES=0 uvicorn app:app --port 8000
+    python -m benchmarks.load_test requests.log.jsonl --qps 20 --duration 60 \\
+        --stub-url http://127.0.0.1:8001 [--json load.json]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.common import percentiles, print_table
+
+DEFAULT_PATH = "/match_stream"
+
+
+def parse_log_line(line: str) -> Optional[Tuple[Optional[float], str, Dict[str, Any]]]:
+    """
+    Read one log line as (recorded timestamp or None, path, JSON body).
+
+    Returns:
+        None for lines that are not a replayable request
+    """
+    try:
+        item = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(item, str):
+        return (None, DEFAULT_PATH, {"transcript": item}) if item.strip() else None
+    if not isinstance(item, dict):
+        return None
+    if isinstance(item.get("body"), dict):
+        return item.get("ts"), item.get("path") or DEFAULT_PATH, item["body"]
+    if isinstance(item.get("transcript"), str):
+        return None, DEFAULT_PATH, item
+    return None
+
+
+def load_requests(paths: List[str]) -> Tuple[List[Tuple[Optional[float], str, Dict[str, Any]]], int]:
+    """Replayable requests of the given logs, in order, and the number of skipped lines"""
+    requests, skipped = [], 0
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                parsed = parse_log_line(line)
+                if parsed is None:
+                    skipped += 1
+                else:
+                    requests.append(parsed)
+    return requests, skipped
+
+
+def schedule(requests, count: int, qps: Optional[float], arrival: str, speed: float, seed: int) -> List[float]:
+    """Send offsets (seconds from the start) of the first count requests, cycling through the log"""
+    if qps:
+        if arrival == "poisson":
+            rnd = random.Random(seed)
+            offsets, t = [], 0.0
+            for _ in range(count):
+                offsets.append(t)
+                t += rnd.expovariate(qps)
+            return offsets
+        return [i / qps for i in range(count)]
+
+    stamps = [ts for ts, _, _ in requests]
+    if any(ts is None for ts in stamps):
+        raise SystemExit("The log has lines without timestamps: pass --qps")
+    span = stamps[-1] - stamps[0]
+    # Cycles follow each other after one average gap
+    gap = span / (len(stamps) - 1) if len(stamps) > 1 else 1.0
+    return [((i // len(stamps)) * (span + gap) + stamps[i % len(stamps)] - stamps[0]) / speed
+            for i in range(count)]
+
+
+async def run_load(base_url: str, requests, offsets: List[float], concurrency: int, timeout: float):
+    """Send requests[i % len] at offsets[i]; returns one result dict per request"""
+    import httpx
+
+    results = []
+    slots = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+
+        async def send(i: int, offset: float):
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            _, path, body = requests[i % len(requests)]
+            async with slots:
+                sent = time.perf_counter()
+                result = {"offset": offset, "lag_ms": (sent - started - offset) * 1000}
+                try:
+                    response = await client.post(path, json=body)
+                    result["status"] = response.status_code
+                    # Error bodies from the matching endpoints are 200s with an "error" field
+                    data = response.json() if "application/json" in response.headers.get("content-type", "") else {}
+                    if response.status_code == 200 and isinstance(data, dict) and "error" in data:
+                        result["error"] = "error_body"
+                    elif response.status_code != 200:
+                        result["error"] = f"http_{response.status_code}"
+                    elif isinstance(data, dict):
+                        result["methods"] = [entry.get("method") for entry in data.get("trace", [])]
+                except (httpx.HTTPError, ValueError) as e:
+                    result["error"] = type(e).__name__
+                done = time.perf_counter()
+            result["latency_ms"] = (done - started - offset) * 1000
+            result["service_ms"] = (done - sent) * 1000
+            results.append(result)
+
+        await asyncio.gather(*(send(i, offset) for i, offset in enumerate(offsets)))
+        elapsed = time.perf_counter() - started
+    return results, elapsed
+
+
+def summarize(results: List[Dict[str, Any]], elapsed: float, target_qps: Optional[float]) -> Dict[str, Any]:
+    """Latency percentiles, error counts and throughput of a run"""
+    errors = Counter(r["error"] for r in results if "error" in r)
+    ok = [r for r in results if "error" not in r]
+    methods = Counter(m for r in ok for m in r.get("methods", []))
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": dict(errors),
+        "error_rate": round(sum(errors.values()) / len(results), 4) if results else 0.0,
+        "target_qps": target_qps,
+        "achieved_qps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "elapsed_s": round(elapsed, 2),
+        "latency": dict(percentiles([r["latency_ms"] for r in ok]),
+                        max_ms=round(max((r["latency_ms"] for r in ok), default=0.0), 3)),
+        "service": dict(percentiles([r["service_ms"] for r in ok]),
+                        max_ms=round(max((r["service_ms"] for r in ok), default=0.0), 3)),
+        "max_send_lag_ms": round(max((r["lag_ms"] for r in results), default=0.0), 3),
+        "chunk_methods": dict(methods),
+    }
+
+
+def stub_stats(stub_url: str) -> Optional[Dict[str, Any]]:
+    """GET /stats of the LLM stub, or None if it cannot be reached"""
+    import httpx
+
+    try:
+        return httpx.get(stub_url.rstrip("/") + "/stats", timeout=5).json()
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"Could not read stub stats: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="*", help="JSONL request logs to replay")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the running app")
+    parser.add_argument("--synthetic", type=int, default=0, help="Replay N synthetic transcripts instead of a log")
+    parser.add_argument("--tests", default="tests.json", help="Catalog for --synthetic")
+    parser.add_argument("--qps", type=float, default=None, help="Target request rate (default: recorded timing)")
+    parser.add_argument("--arrival", choices=["constant", "poisson"], default="constant")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up of recorded timing")
+    parser.add_argument("--duration", type=float, default=None, help="Seconds of load at --qps")
+    parser.add_argument("--requests", type=int, default=None, help="Requests to send (default: one pass)")
+    parser.add_argument("--concurrency", type=int, default=256, help="Cap on requests in flight")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stub-url", default=None, help="LLM stub base URL, to report its call stats")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write the summary as JSON")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from benchmarks.common import load_catalog_source, dictation_corpus
+        corpus = dictation_corpus(load_catalog_source(args.tests), args.synthetic, seed=args.seed)
+        requests, skipped = [(None, DEFAULT_PATH, {"transcript": t}) for t in corpus], 0
+    elif args.logs:
+        requests, skipped = load_requests(args.logs)
+    else:
+        parser.error("pass request logs or --synthetic N")
+    if not requests:
+        raise SystemExit(f"No replayable requests ({skipped} lines skipped)")
+
+    if args.requests:
+        count = args.requests
+    elif args.duration and args.qps:
+        count = max(1, int(args.duration * args.qps))
+    else:
+        count = len(requests)
+    offsets = schedule(requests, count, args.qps, args.arrival, args.speed, args.seed)
+    rate = f"{args.qps} qps ({args.arrival})" if args.qps else f"recorded timing x{args.speed}"
+    print(f"Replaying {count} requests ({len(requests)} in the log, {skipped} lines skipped) "
+          f"at {rate} against {args.url}")
+
+    stats_before = stub_stats(args.stub_url) if args.stub_url else None
+    results, elapsed = asyncio.run(run_load(args.url, requests, offsets, args.concurrency, args.timeout))
+    summary = summarize(results, elapsed, args.qps)
+
+    print_table([dict(name=name, **summary[name]) for name in ("latency", "service")],
+                [("name", "latency"), ("p50_ms", "p50 ms"), ("p95_ms", "p95 ms"), ("p99_ms", "p99 ms"),
+                 ("mean_ms", "mean ms"), ("max_ms", "max ms")])
+    print(f"\n{summary['ok']}/{summary['requests']} ok, error rate {summary['error_rate']:.2%} {summary['errors']}; "
+          f"achieved {summary['achieved_qps']} qps over {summary['elapsed_s']}s; "
+          f"max send lag {summary['max_send_lag_ms']:.1f} ms")
+    print(f"Chunk methods: {summary['chunk_methods']}")
+    if args.stub_url:
+        stats_after = stub_stats(args.stub_url)
+        if stats_before and stats_after:
+            summary["llm_stub"] = {
+                "calls": stats_after["calls"] - stats_before["calls"],
+                "errors": stats_after["errors"] - stats_before["errors"],
+                "max_in_flight": stats_after["max_in_flight"],
+            }
+            print(f"LLM stub: {summary['llm_stub']}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nWrote {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
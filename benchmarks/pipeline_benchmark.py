@@ -0,0 +1,231 @@
+"""
+Reproducible latency benchmark of the matching pipeline.
+
+Builds the catalog from tests.json (or a raw data/consolidated.json export)
+into a temporary SQLite database, generates a synthetic dictation corpus from
+its names and synonyms, and reports p50/p95/p99/mean per call of:
+
+    split_into_chunks        - per transcript
+    has_test_reference       - per chunk, with the lexical index (the app's path)
+    has_test_reference_scan  - per chunk, linear scan over every name and synonym
+    embedding_match          - per chunk reaching the embedding stage (encode + scan, no query cache)
+    match_stream_cold        - full POST /match_stream per transcript, empty caches
+    match_stream_warm        - the same transcripts again (query embedding and LLM decision caches warm)
+
+and the peak RSS after each phase. LLM fallbacks go to an in-process OpenAI
+stand-in with a fixed latency (--llm-latency-ms), so runs need no network or
+API key and stay comparable. Results are written as JSON; --compare prints
+the change against a previous run's JSON.
+
+Usage:
+    python -m benchmarks.pipeline_benchmark [--tests tests.json] [--transcripts 200]
+        [--llm-latency-ms 300] [--json pipeline.json] [--compare previous.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+from benchmarks.common import (
+    MODEL_NAME, load_catalog_source, catalog_with_embeddings, dictation_corpus, FakeAsyncOpenAI,
+    percentiles, peak_rss_mb, print_table
+)
+
+
+def _time_calls(fn, inputs, repeat: int = 1, warmup: int = 5):
+    """Per-call latencies (ms) of fn over inputs, after a few untimed warm-up calls"""
+    for item in inputs[:warmup]:
+        fn(item)
+    samples = []
+    for _ in range(repeat):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def build_database(tests, model_name: str) -> int:
+    """Insert tests and their phrase vectors (encoded once, cached on disk) into the configured database"""
+    from database import init_db, get_db_session, TestRepository, PhraseRepository
+    from utils import normalize_phrase, phrase_key
+
+    init_db()
+    catalog = catalog_with_embeddings(tests, model_name)
+    db = get_db_session()
+    try:
+        entries, keys_by_id = {}, {}
+        for test in catalog:
+            TestRepository.create_test(db, {"id": test["id"], "name": test["name"],
+                                            "category": test["category"], "synonyms": test["synonyms"]})
+            keys = []
+            for phrase, vector in zip([test["name"]] + test["synonyms"], test["embeddings"]):
+                key = phrase_key(phrase, model_name)
+                entries.setdefault(key, (key, normalize_phrase(phrase), model_name, vector))
+                keys.append(key)
+            keys_by_id[test["id"]] = keys
+        ids = PhraseRepository.add_phrases(db, list(entries.values()))
+        TestRepository.bulk_update_test_phrases(
+            db, {test_id: [ids[key] for key in keys] for test_id, keys in keys_by_id.items()}
+        )
+    finally:
+        db.close()
+    return len(entries)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(previous_path: str, results: dict):
+    """Print p50/p95/p99 changes against a previous JSON result"""
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)["results"]
+    rows = []
+    for name, current in results.items():
+        if name not in previous:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            old, new = previous[name][key], current[key]
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "-"
+            rows.append(dict(name=name, metric=key, old=old, new=new, change=change))
+    print(f"\nCompared with {previous_path}:")
+    print_table(rows, [("name", "benchmark"), ("metric", "metric"), ("old", "previous"),
+                       ("new", "current"), ("change", "change")])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tests", default="tests.json", help="tests.json or data/consolidated.json")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--transcripts", type=int, default=200, help="Synthetic transcripts in the corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the corpus for the sub-ms functions")
+    parser.add_argument("--threshold", type=float, default=0.75)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="OpenAI stand-in latency per call")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results as JSON")
+    parser.add_argument("--compare", default=None, help="Previous JSON result to compare with")
+    args = parser.parse_args()
+
+    # The app reads its configuration at import: point it at a throwaway database
+    work_dir = tempfile.mkdtemp(prefix="pipeline-benchmark-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'benchmark.db')}"
+    os.environ["EMBEDDING_MODEL"] = args.model
+    os.environ["MODEL_READY_TIMEOUT"] = "600"
+    os.environ.pop("EMBEDDING_SNAPSHOT_PATH", None)
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")  # Never used: the stand-in replaces the client
+
+    try:
+        tests = load_catalog_source(args.tests)
+        phrase_rows = build_database(tests, args.model)
+        rss = {"catalog_built": peak_rss_mb()}
+
+        import app as server
+        from fastapi.testclient import TestClient
+        from utils import split_into_chunks, has_test_reference, classify_chunk, embedding_match
+
+        llm = FakeAsyncOpenAI(latency_ms=args.llm_latency_ms, seed=args.seed)
+        server.async_openai_client = llm
+        load_started = time.perf_counter()
+        encoder = server.model.get()
+        model_load_ms = (time.perf_counter() - load_started) * 1000
+        rss["model_loaded"] = peak_rss_mb()
+
+        catalog = server.get_catalog()
+        corpus = dictation_corpus(catalog.tests, args.transcripts, seed=args.seed)
+        chunks = [chunk for transcript in corpus for chunk in split_into_chunks(transcript)]
+        embedding_chunks = [c for c in chunks if classify_chunk(c, catalog.tests, catalog.lexical_index) is None]
+        print(f"Catalog: {len(catalog)} tests, {phrase_rows} phrase rows; corpus: {len(corpus)} transcripts, "
+              f"{len(chunks)} chunks ({len(embedding_chunks)} reach the embedding stage)")
+
+        samples = {
+            "split_into_chunks": _time_calls(split_into_chunks, corpus, args.repeat),
+            "has_test_reference": _time_calls(
+                lambda c: has_test_reference(c, catalog.tests, catalog.lexical_index), chunks, args.repeat),
+            "has_test_reference_scan": _time_calls(
+                lambda c: has_test_reference(c, catalog.tests), chunks, args.repeat),
+            "embedding_match": _time_calls(
+                lambda c: embedding_match(c, catalog.tests, encoder, args.threshold, index=catalog.index),
+                embedding_chunks or chunks),
+        }
+        rss["functions"] = peak_rss_mb()
+
+        throughput = {}
+        methods = {}
+        errors = 0
+        with TestClient(server.app) as client:
+            for phase in ("match_stream_cold", "match_stream_warm"):
+                phase_samples = []
+                phase_started = time.perf_counter()
+                for transcript in corpus:
+                    start = time.perf_counter()
+                    response = client.post("/match_stream", json={"transcript": transcript,
+                                                                   "threshold": args.threshold})
+                    phase_samples.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 200 or "trace" not in response.json():
+                        errors += 1
+                        continue
+                    if phase == "match_stream_cold":
+                        for entry in response.json()["trace"]:
+                            methods[entry["method"]] = methods.get(entry["method"], 0) + 1
+                samples[phase] = phase_samples
+                throughput[phase] = round(len(corpus) / (time.perf_counter() - phase_started), 2)
+                rss[phase] = peak_rss_mb()
+
+        results = {name: dict(percentiles(values), samples=len(values)) for name, values in samples.items()}
+        for phase, per_second in throughput.items():
+            results[phase]["transcripts_per_s"] = per_second
+
+        print_table([dict(name=name, **values) for name, values in results.items()],
+                    [("name", "benchmark"), ("samples", "calls"), ("p50_ms", "p50 ms"), ("p95_ms", "p95 ms"),
+                     ("p99_ms", "p99 ms"), ("mean_ms", "mean ms"), ("transcripts_per_s", "transcripts/s")])
+        print(f"\nPeak RSS (MB): " + ", ".join(f"{phase} {mb}" for phase, mb in rss.items()))
+        print(f"Chunk methods: {methods}; LLM stand-in calls: {llm.calls}; failed requests: {errors}")
+
+        report = {
+            "meta": {
+                "commit": _git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "model": args.model,
+                "encoder_backend": server.ENCODER_BACKEND,
+                "model_load_ms": round(model_load_ms, 1),
+                "catalog_source": args.tests,
+                "tests": len(catalog),
+                "phrase_rows": phrase_rows,
+                "transcripts": len(corpus),
+                "chunks": len(chunks),
+                "embedding_chunks": len(embedding_chunks),
+                "seed": args.seed,
+                "threshold": args.threshold,
+                "llm_latency_ms": args.llm_latency_ms,
+                "llm_calls": llm.calls,
+                "chunk_methods": methods,
+                "failed_requests": errors,
+            },
+            "results": results,
+            "peak_rss_mb": rss,
+        }
+        if args.json_path:
+            with open(args.json_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"\nWrote {args.json_path}")
+        if args.compare:
+            compare(args.compare, results)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Quantized embedding matrix benchmark.
+
+Compares the float32 scan with float16 and per-row int8 quantized scans over
+tests.json (optionally scaled up), reporting for each representation:
+
+    matrix_mb       - resident size of the matrix used for scanning
+    max/mean dev    - deviation of the raw quantized scores from float32 (before re-scoring)
+    rescored        - tests re-scored in full precision per query (mean)
+    match_agree     - queries whose 0.75-threshold match set equals the float32 one
+    topk_agree      - queries whose top-5 equals the float32 one
+    p50/p95 ms      - per-query scoring latency
+
+Usage:
+    python -m benchmarks.quantization_benchmark [--tests tests.json] [--scale 20] [--queries 500]
+        [--threshold 0.75] [--json out.json]
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+
+from embedding_index import EmbeddingIndex, normalize_rows
+from benchmarks.common import (
+    load_tests, catalog_with_embeddings, scale_catalog, sample_queries, encode_cached, percentiles, print_table
+)
+
+TOP_K = 5
+# Scores closer than this to the threshold / k-th score count as ties, not disagreements
+TIE_TOLERANCE = 1e-5
+
+
+def _same_matches(exact: np.ndarray, approx: np.ndarray, threshold: float) -> bool:
+    differing = np.nonzero((exact >= threshold) != (approx >= threshold))[0]
+    return bool(np.all(np.abs(exact[differing] - threshold) <= TIE_TOLERANCE))
+
+
+def _same_topk(index: EmbeddingIndex, exact: np.ndarray, approx: np.ndarray) -> bool:
+    differing = set(index.topk(None, TOP_K, exact)) ^ set(index.topk(None, TOP_K, approx))
+    kth = np.sort(exact)[-min(TOP_K, len(exact))]
+    positions = [index.names.index(name) for name in differing]
+    return all(abs(exact[i] - kth) <= TIE_TOLERANCE for i in positions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tests", default="tests.json")
+    parser.add_argument("--scale", type=int, default=1, help="Replicate the catalog N times (perturbed copies)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--threshold", type=float, default=0.75)
+    parser.add_argument("--rescore-top", type=int, default=16)
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results as JSON")
+    args = parser.parse_args()
+
+    tests = scale_catalog(catalog_with_embeddings(load_tests(args.tests)), args.scale)
+    exact_index = EmbeddingIndex.from_tests(tests)
+    query_embs = encode_cached(sample_queries(tests, args.queries))
+    queries = normalize_rows(query_embs)
+    print(f"Catalog: {len(exact_index)} tests, {exact_index.matrix.shape[0]} unique phrase rows "
+          f"x {exact_index.dim} dims; {len(query_embs)} queries, threshold {args.threshold}\n")
+
+    exact_scores = []
+    samples = []
+    for query in query_embs:
+        start = time.perf_counter()
+        exact_scores.append(exact_index.score(query, args.threshold))
+        samples.append((time.perf_counter() - start) * 1000)
+    exact_scores = np.stack(exact_scores)
+    exact_rows = queries @ exact_index.matrix.T
+
+    full_mb = exact_index.matrix.nbytes / 2 ** 20
+    results = [dict(kind="float32", matrix_mb=round(full_mb, 2), saved="-", max_dev=0.0, mean_dev=0.0,
+                    rescored=0.0, match_agree=1.0, topk_agree=1.0, **percentiles(samples))]
+
+    for kind in ("float16", "int8"):
+        index = EmbeddingIndex.from_tests(tests).quantize(kind, rescore_top=args.rescore_top)
+        deviation = np.abs(index.quantized.dot(queries) - exact_rows)
+        bound = np.broadcast_to(index.quantized.error_bound(queries), deviation.shape)
+        assert np.all(deviation <= bound), "quantization error exceeded its bound"
+
+        scores = []
+        samples = []
+        for query in query_embs:
+            start = time.perf_counter()
+            scores.append(index.score(query, args.threshold))
+            samples.append((time.perf_counter() - start) * 1000)
+        scores = np.stack(scores)
+
+        # Tests re-scored in full precision: the rescore_top best upper bounds plus all reaching the threshold
+        upper_rows = index.quantized.dot(queries) + index.quantized.error_bound(queries)
+        if index.rows is not None:
+            upper_rows = upper_rows[:, index.rows]
+        upper = np.maximum.reduceat(upper_rows, index.offsets[:-1], axis=1)
+        top = min(args.rescore_top, len(index))
+        reaching = np.sum(upper >= args.threshold, axis=1)
+        kth_upper = -np.partition(-upper, top - 1, axis=1)[:, top - 1] if top else np.full(len(upper), np.inf)
+        rescored = float(np.mean(reaching + np.sum((upper >= kth_upper[:, None]) & (upper < args.threshold), axis=1)))
+
+        quantized_mb = index.quantized.nbytes / 2 ** 20
+        results.append(dict(
+            kind=kind,
+            matrix_mb=round(quantized_mb, 2),
+            saved=f"{(1 - quantized_mb / full_mb) * 100:.0f}%",
+            max_dev=round(float(deviation.max()), 5),
+            mean_dev=round(float(deviation.mean()), 6),
+            rescored=round(rescored, 1),
+            match_agree=round(np.mean([_same_matches(e, a, args.threshold)
+                                       for e, a in zip(exact_scores, scores)]), 4),
+            topk_agree=round(np.mean([_same_topk(index, e, a) for e, a in zip(exact_scores, scores)]), 4),
+            **percentiles(samples)
+        ))
+
+    print_table(results, [("kind", "kind"), ("matrix_mb", "matrix MB"), ("saved", "saved"),
+                          ("max_dev", "max dev"), ("mean_dev", "mean dev"), ("rescored", "rescored/query"),
+                          ("match_agree", "match agree"), ("topk_agree", "top-5 agree"),
+                          ("p50_ms", "p50 ms"), ("p95_ms", "p95 ms")])
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"tests": len(exact_index), "unique_rows": int(exact_index.matrix.shape[0]),
+                       "dim": exact_index.dim, "queries": len(query_embs), "threshold": args.threshold,
+                       "results": results}, f, indent=2)
+        print(f"\nWrote {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
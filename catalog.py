@@ -0,0 +1,109 @@
+"""
+In-memory test catalog used by the matching pipeline.
+
+Bundles the cached tests with the structures derived from them (embedding
+index, lexical index) so they are swapped together, and supports per-test
+upsert/delete so a CRUD edit only touches that test's rows and patterns
+instead of reloading the whole catalog from SQLite.
+"""
+
+import bisect
+from typing import List, Dict, Any, Optional
+
+from embedding_index import EmbeddingIndex
+from lexical_index import LexicalIndex
+
+
+def _metadata(test: Dict[str, Any]) -> Dict[str, Any]:
+    """Test dict without its vectors (they are kept in the EmbeddingIndex)"""
+    return {k: v for k, v in test.items() if k not in ("embeddings", "phrase_ids")}
+
+
+class Catalog:
+    """
+    Cached tests plus their embedding and lexical indexes.
+
+    A Catalog is treated as immutable by readers: upsert_test/delete_test
+    return a new Catalog with a new tests list and EmbeddingIndex, so a
+    request holding the previous one keeps a consistent view. The lexical
+    index is updated in place (it is internally locked) and shared.
+
+    The vectors live only in the embedding index; the cached test dicts drop
+    their 'embeddings' so the catalog does not hold every vector twice.
+
+    Attributes:
+        tests: Test dicts in name order ('id', 'name', 'category', 'synonyms')
+        index: EmbeddingIndex over tests
+        lexical_index: LexicalIndex over tests' names and synonyms
+        fast_index: Optional EmbeddingIndex over the same tests with the small
+            cascade model's vectors (attached after the build, see app.py)
+    """
+
+    def __init__(self, tests: List[Dict[str, Any]], index: EmbeddingIndex,
+                 lexical_index: Optional[LexicalIndex] = None, fast_index: Optional[EmbeddingIndex] = None):
+        self.tests = tests
+        self.index = index
+        self.lexical_index = lexical_index if lexical_index is not None else LexicalIndex.from_tests(tests)
+        self.fast_index = fast_index
+
+    @classmethod
+    def from_tests(cls, tests: List[Dict[str, Any]]) -> "Catalog":
+        """
+        Build a catalog from the output of TestRepository.get_tests_with_embeddings.
+
+        Args:
+            tests: Test dicts with embeddings, in name order
+
+        Returns:
+            Catalog with freshly built indexes
+        """
+        return cls([_metadata(t) for t in tests], EmbeddingIndex.from_tests(tests))
+
+    def __len__(self) -> int:
+        return len(self.tests)
+
+    def upsert_test(self, test: Dict[str, Any], fast_test: Optional[Dict[str, Any]] = None) -> "Catalog":
+        """
+        Replace (or add) one test, touching only its rows and patterns.
+
+        Args:
+            test: Test dict with 'id', 'name', 'synonyms', 'embeddings' and optional 'phrase_ids'
+            fast_test: The same test with the cascade model's 'embeddings' and
+                'phrase_ids'. Without it the new catalog has no fast_index (a
+                fast index missing this test could decide chunks wrongly)
+
+        Returns:
+            New Catalog reflecting the change
+        """
+        test_id = test["id"]
+        if test.get("embeddings") is None or len(test["embeddings"]) == 0:
+            # Tests without embeddings are not matchable, same as a full reload
+            return self.delete_test(test_id)
+
+        tests = [t for t in self.tests if t["id"] != test_id]
+        keys = [(t["name"], t["id"]) for t in tests]
+        tests.insert(bisect.bisect_left(keys, (test["name"], test_id)), _metadata(test))
+
+        index = self.index.upsert(test_id, test["name"], test["embeddings"], test.get("phrase_ids"))
+        fast_index = None
+        if self.fast_index is not None and fast_test is not None:
+            fast_index = self.fast_index.upsert(test_id, test["name"], fast_test["embeddings"],
+                                                fast_test.get("phrase_ids"))
+        self.lexical_index.add_test(test_id, test["name"], test.get("synonyms", []))
+        return Catalog(tests, index, self.lexical_index, fast_index)
+
+    def delete_test(self, test_id: str) -> "Catalog":
+        """
+        Drop one test from the catalog.
+
+        Args:
+            test_id: Test ID (unknown IDs are a no-op)
+
+        Returns:
+            New Catalog reflecting the change
+        """
+        tests = [t for t in self.tests if t["id"] != test_id]
+        index = self.index.remove(test_id)
+        fast_index = self.fast_index.remove(test_id) if self.fast_index is not None else None
+        self.lexical_index.remove_test(test_id)
+        return Catalog(tests, index, self.lexical_index, fast_index)
@@ -1,14 +1,53 @@
 """Database models and connection management for SQLite"""
-from sqlalchemy import create_engine, Column, String, Text, Integer, JSON, Float, Index
+from sqlalchemy import create_engine, Column, String, Text, Integer, JSON, Float, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import sessionmaker, Session, object_session
 from sqlalchemy.sql import text
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+import numpy as np
+import hashlib
 import json
+import os
 import time
 
+from utils import generate_test_embeddings, normalize_phrase, phrase_key
+
 Base = declarative_base()
 
+# Embedding storage mode for newly written vectors:
+#   "float32" - packed little-endian float32 BLOB in tests.embeddings_blob (default)
+#   "float16" - packed little-endian float16 BLOB (half the size, ~3 decimal digits)
+#   "phrases" - one float32 vector per distinct normalized phrase in the phrases
+#               table, referenced by tests.phrase_ids (shared across tests; opt-in)
+#   "json"    - legacy JSON array of floats in tests.embeddings
+# Rows in any format are always readable, whatever the current mode.
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "float32")
+
+# Phrases handed out by ensure_phrases within this many seconds are never pruned
+PHRASE_PRUNE_GRACE = int(os.getenv("PHRASE_PRUNE_GRACE", "3600"))
+
+_BLOB_DTYPES = {
+    "float32": np.dtype("<f4"),
+    "float16": np.dtype("<f2"),
+}
+
+
+def pack_embeddings(embeddings, dtype: str = "float32") -> Tuple[bytes, int, int]:
+    """Pack a (count, dim) list/array of vectors into a little-endian BLOB.
+
+    Returns:
+        Tuple of (blob bytes, vector count, vector dimension)
+    """
+    array = np.asarray(embeddings, dtype=_BLOB_DTYPES[dtype])
+    if array.ndim == 1:
+        array = array.reshape(1, -1)
+    return array.tobytes(), int(array.shape[0]), int(array.shape[1])
+
+
+def unpack_embeddings(blob: bytes, count: int, dim: int, dtype: str = "float32") -> np.ndarray:
+    """Turn a packed BLOB back into a (count, dim) array without per-float parsing"""
+    return np.frombuffer(blob, dtype=_BLOB_DTYPES[dtype or "float32"]).reshape(count, dim)
+
 
 class Test(Base):
     """Test model for storing medical tests"""
@@ -18,7 +57,13 @@ class Test(Base):
     name = Column(String, nullable=False, index=True)
     category = Column(String, nullable=False, index=True)
     synonyms = Column(JSON, default=list)  # Store as JSON array
-    embeddings = Column(JSON, default=list)  # Store embeddings as JSON array
+    embeddings = Column(JSON, default=list)  # Store embeddings as JSON array (legacy "json" storage)
+    embeddings_blob = Column(LargeBinary, nullable=True)  # Packed vectors (float32/float16 storage)
+    embeddings_dtype = Column(String, nullable=True)  # "float32" or "float16" when embeddings_blob is set
+    embeddings_dim = Column(Integer, default=0)  # Vector dimension of embeddings_blob
+    embeddings_count = Column(Integer, default=0)  # Number of vectors in embeddings_blob
+    embedding_hashes = Column(JSON, default=list)  # Per-row content hash of (model name, phrase), aligned with embeddings
+    phrase_ids = Column(JSON, default=list)  # Phrase.id per row (name first, then synonyms) with "phrases" storage
     embeddings_updated = Column(Integer, default=0)  # Timestamp to track when embeddings were last updated
     
     # Add indexes for better query performance
@@ -27,6 +72,69 @@ class Test(Base):
         Index('idx_category_name', 'category', 'name'),
     )
 
+    def get_embeddings(self) -> List[List[float]]:
+        """Get embeddings as a list of float lists, whichever format they are stored in"""
+        if isinstance(self.phrase_ids, list) and self.phrase_ids:
+            session = object_session(self)
+            if session is None:
+                return []
+            vectors = PhraseRepository.get_vectors(session, self.phrase_ids)
+            if all(pid in vectors for pid in self.phrase_ids):
+                return [vectors[pid].astype(np.float32).tolist() for pid in self.phrase_ids]
+            return []
+        if self.embeddings_blob is not None and (self.embeddings_count or 0) > 0:
+            return unpack_embeddings(
+                self.embeddings_blob, self.embeddings_count, self.embeddings_dim, self.embeddings_dtype
+            ).astype(np.float32).tolist()
+        return self.embeddings if isinstance(self.embeddings, list) else []
+
+    def set_embeddings(self, embeddings, storage: Optional[str] = None, hashes: Optional[List[str]] = None):
+        """Store embeddings using the given (or configured) storage mode
+        
+        Args:
+            embeddings: (count, dim) vectors, name first then synonyms
+            storage: Storage mode override (defaults to EMBEDDING_STORAGE)
+            hashes: Per-row phrase content hashes (see utils.phrase_hash); rows
+                without hashes are re-encoded on the next regeneration
+        
+        Vectors passed in directly are stored on the test itself; "phrases"
+        storage falls back to float32 here (see set_phrase_ids).
+        """
+        self.embedding_hashes = list(hashes) if hashes is not None else []
+        self.phrase_ids = []
+        self.embeddings_updated = int(time.time())
+        storage = storage or EMBEDDING_STORAGE
+        if storage == "phrases":
+            storage = "float32"
+        if storage == "json" or embeddings is None or len(embeddings) == 0:
+            self.embeddings = [list(map(float, e)) for e in embeddings] if embeddings is not None else []
+            self.embeddings_blob = None
+            self.embeddings_dtype = None
+            self.embeddings_dim = 0
+            self.embeddings_count = 0
+        else:
+            blob, count, dim = pack_embeddings(embeddings, storage)
+            self.embeddings = []
+            self.embeddings_blob = blob
+            self.embeddings_dtype = storage
+            self.embeddings_dim = dim
+            self.embeddings_count = count
+
+    def set_phrase_ids(self, phrase_ids: List[int]):
+        """Reference shared phrase vectors instead of storing the test's own copies
+        
+        Args:
+            phrase_ids: Phrase.id per row, name first then synonyms
+        """
+        self.phrase_ids = list(phrase_ids)
+        self.embeddings = []
+        self.embeddings_blob = None
+        self.embeddings_dtype = None
+        self.embeddings_dim = 0
+        self.embeddings_count = 0
+        self.embedding_hashes = []
+        self.embeddings_updated = int(time.time())
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert test to dictionary format"""
         return {
@@ -34,12 +142,38 @@ class Test(Base):
             "name": self.name,
             "category": self.category,
             "synonyms": self.synonyms if isinstance(self.synonyms, list) else [],
-            "embeddings": self.embeddings if isinstance(self.embeddings, list) else []
+            "embeddings": self.get_embeddings()
         }
 
 
-# Database setup
-DATABASE_URL = "sqlite:///./medical_tests.db"
+class Phrase(Base):
+    """Embedding of one distinct phrase (test name or synonym), shared by every test using it"""
+    __tablename__ = "phrases"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    key = Column(String, nullable=False, unique=True, index=True)  # utils.phrase_key: hash of model name + normalized text
+    text = Column(Text, nullable=False)  # Normalized phrase, as encoded
+    model_name = Column(String, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)  # Packed little-endian vector
+    dtype = Column(String, nullable=False, default="float32")
+    dim = Column(Integer, nullable=False)
+    used_at = Column(Integer, nullable=False, default=0)  # Last time ensure_phrases handed it out (prune grace)
+
+
+class LLMDecision(Base):
+    """Cached LLM fallback decision for a (chunk, candidates, prompt version) key"""
+    __tablename__ = "llm_decisions"
+
+    key = Column(String, primary_key=True)  # sha256 of prompt version, model, chunk and candidates
+    chunk = Column(Text, nullable=False)
+    candidates = Column(JSON, default=list)  # Candidate test names shown to the LLM
+    prompt_version = Column(String, nullable=False)
+    matches = Column(JSON, default=list)  # Parsed LLM answer
+    created_at = Column(Integer, nullable=False, index=True)
+
+
+# Database setup (DATABASE_URL overrides the default file, e.g. for benchmarks on a temporary copy)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./medical_tests.db")
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -47,6 +181,30 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 def init_db():
     """Initialize database and create tables"""
     Base.metadata.create_all(bind=engine)
+    _migrate_schema()
+
+
+def _migrate_schema():
+    """Add columns introduced after a table was first created"""
+    new_columns = {
+        "tests": {
+            "embeddings_blob": "BLOB",
+            "embeddings_dtype": "VARCHAR",
+            "embeddings_dim": "INTEGER DEFAULT 0",
+            "embeddings_count": "INTEGER DEFAULT 0",
+            "embedding_hashes": "JSON",
+            "phrase_ids": "JSON",
+        },
+        "phrases": {
+            "used_at": "INTEGER NOT NULL DEFAULT 0",
+        },
+    }
+    with engine.begin() as conn:
+        for table, columns in new_columns.items():
+            existing = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})")).fetchall()}
+            for column, ddl in columns.items():
+                if column not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
 
 
 def get_db() -> Session:
@@ -63,6 +221,19 @@ def get_db_session() -> Session:
     return SessionLocal()
 
 
+# SQL predicate matching rows that have embeddings in any storage format
+_HAS_EMBEDDINGS_SQL = """(
+    (phrase_ids IS NOT NULL AND json_array_length(phrase_ids) > 0)
+    OR (embeddings_blob IS NOT NULL AND embeddings_count > 0)
+    OR (embeddings IS NOT NULL AND json_array_length(embeddings) > 0)
+)"""
+
+
+# Columns needed to build a test dict for matching
+_MATCHING_COLUMNS = """id, name, category, synonyms, embeddings, phrase_ids,
+                   embeddings_blob, embeddings_dtype, embeddings_dim, embeddings_count"""
+
+
 # Database helper functions
 class TestRepository:
     """Repository pattern for test operations"""
@@ -80,7 +251,11 @@ class TestRepository:
     @staticmethod
     def create_test(db: Session, test_data: Dict[str, Any]) -> Test:
         """Create a new test"""
+        test_data = dict(test_data)
+        embeddings = test_data.pop("embeddings", [])
+        hashes = test_data.pop("embedding_hashes", None)
         test = Test(**test_data)
+        test.set_embeddings(embeddings, hashes=hashes)
         db.add(test)
         db.commit()
         db.refresh(test)
@@ -119,59 +294,237 @@ class TestRepository:
         return sorted([cat[0] for cat in categories if cat[0]])
     
     @staticmethod
-    def update_test_embeddings(db: Session, test_id: str, embeddings: List[List[float]]) -> bool:
-        """Update embeddings for a specific test"""
-        test = db.query(Test).filter(Test.id == test_id).first()
-        if not test:
-            return False
+    def regenerate_embeddings(db: Session, test: Test, model, model_name: str) -> Tuple[int, int]:
+        """Encode a test's name and synonyms and store them in the configured format
+        
+        Only phrases without a stored vector are encoded: with "phrases"
+        storage, phrases already in the shared store (from any test) are
+        reused; otherwise unchanged rows of the test itself are reused.
         
-        test.embeddings = embeddings
+        Returns:
+            Tuple (phrases, encoded): rows stored and phrases actually encoded
+        """
+        phrases = [test.name] + list(test.synonyms or [])
+        if EMBEDDING_STORAGE == "phrases":
+            phrase_ids, encoded = PhraseRepository.ensure_phrases(db, phrases, model, model_name)
+            test.set_phrase_ids(phrase_ids)
+        else:
+            embeddings, hashes, encoded = generate_test_embeddings(
+                test.name, test.synonyms or [], model, model_name, test.get_embeddings(), test.embedding_hashes
+            )
+            test.set_embeddings(embeddings, hashes=hashes)
         db.commit()
-        return True
+        return len(phrases), encoded
+    
+    @staticmethod
+    def bulk_update_test_phrases(db: Session, phrase_ids_by_id: Dict[str, List[int]]) -> int:
+        """Point many tests at shared phrase vectors in a single transaction
+        
+        Returns:
+            Number of tests updated
+        """
+        if not phrase_ids_by_id:
+            return 0
+        tests = db.query(Test).filter(Test.id.in_(list(phrase_ids_by_id.keys()))).all()
+        for test in tests:
+            test.set_phrase_ids(phrase_ids_by_id[test.id])
+        db.commit()
+        return len(tests)
+    
+    @staticmethod
+    def _matching_dict(row, phrase_vectors: Optional[Dict[int, np.ndarray]] = None) -> Optional[Dict[str, Any]]:
+        """Convert a raw tests row into the dict format used for matching
+        
+        Tests stored as phrase references get their rows from phrase_vectors
+        and keep 'phrase_ids', so the embedding index can share their rows.
+        """
+        # Parse JSON directly without SQLAlchemy object conversion
+        synonyms = json.loads(row.synonyms) if row.synonyms else []
+        phrase_ids = json.loads(row.phrase_ids) if row.phrase_ids else []
+        if phrase_ids:
+            if phrase_vectors is None or any(pid not in phrase_vectors for pid in phrase_ids):
+                return None
+            return {
+                "id": row.id,
+                "name": row.name,
+                "category": row.category,
+                "synonyms": synonyms,
+                "embeddings": [phrase_vectors[pid] for pid in phrase_ids],
+                "phrase_ids": phrase_ids
+            }
+        if row.embeddings_blob is not None and row.embeddings_count:
+            embeddings = unpack_embeddings(
+                row.embeddings_blob, row.embeddings_count, row.embeddings_dim, row.embeddings_dtype
+            )
+        else:
+            embeddings = json.loads(row.embeddings) if row.embeddings else []
+        
+        if embeddings is None or len(embeddings) == 0:
+            return None
+        return {
+            "id": row.id,
+            "name": row.name,
+            "category": row.category,
+            "synonyms": synonyms,
+            "embeddings": embeddings
+        }
+    
+    @staticmethod
+    def get_tests_for_embedding(db: Session, only_missing: bool = True) -> List[Dict[str, Any]]:
+        """Get id/name/synonyms of tests to (re)generate embeddings for
+        
+        Args:
+            only_missing: Only tests that have no embeddings yet
+        """
+        where = f"WHERE NOT {_HAS_EMBEDDINGS_SQL}" if only_missing else ""
+        query = text(f"""
+            SELECT id, name, synonyms
+            FROM tests
+            {where}
+            ORDER BY name
+        """)
+        return [
+            {"id": row.id, "name": row.name, "synonyms": json.loads(row.synonyms) if row.synonyms else []}
+            for row in db.execute(query).fetchall()
+        ]
+    
+    @staticmethod
+    def bulk_update_test_embeddings(db: Session, embeddings_by_id: Dict[str, Any],
+                                    hashes_by_id: Optional[Dict[str, List[str]]] = None) -> int:
+        """Update embeddings (and optional phrase hashes) of many tests in a single transaction
+        
+        Returns:
+            Number of tests updated
+        """
+        if not embeddings_by_id:
+            return 0
+        tests = db.query(Test).filter(Test.id.in_(list(embeddings_by_id.keys()))).all()
+        for test in tests:
+            test.set_embeddings(embeddings_by_id[test.id], hashes=(hashes_by_id or {}).get(test.id))
+        db.commit()
+        return len(tests)
     
     @staticmethod
     def get_tests_with_embeddings(db: Session) -> List[Dict[str, Any]]:
-        """Get all tests with embeddings for matching - OPTIMIZED"""
+        """Get all tests with embeddings for matching - OPTIMIZED
+        
+        BLOB-stored embeddings are returned as (count, dim) NumPy arrays decoded
+        with np.frombuffer; legacy JSON rows are returned as lists of floats.
+        Phrase-store tests get a list of their shared phrase vectors plus
+        'phrase_ids'.
+        """
         # Use raw SQL for better performance - only select what we need
-        query = text("""
-            SELECT id, name, category, synonyms, embeddings 
+        query = text(f"""
+            SELECT {_MATCHING_COLUMNS}
             FROM tests 
-            WHERE embeddings IS NOT NULL 
-            AND json_array_length(embeddings) > 0
+            WHERE {_HAS_EMBEDDINGS_SQL}
             ORDER BY name
         """)
         
         result = []
         rows = db.execute(query).fetchall()
+        phrase_vectors = PhraseRepository.get_vectors(db)
         
         for row in rows:
-            # Parse JSON directly without SQLAlchemy object conversion
-            synonyms = json.loads(row.synonyms) if row.synonyms else []
-            embeddings = json.loads(row.embeddings) if row.embeddings else []
-            
-            if embeddings and len(embeddings) > 0:
-                result.append({
-                    "id": row.id,
-                    "name": row.name,
-                    "category": row.category,
-                    "synonyms": synonyms,
-                    "embeddings": embeddings
-                })
+            test = TestRepository._matching_dict(row, phrase_vectors)
+            if test:
+                result.append(test)
         
         return result
     
+    @staticmethod
+    def get_test_with_embeddings(db: Session, test_id: str) -> Optional[Dict[str, Any]]:
+        """Get a single test in the same format as get_tests_with_embeddings
+        
+        Returns None if the test does not exist or has no embeddings.
+        """
+        query = text(f"""
+            SELECT {_MATCHING_COLUMNS}
+            FROM tests
+            WHERE id = :id
+        """)
+        row = db.execute(query, {"id": test_id}).fetchone()
+        if not row:
+            return None
+        phrase_ids = json.loads(row.phrase_ids) if row.phrase_ids else []
+        phrase_vectors = PhraseRepository.get_vectors(db, phrase_ids) if phrase_ids else None
+        return TestRepository._matching_dict(row, phrase_vectors)
+    
+    @staticmethod
+    def get_catalog_fingerprint(db: Session) -> int:
+        """64-bit hash of everything a catalog export depends on, without reading vectors
+        
+        Covers ids, names, categories, synonyms and each test's vector layout
+        and embeddings_updated stamp (phrase vectors are content-addressed, so
+        their ids stand in for them). Used to tell whether an exported snapshot
+        still matches the database.
+        """
+        query = text("""
+            SELECT id, name, category, synonyms, phrase_ids,
+                   embeddings_dtype, embeddings_dim, embeddings_count, embeddings_updated
+            FROM tests
+            ORDER BY id
+        """)
+        digest = hashlib.blake2b(digest_size=8)
+        for row in db.execute(query):
+            digest.update(json.dumps(list(row), default=str).encode("utf-8"))
+            digest.update(b"\n")
+        return int.from_bytes(digest.digest(), "little")
+    
     @staticmethod
     def get_tests_count_with_embeddings(db: Session) -> int:
         """Get count of tests with embeddings - fast count query"""
-        query = text("""
+        query = text(f"""
             SELECT COUNT(*) as count 
             FROM tests 
-            WHERE embeddings IS NOT NULL 
-            AND json_array_length(embeddings) > 0
+            WHERE {_HAS_EMBEDDINGS_SQL}
         """)
         result = db.execute(query).fetchone()
         return result.count if result else 0
     
+    @staticmethod
+    def migrate_embeddings_to_blob(db: Session, dtype: str = "float32", batch_size: int = 500) -> int:
+        """Convert JSON-stored embeddings into packed BLOBs in place
+        
+        Processes rows in batches (one transaction per batch) and clears the
+        JSON column of converted rows. Safe to re-run; already converted rows
+        are skipped.
+        
+        Returns:
+            Number of tests converted
+        """
+        select = text("""
+            SELECT id, embeddings
+            FROM tests
+            WHERE embeddings_blob IS NULL
+            AND embeddings IS NOT NULL
+            AND json_array_length(embeddings) > 0
+            LIMIT :limit
+        """)
+        update = text("""
+            UPDATE tests
+            SET embeddings_blob = :blob, embeddings_dtype = :dtype,
+                embeddings_dim = :dim, embeddings_count = :count,
+                embeddings = '[]'
+            WHERE id = :id
+        """)
+        
+        converted = 0
+        while True:
+            rows = db.execute(select, {"limit": batch_size}).fetchall()
+            if not rows:
+                break
+            params = []
+            for row in rows:
+                blob, count, dim = pack_embeddings(json.loads(row.embeddings), dtype)
+                params.append({"id": row.id, "blob": blob, "dtype": dtype, "dim": dim, "count": count})
+            db.execute(update, params)
+            db.commit()
+            converted += len(rows)
+            print(f"Converted {converted} tests to {dtype} BLOB storage...")
+        
+        return converted
+    
     @staticmethod 
     def get_tests_metadata_only(db: Session) -> List[Dict[str, Any]]:
         """Get tests metadata without embeddings for UI (much faster)"""
@@ -195,3 +548,299 @@ class TestRepository:
         
         return result
 
+
+class PhraseRepository:
+    """Repository for the shared phrase embedding store"""
+    
+    @staticmethod
+    def get_ids_by_key(db: Session, keys: List[str], batch_size: int = 500) -> Dict[str, int]:
+        """Get phrase ids for the given phrase keys (unknown keys are omitted)"""
+        keys = list(set(keys))
+        ids = {}
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            for row in db.query(Phrase.key, Phrase.id).filter(Phrase.key.in_(batch)).all():
+                ids[row.key] = row.id
+        return ids
+    
+    @staticmethod
+    def add_phrases(db: Session, entries: List[Tuple[str, str, str, Any]]) -> Dict[str, int]:
+        """Insert phrase vectors, ignoring keys that already exist
+        
+        Keys are content addresses, so a concurrent writer inserting the same
+        phrase is harmless. Commits immediately.
+        
+        Args:
+            entries: (key, normalized text, model name, vector) tuples
+        
+        Returns:
+            Phrase ids of all given keys
+        """
+        if not entries:
+            return {}
+        params = []
+        now = int(time.time())
+        for key, phrase, model_name, vector in entries:
+            blob, _, dim = pack_embeddings(vector, "float32")
+            params.append({"key": key, "text": phrase, "model_name": model_name,
+                           "embedding": blob, "dtype": "float32", "dim": dim, "used_at": now})
+        db.execute(text("""
+            INSERT OR IGNORE INTO phrases (key, text, model_name, embedding, dtype, dim, used_at)
+            VALUES (:key, :text, :model_name, :embedding, :dtype, :dim, :used_at)
+        """), params)
+        db.commit()
+        return PhraseRepository.get_ids_by_key(db, [entry[0] for entry in entries])
+    
+    @staticmethod
+    def ensure_phrases(db: Session, phrases: List[str], model, model_name: str,
+                       batch_size: Optional[int] = None) -> Tuple[List[int], int]:
+        """Get phrase ids for phrases, encoding only those not in the store yet
+        
+        Phrases are keyed on their normalized text, so "X-Ray" and "x-ray"
+        share one vector, and each new phrase is encoded once even if it
+        repeats in the input.
+        
+        Args:
+            phrases: Names/synonyms in row order
+            model: SentenceTransformer used for missing phrases
+            model_name: Model name, part of every phrase key
+            batch_size: Optional batch size for model.encode
+        
+        Returns:
+            Tuple (phrase_ids, encoded): ids aligned with phrases and the number
+            of phrases actually encoded
+        
+        Reused phrases get a fresh used_at, so delete_unreferenced spares them
+        until the caller has committed its references.
+        """
+        keys = [phrase_key(phrase, model_name) for phrase in phrases]
+        ids = PhraseRepository.get_ids_by_key(db, keys)
+        PhraseRepository.touch(db, list(ids.values()))
+        
+        missing = {}
+        for phrase, key in zip(phrases, keys):
+            if key not in ids and key not in missing:
+                missing[key] = normalize_phrase(phrase)
+        
+        if missing:
+            kwargs = {"batch_size": batch_size} if batch_size else {}
+            vectors = model.encode(list(missing.values()), **kwargs)
+            entries = [(key, phrase, model_name, vector) for (key, phrase), vector in zip(missing.items(), vectors)]
+            ids.update(PhraseRepository.add_phrases(db, entries))
+        
+        return [ids[key] for key in keys], len(missing)
+    
+    @staticmethod
+    def get_vectors(db: Session, phrase_ids: Optional[List[int]] = None,
+                    batch_size: int = 500) -> Dict[int, np.ndarray]:
+        """Get phrase vectors by id
+        
+        Args:
+            phrase_ids: Ids to fetch; None fetches every phrase referenced by a test
+        
+        Returns:
+            Dict of phrase id -> (dim,) array decoded with np.frombuffer
+        """
+        if phrase_ids is None:
+            rows = db.execute(text("""
+                SELECT id, embedding, dtype, dim
+                FROM phrases
+                WHERE id IN (SELECT json_each.value FROM tests, json_each(tests.phrase_ids))
+            """)).fetchall()
+        else:
+            ids = list(set(phrase_ids))
+            rows = []
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                rows.extend(db.query(Phrase.id, Phrase.embedding, Phrase.dtype, Phrase.dim)
+                            .filter(Phrase.id.in_(batch)).all())
+        return {row.id: unpack_embeddings(row.embedding, 1, row.dim, row.dtype)[0] for row in rows}
+    
+    @staticmethod
+    def get_tests_with_vectors(db: Session, tests: List[Dict[str, Any]], model, model_name: str,
+                               batch_size: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Attach vectors of another model to test dicts (e.g. the cascade model)
+        
+        Uses the same row layout as regenerate_embeddings (name first, then
+        synonyms). Phrases missing from the store are encoded once and stored,
+        so later loads only read vectors.
+        
+        Args:
+            tests: Test dicts with 'id', 'name' and 'synonyms'
+            model: Encoder of model_name, used for missing phrases
+            model_name: Model name, part of every phrase key
+        
+        Returns:
+            Tuple (tests, encoded): copies of tests with 'embeddings' and
+            'phrase_ids' for this model, and the number of phrases encoded
+        """
+        phrases = [[test["name"]] + list(test.get("synonyms") or []) for test in tests]
+        flat = [phrase for test_phrases in phrases for phrase in test_phrases]
+        ids, encoded = PhraseRepository.ensure_phrases(db, flat, model, model_name, batch_size)
+        vectors = PhraseRepository.get_vectors(db, ids)
+        
+        result = []
+        start = 0
+        for test, test_phrases in zip(tests, phrases):
+            test_ids = ids[start:start + len(test_phrases)]
+            start += len(test_phrases)
+            result.append(dict(test, embeddings=np.stack([vectors[i] for i in test_ids]), phrase_ids=test_ids))
+        return result, encoded
+    
+    @staticmethod
+    def touch(db: Session, phrase_ids: List[int], batch_size: int = 500):
+        """Mark phrases as just handed out (see delete_unreferenced)"""
+        if not phrase_ids:
+            return
+        ids = list(set(phrase_ids))
+        now = int(time.time())
+        for start in range(0, len(ids), batch_size):
+            db.query(Phrase).filter(Phrase.id.in_(ids[start:start + batch_size])) \
+                .update({Phrase.used_at: now}, synchronize_session=False)
+        db.commit()
+    
+    @staticmethod
+    def delete_unreferenced(db: Session, grace_seconds: int = PHRASE_PRUNE_GRACE) -> int:
+        """Delete phrases no test references any more (e.g. removed synonyms)
+        
+        Vectors of a referenced phrase's text under other models (the cascade
+        model, see get_tests_with_vectors) are kept. So are phrases handed out
+        by ensure_phrases within the last grace_seconds: a concurrent test
+        create/update commits its phrase_ids only after ensure_phrases has
+        returned, and must not lose those phrases in between.
+        """
+        result = db.execute(text("""
+            DELETE FROM phrases
+            WHERE used_at < :cutoff
+            AND id NOT IN (
+                SELECT json_each.value FROM tests, json_each(tests.phrase_ids)
+                WHERE json_each.value IS NOT NULL
+            )
+            AND text NOT IN (
+                SELECT p.text FROM phrases p
+                WHERE p.id IN (SELECT json_each.value FROM tests, json_each(tests.phrase_ids))
+            )
+        """), {"cutoff": int(time.time()) - grace_seconds})
+        db.commit()
+        return result.rowcount
+    
+    @staticmethod
+    def get_stats(db: Session) -> Dict[str, int]:
+        """Distinct stored phrases vs. phrase references from tests"""
+        phrases = db.execute(text("SELECT COUNT(*) AS count FROM phrases")).fetchone()
+        references = db.execute(text("""
+            SELECT COALESCE(SUM(json_array_length(phrase_ids)), 0) AS count
+            FROM tests
+            WHERE phrase_ids IS NOT NULL
+        """)).fetchone()
+        return {"phrases": phrases.count, "references": references.count}
+
+
+class LLMDecisionRepository:
+    """Repository for cached LLM fallback decisions"""
+    
+    @staticmethod
+    def get_decision(db: Session, key: str, max_age: Optional[int] = None) -> Optional[List[str]]:
+        """Get cached matches for a key, ignoring entries older than max_age seconds"""
+        decision = db.query(LLMDecision).filter(LLMDecision.key == key).first()
+        if not decision:
+            return None
+        if max_age is not None and time.time() - decision.created_at > max_age:
+            return None
+        return decision.matches
+    
+    @staticmethod
+    def put_decision(db: Session, key: str, chunk: str, candidates: List[str],
+                     prompt_version: str, matches: List[str]):
+        """Insert or replace a cached decision"""
+        db.merge(LLMDecision(
+            key=key,
+            chunk=chunk,
+            candidates=candidates,
+            prompt_version=prompt_version,
+            matches=matches,
+            created_at=int(time.time())
+        ))
+        db.commit()
+    
+    @staticmethod
+    def invalidate_for_tests(db: Session, test_names: List[str]) -> int:
+        """Delete cached decisions that had any of the given tests as a candidate"""
+        test_names = [name for name in test_names if name]
+        if not test_names:
+            return 0
+        placeholders = ", ".join(f":name{i}" for i in range(len(test_names)))
+        query = text(f"""
+            DELETE FROM llm_decisions
+            WHERE EXISTS (
+                SELECT 1 FROM json_each(llm_decisions.candidates)
+                WHERE json_each.value IN ({placeholders})
+            )
+        """)
+        result = db.execute(query, {f"name{i}": name for i, name in enumerate(test_names)})
+        db.commit()
+        return result.rowcount
+    
+    @staticmethod
+    def purge_expired(db: Session, max_age: int) -> int:
+        """Delete decisions older than max_age seconds"""
+        cutoff = int(time.time()) - max_age
+        deleted = db.query(LLMDecision).filter(LLMDecision.created_at < cutoff).delete()
+        db.commit()
+        return deleted
+
+
+class LLMDecisionCache:
+    """Persistent LLM decision cache backed by the llm_decisions table
+    
+    Opens its own short-lived sessions, so it can be handed to
+    utils.llm_fallback_async without threading a request session through.
+    """
+    
+    def __init__(self, ttl_seconds: int = 7 * 24 * 3600):
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: str) -> Optional[List[str]]:
+        db = get_db_session()
+        try:
+            matches = LLMDecisionRepository.get_decision(db, key, max_age=self.ttl_seconds)
+        finally:
+            db.close()
+        if matches is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return matches
+    
+    def put(self, key: str, chunk: str, candidates: List[str], prompt_version: str, matches: List[str]):
+        db = get_db_session()
+        try:
+            LLMDecisionRepository.put_decision(db, key, chunk, candidates, prompt_version, matches)
+        finally:
+            db.close()
+    
+    def invalidate_tests(self, test_names: List[str]) -> int:
+        db = get_db_session()
+        try:
+            return LLMDecisionRepository.invalidate_for_tests(db, test_names)
+        finally:
+            db.close()
+    
+    def purge_expired(self) -> int:
+        """Delete decisions older than the TTL; get() already ignores them"""
+        db = get_db_session()
+        try:
+            return LLMDecisionRepository.purge_expired(db, self.ttl_seconds)
+        finally:
+            db.close()
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0
+        }
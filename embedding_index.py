@@ -0,0 +1,457 @@
+"""
+In-memory embedding index for fast catalog scoring.
+
+Flattens every test's synonym embeddings into one contiguous, pre-normalized
+float32 matrix with a row -> test offsets table, so scoring a query is a single
+matrix-vector product followed by a segmented max per test. Phrases shared by
+several tests are stored and scored once.
+"""
+
+import bisect
+import numpy as np
+from typing import List, Dict, Any, Optional, Sequence
+
+from quantization import QuantizedMatrix, spill_rows
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize each row of a matrix (zero rows are left as zeros).
+
+    Args:
+        matrix: 2D array of shape (rows, dim)
+
+    Returns:
+        float32 array of the same shape with unit-length rows
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _row_keys(phrase_ids: Optional[Sequence[Any]], count: int) -> Sequence[Any]:
+    """Phrase id per row, or all None when the ids are missing or not aligned with the rows"""
+    if phrase_ids is not None and len(phrase_ids) == count:
+        return phrase_ids
+    return [None] * count
+
+
+def _concat_ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(s, e) for every (s, e) pair, without a Python loop"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    shifts = starts - np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return np.repeat(shifts, lengths) + np.arange(total, dtype=np.int64)
+
+
+class EmbeddingIndex:
+    """
+    Contiguous embedding matrix over the whole test catalog.
+
+    Tests whose rows carry phrase ids (see database.PhraseRepository) share one
+    matrix row per distinct phrase, so a synonym used by many tests is stored
+    and scored once; `rows` maps each test row back to its matrix row.
+
+    Attributes:
+        matrix: float32 array (unique_rows, dim), every row unit-normalized
+        offsets: int64 array (num_tests + 1,); test rows offsets[i]:offsets[i+1] belong to test i
+        ids: Test IDs in index order
+        names: Test names in index order
+        rows: int64 array (total_rows,) of matrix rows per test row, or None for the identity
+        phrase_keys: Phrase id of each matrix row (None for rows without one)
+        ann: Optional ANN backend over matrix rows (see ann_index); when set, scoring
+            retrieves ann_candidates rows per query and re-ranks their tests exactly
+        ann_candidates: Matrix rows retrieved per query from the ANN backend
+        quantized: Optional QuantizedMatrix copy of matrix used for the scan; tests that
+            may reach the threshold (or rank in the top rescore_top) are re-scored from matrix
+        rescore_top: Best approximate tests per query always re-scored exactly (keeps topk exact)
+    """
+
+    def __init__(self, matrix: np.ndarray, offsets: np.ndarray, ids: Sequence[str], names: Sequence[str],
+                 rows: Optional[np.ndarray] = None, phrase_keys: Optional[Sequence[Any]] = None,
+                 ann=None, ann_candidates: int = 100,
+                 quantized: Optional[QuantizedMatrix] = None, rescore_top: int = 16):
+        self.matrix = matrix
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.ids = list(ids)
+        self.names = list(names)
+        self.rows = np.asarray(rows, dtype=np.int64) if rows is not None else None
+        self.phrase_keys = list(phrase_keys) if phrase_keys is not None else [None] * len(matrix)
+        self.ann = ann
+        self.ann_candidates = ann_candidates
+        self.quantized = quantized
+        self.rescore_top = rescore_top
+        self._row_owners = None
+
+    @classmethod
+    def from_tests(cls, tests: List[Dict[str, Any]]) -> "EmbeddingIndex":
+        """
+        Build the index from the output of TestRepository.get_tests_with_embeddings.
+
+        Tests without embeddings are skipped, so every test segment is non-empty.
+        Rows of tests with aligned 'phrase_ids' are deduplicated by phrase id.
+
+        Args:
+            tests: List of test dictionaries with 'id', 'name', 'embeddings' and optional 'phrase_ids'
+
+        Returns:
+            EmbeddingIndex over all tests that have embeddings
+        """
+        vectors = []
+        phrase_keys = []
+        key_row: Dict[Any, int] = {}
+        rows = []
+        offsets = [0]
+        ids = []
+        names = []
+
+        for test in tests:
+            emb = test.get("embeddings")
+            if emb is None or len(emb) == 0:
+                continue
+            block = np.asarray(emb, dtype=np.float32)
+            if block.ndim == 1:
+                block = block.reshape(1, -1)
+            for key, vector in zip(_row_keys(test.get("phrase_ids"), block.shape[0]), block):
+                row = key_row.get(key) if key is not None else None
+                if row is None:
+                    row = len(vectors)
+                    vectors.append(vector)
+                    phrase_keys.append(key)
+                    if key is not None:
+                        key_row[key] = row
+                rows.append(row)
+            offsets.append(offsets[-1] + block.shape[0])
+            ids.append(test.get("id", test["name"]))
+            names.append(test["name"])
+
+        if vectors:
+            matrix = normalize_rows(np.stack(vectors))
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+
+        # Skip the row gather at scoring time when nothing was shared
+        row_map = np.asarray(rows, dtype=np.int64) if len(vectors) < len(rows) else None
+        return cls(np.ascontiguousarray(matrix), np.asarray(offsets, dtype=np.int64), ids, names,
+                   row_map, phrase_keys)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, test_id: str) -> bool:
+        return test_id in self.ids
+
+    @property
+    def total_rows(self) -> int:
+        """Number of test rows (name + synonyms over all tests), before deduplication"""
+        return int(self.offsets[-1])
+
+    def row_map(self) -> np.ndarray:
+        """Matrix row of every test row, materializing the identity mapping if needed"""
+        if self.rows is not None:
+            return self.rows
+        return np.arange(self.total_rows, dtype=np.int64)
+
+    def attach_ann(self, ann, candidates: int = 100) -> "EmbeddingIndex":
+        """
+        Use an ANN backend built over this index's matrix for scoring.
+
+        Args:
+            ann: Backend from ann_index.build_ann_backend(name, self.matrix), or None for exact scans
+            candidates: Matrix rows retrieved per query before exact re-ranking (recall knob)
+
+        Returns:
+            self, for chaining
+        """
+        self.ann = ann
+        self.ann_candidates = candidates
+        return self
+
+    def quantize(self, kind: str, rescore_top: int = 16, spill: bool = True,
+                 spill_dir: Optional[str] = None) -> "EmbeddingIndex":
+        """
+        Scan a float16/int8 copy of the matrix and keep full precision for re-scoring only.
+
+        Args:
+            kind: "float16" or "int8" (see quantization.QuantizedMatrix)
+            rescore_top: Best approximate tests per query always re-scored exactly
+            spill: Move the float32 matrix into a memory-mapped temporary file
+                (a no-op when it already is memory-mapped, e.g. from a snapshot),
+                so only re-scored rows are paged in
+            spill_dir: Directory for the spilled matrix
+
+        Returns:
+            self, for chaining
+        """
+        self.quantized = QuantizedMatrix.from_matrix(self.matrix, kind)
+        self.rescore_top = rescore_top
+        if spill and not isinstance(self.matrix, np.memmap) and self.matrix.size:
+            self.matrix = spill_rows([self.matrix], spill_dir)
+        return self
+
+    def _derive(self, matrix, offsets, ids, names, rows, phrase_keys, quantized) -> "EmbeddingIndex":
+        """New index over changed data that keeps this index's ANN/quantization settings"""
+        return EmbeddingIndex(matrix, offsets, ids, names, rows, phrase_keys,
+                              self.ann, self.ann_candidates, quantized, self.rescore_top)
+
+    # -----------------------------
+    # Incremental updates (copy-on-write)
+    # -----------------------------
+
+    def remove(self, test_id: str) -> "EmbeddingIndex":
+        """
+        Return a new index without the given test's rows.
+
+        Matrix rows are left in place (they may be shared with other tests);
+        rows no longer referenced are dropped on the next full rebuild.
+
+        Args:
+            test_id: Test ID to drop (unknown IDs return self unchanged)
+
+        Returns:
+            New EmbeddingIndex; the original is left untouched for concurrent readers
+        """
+        if test_id not in self.ids:
+            return self
+
+        pos = self.ids.index(test_id)
+        start, end = int(self.offsets[pos]), int(self.offsets[pos + 1])
+        rows = self.row_map()
+        offsets = np.concatenate([self.offsets[:pos + 1], self.offsets[pos + 2:] - (end - start)])
+        return self._derive(
+            self.matrix, offsets,
+            self.ids[:pos] + self.ids[pos + 1:],
+            self.names[:pos] + self.names[pos + 1:],
+            np.concatenate([rows[:start], rows[end:]]),
+            self.phrase_keys, self.quantized
+        )
+
+    def upsert(self, test_id: str, name: str, embeddings, phrase_ids: Optional[Sequence[Any]] = None) -> "EmbeddingIndex":
+        """
+        Return a new index with one test's rows replaced (or added).
+
+        Only the test's new phrases are normalized and appended to the matrix;
+        phrases already present (same phrase id) reuse their row. The test is
+        placed in name order, like the ORDER BY name load from the database.
+
+        Args:
+            test_id: Test ID
+            name: Test name
+            embeddings: The test's (count, dim) embeddings; empty removes the test
+            phrase_ids: Phrase id of each embedding row (optional)
+
+        Returns:
+            New EmbeddingIndex; the original is left untouched for concurrent readers
+        """
+        base = self.remove(test_id)
+        if embeddings is None or len(embeddings) == 0:
+            return base
+
+        block = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        key_row = {key: row for row, key in enumerate(base.phrase_keys) if key is not None}
+        new_vectors = []
+        new_keys = []
+        test_rows = []
+        for key, vector in zip(_row_keys(phrase_ids, block.shape[0]), block):
+            row = key_row.get(key) if key is not None else None
+            if row is None:
+                row = len(base.phrase_keys) + len(new_vectors)
+                new_vectors.append(vector)
+                new_keys.append(key)
+                if key is not None:
+                    key_row[key] = row
+            test_rows.append(row)
+
+        matrix = base.matrix
+        quantized = base.quantized
+        if new_vectors:
+            added = normalize_rows(np.stack(new_vectors))
+            if base.matrix.size == 0:
+                matrix = added
+            elif isinstance(base.matrix, np.memmap):
+                # Keep full precision out of RAM (streams the old rows into a new mapped file)
+                matrix = spill_rows([base.matrix, added])
+            else:
+                matrix = np.concatenate([base.matrix, added], axis=0)
+            if quantized is not None:
+                quantized = quantized.append(added)
+            if base.ann is not None:
+                # Appended rows only; readers of older indexes ignore rows beyond their matrix
+                base.ann.add(len(base.phrase_keys), added)
+
+        keys = list(zip(base.names, base.ids))
+        pos = bisect.bisect_left(keys, (name, test_id))
+        start = int(base.offsets[pos])
+        count = block.shape[0]
+        rows = base.row_map()
+        offsets = np.concatenate([base.offsets[:pos + 1], [start + count], base.offsets[pos + 1:] + count])
+
+        return base._derive(
+            matrix, offsets,
+            base.ids[:pos] + [test_id] + base.ids[pos:],
+            base.names[:pos] + [name] + base.names[pos:],
+            np.concatenate([rows[:start], np.asarray(test_rows, dtype=np.int64), rows[start:]]),
+            base.phrase_keys + new_keys, quantized
+        )
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    def score(self, query_emb, threshold: Optional[float] = None) -> np.ndarray:
+        """
+        Compute the best cosine similarity of a query against every test.
+
+        Args:
+            query_emb: Query embedding of shape (dim,)
+            threshold: Match threshold the scores will be compared against (see score_many)
+
+        Returns:
+            float32 array (num_tests,) with the max synonym similarity per test
+        """
+        return self.score_many(np.asarray(query_emb, dtype=np.float32).reshape(1, -1), threshold)[0]
+
+    def score_many(self, query_embs, threshold: Optional[float] = None) -> np.ndarray:
+        """
+        Compute best cosine similarities for several queries in one matrix multiply.
+
+        With a quantized matrix, scores are exact for every test that could
+        reach `threshold` and for the rescore_top best tests; the rest keep
+        their approximate score. Exact scans ignore the threshold.
+
+        Args:
+            query_embs: Query embeddings of shape (num_queries, dim)
+            threshold: Match threshold the scores will be compared against (optional)
+
+        Returns:
+            float32 array (num_queries, num_tests)
+        """
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_embs, dtype=np.float32)))
+        if len(self) == 0:
+            return np.zeros((queries.shape[0], 0), dtype=np.float32)
+        if self.ann is not None:
+            return self._score_many_ann(queries)
+        if self.quantized is not None:
+            return self._score_many_quantized(queries, threshold)
+
+        row_scores = queries @ self.matrix.T
+        if self.rows is not None:
+            # Expand unique phrase scores back to per-test rows
+            row_scores = row_scores[:, self.rows]
+        # Segmented max: one reduction per test over its contiguous rows
+        return np.maximum.reduceat(row_scores, self.offsets[:-1], axis=1)
+
+    def _owners(self):
+        """Matrix row -> owning tests, as (owners, bounds) CSR arrays (built lazily)"""
+        if self._row_owners is None:
+            row_map = self.row_map()
+            test_of_row = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.offsets))
+            order = np.argsort(row_map, kind="stable")
+            bounds = np.searchsorted(row_map[order], np.arange(self.matrix.shape[0] + 1))
+            self._row_owners = (test_of_row[order], bounds)
+        return self._row_owners
+
+    def _score_many_ann(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Score via the ANN backend: tests owning a retrieved row get their exact
+        best similarity, all other tests get -inf (never a match or top-k pick
+        ahead of a scored test; topk leaves them out).
+        """
+        owners, bounds = self._owners()
+        scores = np.full((queries.shape[0], len(self)), -np.inf, dtype=np.float32)
+
+        for qi, candidate_rows in enumerate(self.ann.search(self.matrix, queries, self.ann_candidates)):
+            candidate_rows = candidate_rows[candidate_rows < len(bounds) - 1]
+            tests = np.unique(owners[_concat_ranges(bounds[candidate_rows], bounds[candidate_rows + 1])])
+            if len(tests) == 0:
+                continue
+            scores[qi, tests] = self._exact_scores(queries[qi], tests)
+
+        return scores
+
+    def _score_many_quantized(self, queries: np.ndarray, threshold: Optional[float]) -> np.ndarray:
+        """
+        Scan the quantized matrix, then re-score in full precision every test
+        whose upper bound (approximate score + quantization error bound)
+        reaches the threshold, plus every test that could rank among the
+        rescore_top best: the rescore_top best upper bounds first, then any
+        test whose upper bound reaches the rescore_top-th best exact score.
+        """
+        approx_rows = self.quantized.dot(queries)
+        upper_rows = approx_rows + self.quantized.error_bound(queries)
+        if self.rows is not None:
+            approx_rows = approx_rows[:, self.rows]
+            upper_rows = upper_rows[:, self.rows]
+        scores = np.maximum.reduceat(approx_rows, self.offsets[:-1], axis=1)
+        upper = np.maximum.reduceat(upper_rows, self.offsets[:-1], axis=1)
+
+        top = min(self.rescore_top, len(self))
+        for qi in range(queries.shape[0]):
+            candidates = np.argpartition(-upper[qi], top - 1)[:top] if top else np.zeros(0, dtype=np.int64)
+            if threshold is not None:
+                candidates = np.union1d(candidates, np.nonzero(upper[qi] >= threshold)[0])
+            if len(candidates):
+                candidates = np.sort(candidates)
+                exact = self._exact_scores(queries[qi], candidates)
+                scores[qi, candidates] = exact
+                if top:
+                    # Tests left approximate stay below the top-th best exact score, so topk is exact
+                    kth = np.partition(exact, len(exact) - top)[len(exact) - top]
+                    extra = np.setdiff1d(np.nonzero(upper[qi] >= kth)[0], candidates)
+                    if len(extra):
+                        scores[qi, extra] = self._exact_scores(queries[qi], extra)
+
+        return scores
+
+    def _exact_scores(self, query: np.ndarray, tests: np.ndarray) -> np.ndarray:
+        """Full-precision best similarity of one query for the given (sorted) test positions"""
+        starts, ends = self.offsets[tests], self.offsets[tests + 1]
+        matrix_rows = self.row_map()[_concat_ranges(starts, ends)]
+        row_scores = np.asarray(self.matrix[matrix_rows], dtype=np.float32) @ query
+        segments = np.concatenate([[0], np.cumsum(ends - starts)[:-1]])
+        return np.maximum.reduceat(row_scores, segments)
+
+    def match(self, query_emb, threshold: float = 0.75, scores: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Return tests whose best similarity is at or above the threshold.
+
+        Args:
+            query_emb: Query embedding of shape (dim,)
+            threshold: Minimum cosine similarity to consider a match
+            scores: Precomputed per-test scores (skips scoring when given)
+
+        Returns:
+            List of {"name": str, "score": float} in index order
+        """
+        if scores is None:
+            scores = self.score(query_emb, threshold)
+        hits = np.nonzero(scores >= threshold)[0]
+        return [{"name": self.names[i], "score": round(float(scores[i]), 3)} for i in hits]
+
+    def topk(self, query_emb, top_k: int = 5, scores: Optional[np.ndarray] = None) -> List[str]:
+        """
+        Return the names of the top-k most similar tests.
+
+        Args:
+            query_emb: Query embedding of shape (dim,)
+            top_k: Number of tests to return
+            scores: Precomputed per-test scores (skips scoring when given)
+
+        Returns:
+            List of test names, highest similarity first; tests without a
+            finite score (never retrieved by the ANN backend) are left out,
+            so fewer than top_k names may be returned
+        """
+        if scores is None:
+            scores = self.score(query_emb)
+        candidates = np.nonzero(np.isfinite(scores))[0]
+        if top_k <= 0 or len(candidates) == 0:
+            return []
+        if len(candidates) > top_k:
+            # Partition first, then sort only the k winners (stable on ties, like list.sort)
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        order = sorted(candidates, key=lambda i: (-scores[i], i))
+        return [self.names[i] for i in order]
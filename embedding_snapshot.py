@@ -0,0 +1,167 @@
+"""
+Memory-mapped embedding snapshot shared across worker processes.
+
+A snapshot is a single read-only file holding the catalog's normalized
+embedding matrix (one row per distinct phrase), the test row -> matrix row
+map, the row -> test offsets table and the test metadata needed
+for lexical matching. Every uvicorn worker np.memmaps the same file, so the
+matrix lives once in the OS page cache instead of once per process, and worker
+startup skips decoding embeddings from the database.
+
+File layout (little-endian):
+    header   MAGIC, version, source, num_tests, rows, matrix_rows, dim, meta_len   (struct HEADER_FORMAT)
+    meta     UTF-8 JSON: [{"id", "name", "category", "synonyms"}, ...]
+    offsets  int64[num_tests + 1], 64-byte aligned
+    row_map  int64[rows], matrix row of every test row, 64-byte aligned
+    matrix   float32[matrix_rows, dim], 64-byte aligned
+
+New versions are written to a temporary file and moved into place with
+os.replace, so readers see either the old or the new file, never a partial
+one. Readers that still map the old file keep a valid mapping until they
+remap.
+
+"source" is the database fingerprint the snapshot was exported from
+(TestRepository.get_catalog_fingerprint); a snapshot whose source no longer
+matches the database is stale and gets republished.
+"""
+
+import json
+import os
+import struct
+import tempfile
+import time
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+
+from embedding_index import EmbeddingIndex
+
+MAGIC = b"AMCEMB03"
+HEADER_FORMAT = "<8sQQQQQQQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+ALIGNMENT = 64
+
+
+def _aligned(position: int) -> int:
+    """Round a byte position up to the next ALIGNMENT boundary"""
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_snapshot(path: str, tests: List[Dict[str, Any]], index: Optional[EmbeddingIndex] = None,
+                   version: Optional[int] = None, source: int = 0) -> int:
+    """
+    Atomically publish a new snapshot file.
+
+    Args:
+        path: Destination snapshot path
+        tests: Tests as returned by TestRepository.get_tests_with_embeddings
+        index: Prebuilt index over tests (built from tests if omitted)
+        version: Snapshot version (defaults to the current time in ns, so it
+            increases monotonically across publishing workers)
+        source: Fingerprint of the database state tests were read from
+
+    Returns:
+        The version written to the header
+    """
+    if index is None:
+        index = EmbeddingIndex.from_tests(tests)
+    if version is None:
+        version = time.time_ns()
+
+    by_id = {test.get("id", test["name"]): test for test in tests}
+    meta = [
+        {
+            "id": test_id,
+            "name": by_id[test_id]["name"],
+            "category": by_id[test_id].get("category"),
+            "synonyms": by_id[test_id].get("synonyms", []),
+        }
+        for test_id in index.ids
+    ]
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    matrix = np.ascontiguousarray(index.matrix, dtype="<f4")
+    offsets = np.ascontiguousarray(index.offsets, dtype="<i8")
+    row_map = np.ascontiguousarray(index.row_map(), dtype="<i8")
+    matrix_rows, dim = (matrix.shape if matrix.ndim == 2 else (0, 0))
+
+    header = struct.pack(HEADER_FORMAT, MAGIC, version, source, len(index), len(row_map), matrix_rows, dim,
+                         len(meta_bytes))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(meta_bytes)
+            f.write(b"\0" * (_aligned(f.tell()) - f.tell()))
+            f.write(memoryview(offsets).cast("B"))
+            f.write(b"\0" * (_aligned(f.tell()) - f.tell()))
+            if row_map.size:
+                f.write(memoryview(row_map).cast("B"))
+            f.write(b"\0" * (_aligned(f.tell()) - f.tell()))
+            if matrix.size:
+                f.write(memoryview(matrix).cast("B"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return version
+
+
+def read_snapshot_header(path: str) -> Optional[Tuple[int, int]]:
+    """Read only (version, source) from a snapshot header (None if missing or invalid)"""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER_SIZE:
+        return None
+    magic, version, source, *_ = struct.unpack(HEADER_FORMAT, header)
+    return (version, source) if magic == MAGIC else None
+
+
+def load_snapshot(path: str) -> Tuple[List[Dict[str, Any]], EmbeddingIndex, int]:
+    """
+    Map a snapshot file read-only.
+
+    Args:
+        path: Snapshot path
+
+    Returns:
+        Tuple (tests, index, version): test metadata dicts (no embeddings),
+        an EmbeddingIndex whose matrix is a read-only np.memmap of the file
+        (without phrase ids, so upserts into it do not share rows), and the
+        snapshot version
+
+    Raises:
+        ValueError: If the file is not a snapshot
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError(f"Truncated embedding snapshot: {path}")
+        magic, version, _, num_tests, rows, matrix_rows, dim, meta_len = struct.unpack(HEADER_FORMAT, header)
+        if magic != MAGIC:
+            raise ValueError(f"Not an embedding snapshot: {path}")
+        meta = json.loads(f.read(meta_len).decode("utf-8"))
+
+    offsets_start = _aligned(HEADER_SIZE + meta_len)
+    offsets = np.fromfile(path, dtype="<i8", count=num_tests + 1, offset=offsets_start)
+    row_map_start = _aligned(offsets_start + offsets.nbytes)
+    row_map = np.fromfile(path, dtype="<i8", count=rows, offset=row_map_start)
+    matrix_start = _aligned(row_map_start + row_map.nbytes)
+
+    if matrix_rows and dim:
+        matrix = np.memmap(path, dtype="<f4", mode="r", offset=matrix_start, shape=(matrix_rows, dim))
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+
+    if matrix_rows == rows and np.array_equal(row_map, np.arange(rows)):
+        row_map = None
+    index = EmbeddingIndex(matrix, offsets, [m["id"] for m in meta], [m["name"] for m in meta], row_map)
+    return meta, index, version
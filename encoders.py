@@ -0,0 +1,348 @@
+"""
+Query encoders used by the matching pipeline.
+
+Wraps the sentence embedding model behind the same `encode()` interface that
+app.py and utils.py already call on a SentenceTransformer. Two backends:
+
+    "torch" - the sentence-transformers model in eager PyTorch (default)
+    "onnx"  - the same model exported to ONNX with int8 dynamic quantization
+              (see export_onnx.py), run by onnxruntime on CPU without torch
+"""
+
+import json
+import os
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List, Optional, Union
+
+from utils import normalize_text
+
+ENCODER_BACKENDS = ("torch", "onnx")
+
+# Written by export_onnx.py next to the model and tokenizer files
+ONNX_CONFIG_FILE = "encoder_config.json"
+
+
+def default_onnx_dir(model_name: str) -> str:
+    """Directory export_onnx.py writes the quantized model of `model_name` to by default"""
+    return os.path.join("models", f"{model_name.replace('/', '_')}-onnx-int8")
+
+
+def _import_onnx():
+    """Import onnxruntime and tokenizers.Tokenizer (optional: only needed for ENCODER_BACKEND=onnx)"""
+    try:
+        import onnxruntime
+        from tokenizers import Tokenizer
+    except ImportError as e:
+        raise ImportError("The onnx encoder backend needs `pip install onnxruntime tokenizers`") from e
+    return onnxruntime, Tokenizer
+
+
+def load_encoder(model_name: str, backend: str = "torch", onnx_dir: Optional[str] = None,
+                 threads: Optional[int] = None, timings: Optional[Dict[str, float]] = None):
+    """
+    Load the sentence embedding model with the selected backend.
+
+    Args:
+        model_name: sentence-transformers model name (also part of the phrase keys)
+        backend: "torch" or "onnx"
+        onnx_dir: Exported model directory for the onnx backend (default: default_onnx_dir)
+        threads: onnxruntime intra-op threads (default: onnxruntime's choice)
+        timings: Optional dict receiving "import_ms" (backend libraries: torch or onnxruntime)
+            and "construct_ms" (reading the weights)
+
+    Returns:
+        Object with a SentenceTransformer-compatible encode()
+
+    Raises:
+        ValueError: Unknown backend
+    """
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}' (expected one of {', '.join(ENCODER_BACKENDS)})")
+    timings = timings if timings is not None else {}
+
+    start = time.perf_counter()
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+    else:
+        _import_onnx()
+    timings["import_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    start = time.perf_counter()
+    if backend == "torch":
+        model = SentenceTransformer(model_name)
+    else:
+        model = OnnxEncoder(onnx_dir or default_onnx_dir(model_name), model_name=model_name, threads=threads)
+    timings["construct_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return model
+
+
+class LazyEncoder:
+    """
+    Encoder proxy that loads the real model on first use or in the background.
+
+    Importing torch and reading the model weights takes seconds, so the app
+    starts the load in a background thread (start()) and keeps serving
+    metadata endpoints meanwhile. encode() blocks until the model is loaded;
+    callers that must not block check `ready` or wait() with a timeout. Loading
+    is single-flight, and a failed load is retried by the next start()/encode().
+    """
+
+    def __init__(self, loader: Callable[[], Any]):
+        self._loader = loader
+        self._model = None
+        self._lock = threading.Lock()  # Held while loading
+        self._start_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.error: Optional[str] = None
+        self.load_ms: Optional[float] = None
+        self.ready_at: Optional[float] = None  # time.perf_counter() when the model became ready
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    @property
+    def loading(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Load the model in a background thread (no-op when loaded or already loading)"""
+        with self._start_lock:
+            if self.ready or self.loading:
+                return
+            self._thread = threading.Thread(target=self._load_in_background, name="model-loader", daemon=True)
+            self._thread.start()
+
+    def _load_in_background(self):
+        try:
+            self.get()
+        except Exception as e:
+            print(f"Failed to load embedding model: {e}")
+
+    def get(self):
+        """The loaded model, loading it in the calling thread if needed"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    try:
+                        model = self._loader()
+                    except Exception as e:
+                        self.error = str(e)
+                        raise
+                    self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+                    self.error = None
+                    self._model = model
+                    self.ready_at = time.perf_counter()
+                    self._ready.set()
+                    print(f"Embedding model loaded in {self.load_ms:.0f}ms")
+        return self._model
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the model is loaded; False if `timeout` seconds passed first"""
+        return self._ready.wait(timeout)
+
+    def encode(self, sentences, **kwargs):
+        return self.get().encode(sentences, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "loading": self.loading, "load_ms": self.load_ms, "error": self.error}
+
+
+class OnnxEncoder:
+    """
+    Sentence encoder running an exported transformer with onnxruntime.
+
+    Reproduces the sentence-transformers pipeline: tokenize (truncating to the
+    model's max_seq_length), run the transformer, pool the token embeddings
+    (mean or CLS) and optionally L2-normalize. Texts are batched by length to
+    keep padding small, as SentenceTransformer.encode does.
+    """
+
+    def __init__(self, model_dir: str, model_name: Optional[str] = None, threads: Optional[int] = None):
+        onnxruntime, Tokenizer = _import_onnx()
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILE), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        if model_name is not None and self.config["model_name"] != model_name:
+            raise ValueError(f"{model_dir} was exported from {self.config['model_name']}, not {model_name}")
+
+        self.model_dir = model_dir
+        self.pooling = self.config.get("pooling", "mean")
+        self.normalize = self.config.get("normalize", True)
+        self.max_seq_length = self.config.get("max_seq_length", 384)
+        self.pad_token_id = self.config.get("pad_token_id", 0)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(self.max_seq_length)
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, self.config["model_file"]),
+                                                    options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """
+        Encode one text or a list of texts.
+
+        Args:
+            sentences: A text or list of texts
+            batch_size: Texts per forward pass
+            **kwargs: Other SentenceTransformer.encode options (ignored)
+
+        Returns:
+            float32 array of shape (dim,) for a single text, (n, dim) for a list
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        encodings = self.tokenizer.encode_batch(texts)
+        order = np.argsort([-len(e.ids) for e in encodings], kind="stable")
+        result = None
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            pooled = self._forward([encodings[i] for i in batch])
+            if result is None:
+                result = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            result[batch] = pooled
+
+        return result[0] if single else result
+
+    def _forward(self, encodings) -> np.ndarray:
+        """Pooled embeddings of one batch of tokenizer encodings"""
+        length = max(len(e.ids) for e in encodings)
+        input_ids = np.full((len(encodings), length), self.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(encodings), length), dtype=np.int64)
+        for i, encoding in enumerate(encodings):
+            input_ids[i, :len(encoding.ids)] = encoding.ids
+            attention_mask[i, :len(encoding.ids)] = 1
+
+        feed = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feed["token_type_ids"] = np.zeros_like(input_ids)
+        tokens = self.session.run(None, feed)[0]
+
+        if self.pooling == "cls":
+            pooled = tokens[:, 0]
+        else:
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (tokens * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        pooled = pooled.astype(np.float32)
+        if self.normalize:
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled
+
+
+class CachedEncoder:
+    """
+    Bounded LRU cache in front of a query encoder.
+
+    Doctors repeat the same short phrases ("check CBC", "do RFT"), so chunk
+    embeddings are cached keyed on normalize_text(chunk). A repeated chunk
+    skips the transformer forward pass entirely. The cache is capped both by
+    entry count and by total vector bytes, and is safe to share between
+    threadpool workers.
+
+    Only meant for query-time encoding; catalog embeddings should be generated
+    with the underlying model directly.
+    """
+
+    def __init__(self, model, max_entries: int = 4096, max_bytes: int = 64 * 1024 * 1024):
+        self.model = model
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def encode(self, sentences: Union[str, List[str]], **kwargs) -> np.ndarray:
+        """
+        Encode one text or a list of texts, serving repeats from the cache.
+
+        Misses are encoded together in a single model.encode call.
+
+        Args:
+            sentences: A text or list of texts
+            **kwargs: Passed through to the underlying model.encode
+
+        Returns:
+            float32 array of shape (dim,) for a single text, (n, dim) for a list
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        keys = [normalize_text(t) for t in texts]
+
+        found: Dict[str, np.ndarray] = {}
+        missing: Dict[str, str] = {}
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in found or key in missing:
+                    continue
+                emb = self._entries.get(key)
+                if emb is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = emb
+                    self.hits += 1
+                else:
+                    missing[key] = text
+                    self.misses += 1
+
+        if missing:
+            encoded = np.asarray(self.model.encode(list(missing.values()), **kwargs), dtype=np.float32)
+            with self._lock:
+                for key, emb in zip(missing.keys(), encoded):
+                    emb = np.array(emb, dtype=np.float32)
+                    emb.setflags(write=False)
+                    found[key] = emb
+                    self._put(key, emb)
+
+        if single:
+            return found[keys[0]]
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def _put(self, key: str, emb: np.ndarray):
+        """Insert an entry and evict least-recently-used ones over the caps (lock held)"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        self._entries[key] = emb
+        self._bytes += emb.nbytes
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        """Drop all cached embeddings (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache counters for /api/status"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
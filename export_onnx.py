@@ -0,0 +1,183 @@
+"""
+Export the sentence embedding model to ONNX with int8 dynamic quantization,
+and check its parity with the PyTorch model.
+
+Export (needs torch, sentence-transformers, onnx and onnxruntime):
+    python export_onnx.py [--model all-mpnet-base-v2] [--output models/all-mpnet-base-v2-onnx-int8]
+
+Parity check on the catalog names and synonyms (also run after every export):
+    python export_onnx.py --check-only [--tests tests.json] [--tolerance 0.02]
+
+The check compares the cosine score of every (query phrase, catalog phrase)
+pair under both backends and fails (exit code 1) when any score moves by more
+than the tolerance. It also reports how many pairs flip their decision at the
+0.75 match threshold and the per-chunk encode latency of both backends.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+from encoders import OnnxEncoder, ONNX_CONFIG_FILE, default_onnx_dir
+
+MATCH_THRESHOLD = 0.75
+FP32_FILE = "model.onnx"
+INT8_FILE = "model-int8.onnx"
+
+
+def export(model_name: str, output_dir: str, quantize: bool = True, opset: int = 14):
+    """Export the transformer of `model_name` and its tokenizer to output_dir"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    print(f"Loading {model_name}...")
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0].auto_model.eval()
+    tokenizer = st.tokenizer
+    pooling = st[1].get_pooling_mode_str() if len(st) > 1 else "mean"
+    if pooling not in ("mean", "cls"):
+        raise ValueError(f"Unsupported pooling mode '{pooling}' (only mean and cls are implemented)")
+    normalize = any(type(module).__name__ == "Normalize" for module in st)
+
+    class _TokenEmbeddings(torch.nn.Module):
+        """Transformer forward returning only the token embeddings"""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+    os.makedirs(output_dir, exist_ok=True)
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    sample = tokenizer(["check complete blood count"], return_tensors="pt")
+
+    print(f"Exporting to {fp32_path}...")
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddings(transformer),
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["token_embeddings"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "sequence"},
+                          "attention_mask": {0: "batch", 1: "sequence"},
+                          "token_embeddings": {0: "batch", 1: "sequence"}},
+            opset_version=opset,
+        )
+
+    model_file = FP32_FILE
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        print(f"Quantizing weights to int8 ({INT8_FILE})...")
+        quantize_dynamic(fp32_path, os.path.join(output_dir, INT8_FILE), weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+        model_file = INT8_FILE
+
+    tokenizer.save_pretrained(output_dir)
+    if not os.path.exists(os.path.join(output_dir, "tokenizer.json")):
+        raise RuntimeError(f"{model_name} has no fast tokenizer; tokenizer.json is required by the onnx backend")
+
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "model_file": model_file,
+            "pooling": pooling,
+            "normalize": normalize,
+            "max_seq_length": st.max_seq_length,
+            "pad_token_id": tokenizer.pad_token_id or 0,
+        }, f, indent=2)
+
+    size_mb = os.path.getsize(os.path.join(output_dir, model_file)) / 2 ** 20
+    print(f"Exported {model_name} to {output_dir} ({model_file}, {size_mb:.0f}MB, {pooling} pooling)")
+
+
+def _catalog_phrases(tests_path: str):
+    """Distinct test names and synonyms, in catalog order"""
+    with open(tests_path, "r", encoding="utf-8") as f:
+        tests = json.load(f)
+    phrases = {}
+    for test in tests:
+        for phrase in [test["name"]] + test.get("synonyms", []):
+            phrases.setdefault(phrase.strip().lower(), phrase.strip())
+    return [p for p in phrases.values() if p]
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def _latency_ms(encoder, texts) -> float:
+    """Median single-chunk encode latency, as seen by the matching pipeline"""
+    encoder.encode(texts[0])
+    samples = []
+    for text in texts:
+        start = time.perf_counter()
+        encoder.encode(text)
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def check_parity(model_name: str, onnx_dir: str, tests_path: str = "tests.json", tolerance: float = 0.02,
+                 block: int = 512) -> bool:
+    """
+    Compare ONNX and PyTorch cosine scores over all catalog phrase pairs.
+
+    Returns:
+        True when every score differs by at most `tolerance`
+    """
+    from sentence_transformers import SentenceTransformer
+
+    phrases = _catalog_phrases(tests_path)
+    print(f"Encoding {len(phrases)} catalog phrases with both backends...")
+    torch_model = SentenceTransformer(model_name, device="cpu")
+    onnx_model = OnnxEncoder(onnx_dir, model_name=model_name)
+    reference = _unit(torch_model.encode(phrases, batch_size=64))
+    candidate = _unit(onnx_model.encode(phrases, batch_size=64))
+
+    self_cosine = np.sum(reference * candidate, axis=1)
+    max_dev = 0.0
+    dev_sum = 0.0
+    flips = 0
+    for start in range(0, len(phrases), block):
+        expected = reference[start:start + block] @ reference.T
+        actual = candidate[start:start + block] @ candidate.T
+        deviation = np.abs(actual - expected)
+        max_dev = max(max_dev, float(deviation.max()))
+        dev_sum += float(deviation.sum())
+        flips += int(np.sum((expected >= MATCH_THRESHOLD) != (actual >= MATCH_THRESHOLD)))
+
+    sample = phrases[:: max(1, len(phrases) // 100)][:100]
+    print(f"Phrase self-cosine (torch vs onnx): min {self_cosine.min():.4f}, mean {self_cosine.mean():.4f}")
+    print(f"Pairwise score deviation: max {max_dev:.4f}, mean {dev_sum / len(phrases) ** 2:.5f} "
+          f"(tolerance {tolerance})")
+    print(f"Decisions flipped at threshold {MATCH_THRESHOLD}: {flips} of {len(phrases) ** 2} pairs")
+    print(f"Single-chunk encode latency (p50): torch {_latency_ms(torch_model, sample):.1f}ms, "
+          f"onnx {_latency_ms(onnx_model, sample):.1f}ms")
+
+    passed = max_dev <= tolerance
+    print("Parity check passed" if passed else "Parity check FAILED")
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2"))
+    parser.add_argument("--output", default=None, help="Model directory (default: models/<model>-onnx-int8)")
+    parser.add_argument("--no-quantize", action="store_true", help="Keep float32 weights")
+    parser.add_argument("--check-only", action="store_true", help="Skip the export, only run the parity check")
+    parser.add_argument("--skip-check", action="store_true", help="Skip the parity check after exporting")
+    parser.add_argument("--tests", default="tests.json", help="Catalog whose phrases are compared")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Max allowed cosine score deviation")
+    args = parser.parse_args()
+
+    output_dir = args.output or default_onnx_dir(args.model)
+    if not args.check_only:
+        export(args.model, output_dir, quantize=not args.no_quantize)
+    if not args.skip_check:
+        sys.exit(0 if check_parity(args.model, output_dir, args.tests, args.tolerance) else 1)
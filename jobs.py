@@ -0,0 +1,185 @@
+"""
+Background embedding generation jobs.
+
+Full-catalog embedding generation can take many minutes, so instead of
+running inside one HTTP request it is queued as a job. A single worker thread
+encodes phrases in large model.encode batches and writes results in bulk
+transactions, exposing progress and an ETA while it runs. With the shared
+phrase store, phrases already stored (by any test) are not encoded again.
+"""
+
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable, List
+
+from database import get_db_session, TestRepository, PhraseRepository, EMBEDDING_STORAGE
+from utils import phrase_hash
+
+
+class EmbeddingJob:
+    """State and progress of one embedding generation job"""
+
+    def __init__(self, only_missing: bool = True):
+        self.id = uuid.uuid4().hex
+        self.only_missing = only_missing
+        self.status = "queued"  # queued -> running -> completed | failed
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.total_tests = 0
+        self.processed_tests = 0
+        self.total_phrases = 0
+        self.processed_phrases = 0
+        self.encoded_phrases = 0  # Phrases actually sent to the model (shared/known phrases are skipped)
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Job status for the API, including progress percentage and ETA"""
+        elapsed = None
+        eta = None
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            if self.status == "running" and self.processed_phrases:
+                rate = self.processed_phrases / elapsed
+                eta = round((self.total_phrases - self.processed_phrases) / rate, 1) if rate else None
+
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "only_missing": self.only_missing,
+            "total_tests": self.total_tests,
+            "processed_tests": self.processed_tests,
+            "total_phrases": self.total_phrases,
+            "processed_phrases": self.processed_phrases,
+            "encoded_phrases": self.encoded_phrases,
+            "progress": round(self.processed_tests / self.total_tests, 3) if self.total_tests else (
+                1.0 if self.status == "completed" else 0.0),
+            "elapsed_seconds": round(elapsed, 1) if elapsed is not None else None,
+            "eta_seconds": eta,
+            "error": self.error
+        }
+
+
+class EmbeddingJobManager:
+    """
+    Runs embedding generation jobs one at a time on a background thread.
+
+    Args:
+        model: SentenceTransformer (or compatible) used to encode phrases
+        model_name: Model name recorded in the phrase content hashes
+        encode_batch_size: Batch size passed to model.encode
+        tests_per_transaction: Tests encoded and written per bulk transaction
+        on_complete: Called after a job finishes successfully (e.g. cache invalidation)
+        max_history: Finished jobs kept for status lookups
+    """
+
+    def __init__(self, model, model_name: str, encode_batch_size: int = 128, tests_per_transaction: int = 200,
+                 on_complete: Optional[Callable[[EmbeddingJob], None]] = None, max_history: int = 50):
+        self.model = model
+        self.model_name = model_name
+        self.encode_batch_size = encode_batch_size
+        self.tests_per_transaction = tests_per_transaction
+        self.on_complete = on_complete
+        self.max_history = max_history
+        self._jobs: "OrderedDict[str, EmbeddingJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-job")
+
+    def submit(self, only_missing: bool = True) -> EmbeddingJob:
+        """Queue a new generation job and return it immediately"""
+        job = EmbeddingJob(only_missing=only_missing)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_history:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if oldest.status in ("queued", "running"):
+                    break
+                del self._jobs[oldest_id]
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[EmbeddingJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[EmbeddingJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _run(self, job: EmbeddingJob):
+        job.status = "running"
+        job.started_at = time.time()
+        db = get_db_session()
+        try:
+            tests = TestRepository.get_tests_for_embedding(db, only_missing=job.only_missing)
+            job.total_tests = len(tests)
+            job.total_phrases = sum(1 + len(t["synonyms"]) for t in tests)
+
+            for start in range(0, len(tests), self.tests_per_transaction):
+                batch = tests[start:start + self.tests_per_transaction]
+
+                # Name first, then synonyms - same row layout as per-test generation
+                phrases = []
+                for test in batch:
+                    phrases.append(test["name"])
+                    phrases.extend(test["synonyms"])
+
+                if EMBEDDING_STORAGE == "phrases":
+                    job.encoded_phrases += self._store_phrases(db, batch, phrases)
+                else:
+                    self._store_embeddings(db, batch, phrases)
+                    job.encoded_phrases += len(phrases)
+                job.processed_tests += len(batch)
+                job.processed_phrases += len(phrases)
+
+            if EMBEDDING_STORAGE == "phrases":
+                removed = PhraseRepository.delete_unreferenced(db)
+                if removed:
+                    print(f"Embedding job {job.id}: removed {removed} unreferenced phrases")
+
+            job.status = "completed"
+        except Exception as e:
+            db.rollback()
+            job.status = "failed"
+            job.error = str(e)
+            traceback.print_exc()
+        finally:
+            db.close()
+            job.finished_at = time.time()
+
+        print(f"Embedding job {job.id} {job.status}: {job.processed_tests}/{job.total_tests} tests")
+        if job.status == "completed" and self.on_complete:
+            self.on_complete(job)
+
+    def _store_phrases(self, db, batch: List[Dict[str, Any]], phrases: List[str]) -> int:
+        """Link a batch of tests to the shared phrase store, encoding only unknown phrases"""
+        phrase_ids, encoded = PhraseRepository.ensure_phrases(
+            db, phrases, self.model, self.model_name, batch_size=self.encode_batch_size
+        )
+        phrase_ids_by_id = {}
+        row = 0
+        for test in batch:
+            count = 1 + len(test["synonyms"])
+            phrase_ids_by_id[test["id"]] = phrase_ids[row:row + count]
+            row += count
+        TestRepository.bulk_update_test_phrases(db, phrase_ids_by_id)
+        return encoded
+
+    def _store_embeddings(self, db, batch: List[Dict[str, Any]], phrases: List[str]):
+        """Encode a batch of tests and store each test's own vectors"""
+        vectors = self.model.encode(phrases, batch_size=self.encode_batch_size)
+
+        embeddings_by_id = {}
+        hashes_by_id = {}
+        row = 0
+        for test in batch:
+            count = 1 + len(test["synonyms"])
+            embeddings_by_id[test["id"]] = vectors[row:row + count]
+            hashes_by_id[test["id"]] = [phrase_hash(p, self.model_name) for p in phrases[row:row + count]]
+            row += count
+
+        TestRepository.bulk_update_test_embeddings(db, embeddings_by_id, hashes_by_id)
@@ -0,0 +1,279 @@
+"""
+Aho-Corasick lexical index over test names and synonyms.
+
+Replaces the per-chunk `syn.lower() in norm` scan over the whole catalog with
+a precompiled multi-pattern automaton: one pass over the chunk reports every
+test whose name or synonym occurs in it as a substring, so the lexical gate
+costs O(len(chunk)) instead of O(catalog).
+
+Matching semantics are the same as the original scan: patterns are the
+lowercased names/synonyms, matched as plain substrings of the normalized text.
+
+The index also keeps a hash map from normalized patterns (utils.normalize_phrase:
+accents stripped, whitespace collapsed, like the chunks it is looked up with)
+to tests, so a chunk that *is* a name/synonym resolves with one dict lookup.
+"""
+
+import threading
+from typing import List, Dict, Any, Iterable, Optional, Set
+
+
+def _exact_key(pattern: str) -> str:
+    """Key of a name/synonym in the exact-phrase map"""
+    from utils import normalize_phrase  # utils imports this module
+    return normalize_phrase(pattern)
+
+
+class LexicalIndex:
+    """
+    Multi-pattern substring matcher mapping names/synonyms to test IDs.
+
+    Tests can be added or removed in place. New patterns are inserted into the
+    existing trie and removed patterns are just deactivated; the failure links
+    are recomputed lazily (one BFS over the trie) on the next search after a
+    change, instead of re-lowercasing and re-inserting the whole catalog.
+    Updates and searches are serialized by an internal lock, so the index can
+    be updated in place while requests are being served.
+    """
+
+    def __init__(self):
+        # Trie: node -> {char: child node}; node 0 is the root
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Pattern ending at each node (None if no active pattern ends there)
+        self._pattern_at: List[Optional[str]] = [None]
+        # Nearest node on the failure chain (excluding itself) where a pattern ends, 0 if none
+        self._out_link: List[int] = [0]
+        self._pattern_node: Dict[str, int] = {}
+        self._pattern_tests: Dict[str, Set[str]] = {}
+        self._test_patterns: Dict[str, Set[str]] = {}
+        self._test_names: Dict[str, str] = {}
+        # Normalized pattern (see _exact_key) -> test IDs, for exact phrase lookups
+        self._exact_tests: Dict[str, Set[str]] = {}
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_tests(cls, tests: List[Dict[str, Any]]) -> "LexicalIndex":
+        """
+        Build the index from test dictionaries with 'id', 'name' and 'synonyms' fields.
+
+        Args:
+            tests: List of test dictionaries
+
+        Returns:
+            LexicalIndex ready for searching
+        """
+        index = cls()
+        for test in tests:
+            index.add_test(test.get("id", test["name"]), test["name"], test.get("synonyms", []))
+        index._build_links()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._test_patterns)
+
+    @property
+    def pattern_count(self) -> int:
+        return len(self._pattern_tests)
+
+    # -----------------------------
+    # Incremental maintenance
+    # -----------------------------
+
+    def add_test(self, test_id: str, name: str, synonyms: Iterable[str]):
+        """
+        Add (or replace) a test's name and synonyms.
+
+        Args:
+            test_id: Test ID
+            name: Test name
+            synonyms: Test synonyms
+        """
+        patterns = {name.lower()} | {syn.lower() for syn in synonyms or []}
+
+        with self._lock:
+            if test_id in self._test_patterns:
+                self.remove_test(test_id)
+
+            self._test_patterns[test_id] = patterns
+            self._test_names[test_id] = name
+
+            for pattern in patterns:
+                self._exact_tests.setdefault(_exact_key(pattern), set()).add(test_id)
+                owners = self._pattern_tests.get(pattern)
+                if owners:
+                    owners.add(test_id)
+                    continue
+                self._pattern_tests[pattern] = {test_id}
+                self._insert(pattern)
+
+    def remove_test(self, test_id: str):
+        """
+        Remove a test's name and synonyms (no-op for unknown IDs).
+
+        Args:
+            test_id: Test ID
+        """
+        with self._lock:
+            patterns = self._test_patterns.pop(test_id, None)
+            self._test_names.pop(test_id, None)
+            if not patterns:
+                return
+
+            for pattern in patterns:
+                key = _exact_key(pattern)
+                exact = self._exact_tests.get(key)
+                if exact is not None:
+                    exact.discard(test_id)
+                    if not exact:
+                        del self._exact_tests[key]
+
+                owners = self._pattern_tests[pattern]
+                owners.discard(test_id)
+                if not owners:
+                    del self._pattern_tests[pattern]
+                    node = self._pattern_node.pop(pattern)
+                    if node:
+                        self._pattern_at[node] = None
+                        self._dirty = True
+
+    def _insert(self, pattern: str):
+        """Insert a pattern into the trie (links are rebuilt lazily)"""
+        if not pattern:
+            # The empty string is a substring of everything; handled in search()
+            self._pattern_node[pattern] = 0
+            return
+
+        node = 0
+        for ch in pattern:
+            child = self._goto[node].get(ch)
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._pattern_at.append(None)
+                self._out_link.append(0)
+                self._goto[node][ch] = child
+            node = child
+
+        self._pattern_at[node] = pattern
+        self._pattern_node[pattern] = node
+        self._dirty = True
+
+    def _build_links(self):
+        """Compute failure and output links with a BFS over the trie"""
+        goto, fail, pattern_at, out_link = self._goto, self._fail, self._pattern_at, self._out_link
+
+        queue = []
+        for child in goto[0].values():
+            fail[child] = 0
+            out_link[child] = 0
+            queue.append(child)
+
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, child in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                f = goto[f].get(ch, 0)
+                fail[child] = f
+                out_link[child] = f if pattern_at[f] is not None else out_link[f]
+                queue.append(child)
+
+        self._dirty = False
+
+    # -----------------------------
+    # Searching
+    # -----------------------------
+
+    def find_patterns(self, norm_text: str) -> Set[str]:
+        """
+        Find every indexed pattern occurring in the text in a single pass.
+
+        Args:
+            norm_text: Text already passed through normalize_text
+
+        Returns:
+            Set of matching (lowercased) names/synonyms
+        """
+        with self._lock:
+            if self._dirty:
+                self._build_links()
+
+            goto, fail, pattern_at, out_link = self._goto, self._fail, self._pattern_at, self._out_link
+            found = {""} if "" in self._pattern_tests else set()
+
+            node = 0
+            for ch in norm_text:
+                while node and ch not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(ch, 0)
+
+                hit = node if pattern_at[node] is not None else out_link[node]
+                while hit:
+                    found.add(pattern_at[hit])
+                    hit = out_link[hit]
+
+            return found
+
+    def find(self, norm_text: str) -> Set[str]:
+        """
+        Find the IDs of all tests whose name or a synonym occurs in the text.
+
+        Args:
+            norm_text: Text already passed through normalize_text
+
+        Returns:
+            Set of test IDs
+        """
+        with self._lock:
+            test_ids = set()
+            for pattern in self.find_patterns(norm_text):
+                test_ids |= self._pattern_tests[pattern]
+            return test_ids
+
+    def find_names(self, norm_text: str) -> List[str]:
+        """
+        Find the names of all matching tests, in catalog (name) order.
+
+        Args:
+            norm_text: Text already passed through normalize_text
+
+        Returns:
+            List of test names, one per matching test
+        """
+        with self._lock:
+            test_ids = sorted(self.find(norm_text), key=lambda t: (self._test_names[t], t))
+            return [self._test_names[t] for t in test_ids]
+
+    def find_exact(self, phrase: str) -> List[str]:
+        """
+        Find the tests having exactly this phrase as their name or a synonym.
+
+        Args:
+            phrase: Text already passed through utils.normalize_phrase
+
+        Returns:
+            List of test names in catalog (name) order; empty if none
+        """
+        with self._lock:
+            test_ids = self._exact_tests.get(phrase)
+            if not test_ids:
+                return []
+            return [self._test_names[t] for t in sorted(test_ids, key=lambda t: (self._test_names[t], t))]
+
+    def contains_any(self, norm_text: str) -> bool:
+        """
+        Check whether any indexed name or synonym occurs in the text.
+
+        Args:
+            norm_text: Text already passed through normalize_text
+
+        Returns:
+            True if at least one pattern matches
+        """
+        return bool(self.find_patterns(norm_text))
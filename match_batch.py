@@ -0,0 +1,173 @@
+"""
+Offline batch matching of archived transcripts (JSONL in, JSONL out).
+
+    python match_batch.py transcripts.jsonl -o results.jsonl [--threshold 0.75]
+        [--workers 4] [--batch-size 256] [--no-llm] [--snapshot embeddings.snapshot]
+
+Input lines are {"id": ..., "transcript": ...} objects or bare JSON strings.
+Output lines are {"id": ..., **/match_stream response body} in input order
+({"id": ..., "error": ...} for unreadable lines). Matching runs the server's
+pipeline and environment configuration (app.match_transcripts): the chunks of
+a whole batch of transcripts are encoded and scored together.
+
+With --workers N > 1, batches are spread over N processes. All of them map the
+same read-only embedding snapshot (--snapshot, EMBEDDING_SNAPSHOT_PATH, or a
+temporary one exported from the database), so the embedding matrix is shared
+through the page cache instead of being loaded by every process. Each worker
+loads its own encoder and gets an equal share of the CPU threads.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from utils import parse_batch_line
+
+# Per process: the app module (imported once the environment is configured) and its event loop
+_server = None
+_loop = None
+
+
+def _init_worker(snapshot_path=None, threads=None):
+    """Configure and import the matching pipeline in this process"""
+    global _server, _loop
+    if snapshot_path:
+        os.environ["EMBEDDING_SNAPSHOT_PATH"] = snapshot_path
+    if threads:
+        # Before torch/onnxruntime are imported, so workers do not oversubscribe the CPU
+        os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+        os.environ.setdefault("ONNX_THREADS", str(threads))
+    import app
+    if not snapshot_path:
+        # Matching reads the database directly: bring an older schema up to date first
+        app.init_db()
+    _server = app
+    # One loop for the whole run: the app's LLM semaphore binds to the loop it is first used on
+    _loop = asyncio.new_event_loop()
+
+
+def _match_batch(entries, threshold: float, use_llm: bool):
+    """Match a batch of (id, transcript, parse error) in this process"""
+    transcripts = [transcript for _, transcript, error in entries if error is None]
+    results = iter(_loop.run_until_complete(_server.match_transcripts(transcripts, threshold, use_llm)))
+    return [
+        {"id": item_id, "error": error} if error is not None else dict({"id": item_id}, **next(results))
+        for item_id, _, error in entries
+    ]
+
+
+def read_batches(path: str, batch_size: int):
+    """Read the input JSONL as lists of (id, transcript, parse error) of up to batch_size lines"""
+    batches, batch = [], []
+    with (sys.stdin if path == "-" else open(path, "r", encoding="utf-8")) as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item_id, transcript = parse_batch_line(line, line_no)
+                batch.append((item_id, transcript, None))
+            except ValueError as e:
+                batch.append((line_no, None, str(e)))
+            if len(batch) == batch_size:
+                batches.append(batch)
+                batch = []
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def prepare_snapshot(path: str) -> None:
+    """Export the catalog from the database to path unless an up-to-date snapshot is already there"""
+    from database import get_db_session, TestRepository
+    from embedding_snapshot import write_snapshot, read_snapshot_header
+
+    header = read_snapshot_header(path)
+    db = get_db_session()
+    try:
+        source = TestRepository.get_catalog_fingerprint(db)
+        if header is not None and header[1] == source:
+            return
+        tests = TestRepository.get_tests_with_embeddings(db)
+    finally:
+        db.close()
+    write_snapshot(path, tests, source=source)
+    print(f"Exported embedding snapshot: {len(tests)} tests -> {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Input JSONL ('-' for stdin)")
+    parser.add_argument("-o", "--output", required=True, help="Output JSONL")
+    parser.add_argument("--threshold", type=float, default=0.75, help="Embedding match threshold")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes")
+    parser.add_argument("--batch-size", type=int, default=256, help="Transcripts matched per embedding stage pass")
+    parser.add_argument("--no-llm", action="store_true",
+                        help="Skip the LLM fallback (undecided chunks get reason 'llm_disabled')")
+    parser.add_argument("--snapshot", default=None,
+                        help="Embedding snapshot shared by the workers (default: EMBEDDING_SNAPSHOT_PATH or a temporary file)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    batches = read_batches(args.input, args.batch_size)
+    total = sum(len(batch) for batch in batches)
+    print(f"Read {total} transcripts in {len(batches)} batches")
+
+    snapshot_path = args.snapshot or os.getenv("EMBEDDING_SNAPSHOT_PATH")
+    temp_dir = None
+    if args.workers > 1 and not snapshot_path:
+        temp_dir = tempfile.mkdtemp(prefix="match-batch-")
+        snapshot_path = os.path.join(temp_dir, "embeddings.snapshot")
+    if snapshot_path:
+        from database import init_db
+        # The export reads columns added by later schema versions: migrate an older database first
+        init_db()
+        prepare_snapshot(snapshot_path)
+
+    done = 0
+    chunk_count = 0
+    methods = Counter()
+    try:
+        with open(args.output, "w", encoding="utf-8") as out:
+            if args.workers > 1:
+                threads = max(1, (os.cpu_count() or 1) // args.workers)
+                pool = ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(snapshot_path, threads))
+                results = pool.map(_match_batch, batches, repeat(args.threshold), repeat(not args.no_llm))
+            else:
+                pool = None
+                _init_worker(snapshot_path)
+                results = (_match_batch(batch, args.threshold, not args.no_llm) for batch in batches)
+
+            try:
+                for outputs in results:
+                    for output in outputs:
+                        out.write(json.dumps(output) + "\n")
+                        for entry in output.get("trace", []):
+                            chunk_count += 1
+                            methods[entry["method"]] += 1
+                    done += len(outputs)
+                    elapsed = time.perf_counter() - started
+                    print(f"  {done}/{total} transcripts ({done / elapsed:.1f}/s)")
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - started
+    print(f"\nMatched {total} transcripts ({chunk_count} chunks) in {elapsed:.2f}s "
+          f"with {args.workers} worker(s): {total / elapsed:.1f} transcripts/s")
+    print("Chunks by method: " + ", ".join(f"{method} {count}" for method, count in methods.most_common()))
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,14 @@
 import json
 import sys
 import os
-from database import init_db, get_db_session, TestRepository, Test
-from sentence_transformers import SentenceTransformer
+from database import init_db, get_db_session, TestRepository, PhraseRepository, Test, engine
+from sqlalchemy.sql import text
+from encoders import load_encoder
 
 TESTS_JSON = "tests.json"
 TESTS_EMB_JSON = "tests_with_embeddings.json"
-MODEL_NAME = "all-mpnet-base-v2"
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2")
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch").lower()
 
 def migrate_json_to_sqlite(regenerate_embeddings: bool = False):
     """Migrate tests from JSON files to SQLite database"""
@@ -47,8 +49,8 @@ def migrate_json_to_sqlite(regenerate_embeddings: bool = False):
         # Import model for embeddings if needed
         model = None
         if regenerate_embeddings:
-            print(f"Loading embedding model {MODEL_NAME}...")
-            model = SentenceTransformer(MODEL_NAME)
+            print(f"Loading embedding model {MODEL_NAME} ({ENCODER_BACKEND})...")
+            model = load_encoder(MODEL_NAME, ENCODER_BACKEND, os.getenv("ONNX_MODEL_DIR"))
         
         # Migrate tests
         migrated = 0
@@ -73,24 +75,18 @@ def migrate_json_to_sqlite(regenerate_embeddings: bool = False):
                 }
                 
                 # Handle embeddings
-                if regenerate_embeddings and model:
-                    print(f"Generating embeddings for test {i}/{len(tests_data)}: {test_data['name']}")
-                    embeddings = []
-                    # Embed test name
-                    name_emb = model.encode(test_data["name"])
-                    embeddings.append(name_emb.tolist())
-                    # Embed synonyms
-                    for phrase in test_data["synonyms"]:
-                        emb = model.encode(phrase)
-                        embeddings.append(emb.tolist())
-                    test_data["embeddings"] = embeddings
-                elif test.get("embeddings"):
+                if not regenerate_embeddings and test.get("embeddings"):
                     test_data["embeddings"] = test["embeddings"]
                 else:
                     test_data["embeddings"] = []
                 
                 # Create test in database
-                TestRepository.create_test(db, test_data)
+                created = TestRepository.create_test(db, test_data)
+                
+                if regenerate_embeddings and model:
+                    print(f"Generating embeddings for test {i}/{len(tests_data)}: {test_data['name']}")
+                    # Embed test name first, then synonyms; phrases shared with earlier tests are reused
+                    TestRepository.regenerate_embeddings(db, created, model, MODEL_NAME)
                 migrated += 1
                 
                 if i % 100 == 0:
@@ -110,8 +106,47 @@ def migrate_json_to_sqlite(regenerate_embeddings: bool = False):
         db.close()
 
 
+def convert_embeddings_to_blob(dtype: str = "float32"):
+    """Convert JSON embeddings already in the database to packed BLOB storage"""
+    print("Initializing database...")
+    init_db()
+    
+    db = get_db_session()
+    try:
+        converted = TestRepository.migrate_embeddings_to_blob(db, dtype=dtype)
+        print(f"\nConversion complete: {converted} tests now use {dtype} BLOB storage")
+    finally:
+        db.close()
+    
+    # Reclaim the space freed by the JSON text
+    print("Compacting database file...")
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+    print("Done.")
+
+
+def prune_phrases():
+    """Delete phrase vectors no test references any more"""
+    print("Initializing database...")
+    init_db()
+    
+    db = get_db_session()
+    try:
+        removed = PhraseRepository.delete_unreferenced(db)
+        stats = PhraseRepository.get_stats(db)
+        print(f"Removed {removed} unreferenced phrases; "
+              f"{stats['phrases']} phrases shared by {stats['references']} test rows")
+    finally:
+        db.close()
+
+
 if __name__ == "__main__":
     import os
-    regenerate = "--regenerate" in sys.argv or "-r" in sys.argv
-    migrate_json_to_sqlite(regenerate_embeddings=regenerate)
+    if "--prune-phrases" in sys.argv:
+        prune_phrases()
+    elif "--to-blob" in sys.argv:
+        convert_embeddings_to_blob("float16" if "--float16" in sys.argv else "float32")
+    else:
+        regenerate = "--regenerate" in sys.argv or "-r" in sys.argv
+        migrate_json_to_sqlite(regenerate_embeddings=regenerate)
 
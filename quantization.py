@@ -0,0 +1,172 @@
+"""
+Quantized copies of the embedding matrix for low-memory scoring.
+
+The full float32 matrix (768-dim mpnet vectors for ~70k phrases) dominates
+resident memory. A QuantizedMatrix keeps a compact copy used for the scan:
+
+    "float16" - half precision, half the size; dot error <= 2^-11 per score
+    "int8"    - per-row scaled int8, a quarter of the size; dot error
+                <= 0.5 * row_scale * ||query||_1 per score
+
+Every approximate score comes with that error bound, so EmbeddingIndex can
+re-score in full precision exactly the tests whose upper bound reaches the
+match threshold, and threshold semantics stay identical to the exact scan.
+The full-precision rows are then only read for those few candidates, so they
+can live in a memory-mapped file (see spill_rows) instead of RAM.
+"""
+
+import os
+import tempfile
+import numpy as np
+from typing import Dict, Any, Optional, Sequence
+
+QUANTIZATION_KINDS = ("float16", "int8")
+
+# float16 has an 11-bit significand; unit vectors keep |dot| <= 1
+_FLOAT16_BOUND = 2.0 ** -11
+# Slack for float32 accumulation differences between the two paths
+_ACCUMULATION_SLACK = 1e-5
+
+
+class QuantizedMatrix:
+    """
+    Compact copy of a unit-normalized (rows, dim) matrix.
+
+    Attributes:
+        kind: "float16" or "int8"
+        data: float16 or int8 array (rows, dim)
+        scale: float32 array (rows,) of per-row int8 scales (None for float16)
+    """
+
+    def __init__(self, kind: str, data: np.ndarray, scale: Optional[np.ndarray] = None, block_rows: int = 8192):
+        self.kind = kind
+        self.data = data
+        self.scale = scale
+        self.block_rows = block_rows
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, kind: str, block_rows: int = 8192) -> "QuantizedMatrix":
+        """
+        Quantize a matrix block by block (never materializing a full float32 temporary).
+
+        Args:
+            matrix: Unit-normalized (rows, dim) float32 matrix (may be a memmap)
+            kind: "float16" or "int8"
+
+        Returns:
+            QuantizedMatrix
+
+        Raises:
+            ValueError: Unknown kind
+        """
+        if kind not in QUANTIZATION_KINDS:
+            raise ValueError(f"Unknown quantization '{kind}' (expected one of {', '.join(QUANTIZATION_KINDS)})")
+        rows = matrix.shape[0]
+        dim = matrix.shape[1] if matrix.ndim == 2 else 0
+
+        if kind == "float16":
+            data = np.empty((rows, dim), dtype=np.float16)
+            for start in range(0, rows, block_rows):
+                data[start:start + block_rows] = matrix[start:start + block_rows]
+            return cls(kind, data, block_rows=block_rows)
+
+        data = np.empty((rows, dim), dtype=np.int8)
+        scale = np.empty(rows, dtype=np.float32)
+        for start in range(0, rows, block_rows):
+            block = np.asarray(matrix[start:start + block_rows], dtype=np.float32)
+            block_scale = np.abs(block).max(axis=1) / 127.0
+            block_scale[block_scale == 0] = 1.0
+            data[start:start + block_rows] = np.rint(block / block_scale[:, None])
+            scale[start:start + block_rows] = block_scale
+        return cls(kind, data, scale, block_rows)
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def append(self, rows: np.ndarray) -> "QuantizedMatrix":
+        """Return a new QuantizedMatrix with extra unit-normalized rows appended"""
+        added = QuantizedMatrix.from_matrix(rows, self.kind, self.block_rows)
+        if len(self) == 0:
+            return added
+        data = np.concatenate([self.data, added.data], axis=0)
+        scale = np.concatenate([self.scale, added.scale]) if self.scale is not None else None
+        return QuantizedMatrix(self.kind, data, scale, self.block_rows)
+
+    def dot(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Approximate queries @ matrix.T.
+
+        Rows are widened to float32 one block at a time, so the scan runs on
+        BLAS with a bounded temporary instead of a full float32 copy.
+
+        Args:
+            queries: Unit-normalized (num_queries, dim) float32 queries
+
+        Returns:
+            float32 array (num_queries, rows)
+        """
+        out = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), self.block_rows):
+            block = self.data[start:start + self.block_rows].astype(np.float32)
+            out[:, start:start + self.block_rows] = queries @ block.T
+        if self.scale is not None:
+            out *= self.scale
+        return out
+
+    def error_bound(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Upper bound of |approximate - exact| score, per query and row.
+
+        Args:
+            queries: Unit-normalized (num_queries, dim) float32 queries
+
+        Returns:
+            float32 array broadcastable to (num_queries, rows)
+        """
+        if self.kind == "float16":
+            return np.full((queries.shape[0], 1), _FLOAT16_BOUND + _ACCUMULATION_SLACK, dtype=np.float32)
+        # Each element is off by at most half a quantization step
+        l1 = np.abs(queries).sum(axis=1, keepdims=True)
+        return (0.5 * l1 * self.scale[None, :] + _ACCUMULATION_SLACK).astype(np.float32)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "rows": len(self), "bytes": self.nbytes}
+
+
+def spill_rows(parts: Sequence[np.ndarray], directory: Optional[str] = None) -> np.ndarray:
+    """
+    Write float32 row blocks to a temporary file and map it read-only.
+
+    The file is unlinked right after mapping (where the OS allows it), so it
+    disappears with the last reference. Only the pages actually read count
+    towards resident memory, and the kernel can evict them under pressure.
+
+    Args:
+        parts: (n_i, dim) arrays written one after another
+        directory: Directory for the temporary file (default: system temp dir)
+
+    Returns:
+        Read-only np.memmap of shape (sum n_i, dim)
+    """
+    parts = [np.ascontiguousarray(p, dtype="<f4") for p in parts if len(p)]
+    if not parts:
+        return np.zeros((0, 0), dtype=np.float32)
+    rows = sum(p.shape[0] for p in parts)
+    dim = parts[0].shape[1]
+
+    fd, path = tempfile.mkstemp(prefix=".embeddings-", suffix=".f32", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for part in parts:
+                f.write(memoryview(part).cast("B"))
+        matrix = np.memmap(path, dtype="<f4", mode="r", shape=(rows, dim))
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # e.g. Windows keeps mapped files; left in the temp dir
+    return matrix
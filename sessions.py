@@ -0,0 +1,145 @@
+"""
+Per-connection transcript state for the streaming session endpoint.
+
+A MatchSession accumulates the trace entries of every processed fragment and
+the merged result (detected and removed tests), so each new fragment is
+matched on its own and only the resulting change is sent to the client
+instead of the whole transcript being re-processed.
+"""
+
+import json
+import math
+from typing import List, Dict, Any, Optional, Union
+
+from utils import merge_trace_entry
+
+SESSION_MESSAGE_TYPES = ("text", "summary", "reset")
+
+
+def parse_session_message(raw: Union[str, bytes, None]) -> Dict[str, Any]:
+    """
+    Parse and validate one client message of a streaming session.
+
+    Args:
+        raw: The WebSocket frame's text (or bytes)
+
+    Returns:
+        {"type", "text", "threshold"}; text is stripped ("" if absent) and
+        threshold is a float or None (keep the session's threshold)
+
+    Raises:
+        ValueError: If the frame is not a JSON object, the type is unknown,
+            or text/threshold have the wrong type
+
+    Example:
+        >>> parse_session_message('{"type": "text", "text": " Check CBC ", "threshold": 0.8}')
+        {"type": "text", "text": "Check CBC", "threshold": 0.8}
+    """
+    if raw is None:
+        raise ValueError("empty frame")
+    try:
+        message = json.loads(raw)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"invalid JSON: {e}")
+    if not isinstance(message, dict):
+        raise ValueError("messages must be JSON objects")
+
+    kind = message.get("type", "text")
+    if kind not in SESSION_MESSAGE_TYPES:
+        raise ValueError(f"Unknown message type: {kind}")
+
+    text = message.get("text")
+    if text is not None and not isinstance(text, str):
+        raise ValueError('"text" must be a string')
+
+    threshold = message.get("threshold")
+    if threshold is not None:
+        if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or not math.isfinite(threshold):
+            raise ValueError('"threshold" must be a number')
+        threshold = float(threshold)
+
+    return {"type": kind, "text": (text or "").strip(), "threshold": threshold}
+
+
+class MatchSession:
+    """
+    Transcript state of one streaming session.
+
+    Entries are merged with merge_trace_entry in arrival order, the same
+    order /match_stream uses within one transcript, so a negation removes
+    tests detected earlier in the session and blocks later detections.
+
+    Attributes:
+        threshold: Embedding match threshold used for new fragments
+        fragments: Processed transcript fragments, in order
+        trace: Trace entries of all processed chunks, in order
+        seq: Number of deltas produced so far
+    """
+
+    def __init__(self, threshold: float = 0.75):
+        self.threshold = threshold
+        self.fragments: List[str] = []
+        self.trace: List[Dict[str, Any]] = []
+        self.seq = 0
+        self._matches: Dict[str, Dict[str, Any]] = {}
+        self._removed: set = set()
+
+    def apply(self, fragment: str, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Merge the trace entries of a newly processed fragment.
+
+        Args:
+            fragment: The fragment's transcript text
+            entries: Its trace entries, in transcript order
+
+        Returns:
+            Delta event: the new trace entries and the tests added, updated
+            (method/score changed) or removed by them
+        """
+        before = {name: dict(meta) for name, meta in self._matches.items()}
+        removed_before = set(self._removed)
+        for entry in entries:
+            merge_trace_entry(entry, self._matches, self._removed)
+        self.fragments.append(fragment)
+        self.trace.extend(entries)
+        self.seq += 1
+
+        return {
+            "type": "delta",
+            "seq": self.seq,
+            "fragment": fragment,
+            "trace": entries,
+            "added": [self._detected(name) for name in sorted(self._matches) if name not in before],
+            "updated": [self._detected(name) for name in sorted(self._matches)
+                        if name in before and before[name] != self._matches[name]],
+            "removed": sorted(name for name in before if name not in self._matches),
+            "removed_tests": sorted(self._removed - removed_before),
+        }
+
+    def _detected(self, name: str) -> Dict[str, Any]:
+        metadata = self._matches[name]
+        detected = {"name": name, "method": metadata["method"], "score": metadata["score"]}
+        if "tier" in metadata:
+            detected["tier"] = metadata["tier"]
+        return detected
+
+    def summary(self, transcript: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Full result in the /match_stream response format.
+
+        Args:
+            transcript: Transcript to report (default: the fragments joined by spaces)
+        """
+        return {
+            "transcript": transcript if transcript is not None else " ".join(self.fragments),
+            "detected_tests": [self._detected(name) for name in sorted(self._matches)],
+            "removed_tests": sorted(self._removed),
+            "trace": self.trace,
+        }
+
+    def reset(self):
+        """Forget all fragments and results"""
+        self.fragments = []
+        self.trace = []
+        self._matches = {}
+        self._removed = set()
@@ -25,6 +25,12 @@ class SpeechRecognitionApp {
         this.allDetectedTests = new Set();
         this.matchThreshold = 0.75; // Default threshold (75%)
 
+        // Streaming match session (/ws/session); falls back to POST /match_stream
+        this.matchSocket = null;
+        this.matchSocketReady = null;
+        this.pendingFragments = 0;
+        this.awaitingReset = false;
+
         this.initializeElements();
         this.setupEventListeners();
         this.loadConfig();
@@ -727,6 +733,11 @@ class SpeechRecognitionApp {
         this.allDetectedTests.clear();
         this.clearTestResults();
         this.chunkQueue = [];
+        if (this.matchSocket && this.matchSocket.readyState === WebSocket.OPEN) {
+            // Deltas for fragments still in flight are dropped until the server confirms the reset
+            this.awaitingReset = true;
+            this.matchSocket.send(JSON.stringify({ type: 'reset' }));
+        }
     }
 
     updateStatus(message, type = 'info') {
@@ -820,7 +831,7 @@ class SpeechRecognitionApp {
     async processChunkQueue() {
         if (this.chunkQueue.length === 0) {
             this.processingChunks = false;
-            if (this.processingStatus) {
+            if (this.processingStatus && this.pendingFragments === 0) {
                 this.processingStatus.classList.add('hidden');
             }
             return;
@@ -829,45 +840,50 @@ class SpeechRecognitionApp {
         const chunks = [...this.chunkQueue];
         this.chunkQueue = [];
 
-        try {
-            // Process all chunks in parallel
-            const promises = chunks.map(chunk => this.callMatchAPI(chunk));
-            const results = await Promise.all(promises);
-
-            // Merge new detections and handle removals
-            results.forEach(result => {
-                if (result) {
-                    // Add newly detected tests with metadata
-                    if (result.detected_tests) {
-                        result.detected_tests.forEach(test => {
-                            // Store test with metadata (name, method, score)
-                            const existingTest = Array.from(this.allDetectedTests).find(t => t.name === test.name);
-                            if (!existingTest) {
-                                this.allDetectedTests.add(test);
-                            } else if (test.score && (!existingTest.score || test.score > existingTest.score)) {
-                                // Update if new score is higher
-                                this.allDetectedTests.delete(existingTest);
-                                this.allDetectedTests.add(test);
-                            }
-                        });
-                    }
-                    // Remove negated/cancelled tests
-                    if (result.removed_tests) {
-                        result.removed_tests.forEach(testName => {
-                            const testToRemove = Array.from(this.allDetectedTests).find(t => t.name === testName);
-                            if (testToRemove) {
-                                this.allDetectedTests.delete(testToRemove);
-                            }
-                        });
+        if (await this.connectMatchSession()) {
+            // The session matches each new fragment once and pushes back only what changed
+            chunks.forEach(chunk => this.sendSessionFragment(chunk));
+        } else {
+            try {
+                // Process all chunks in parallel
+                const promises = chunks.map(chunk => this.callMatchAPI(chunk));
+                const results = await Promise.all(promises);
+
+                // Merge new detections and handle removals
+                results.forEach(result => {
+                    if (result) {
+                        // Add newly detected tests with metadata
+                        if (result.detected_tests) {
+                            result.detected_tests.forEach(test => {
+                                // Store test with metadata (name, method, score)
+                                const existingTest = Array.from(this.allDetectedTests).find(t => t.name === test.name);
+                                if (!existingTest) {
+                                    this.allDetectedTests.add(test);
+                                } else if (test.score && (!existingTest.score || test.score > existingTest.score)) {
+                                    // Update if new score is higher
+                                    this.allDetectedTests.delete(existingTest);
+                                    this.allDetectedTests.add(test);
+                                }
+                            });
+                        }
+                        // Remove negated/cancelled tests
+                        if (result.removed_tests) {
+                            result.removed_tests.forEach(testName => {
+                                const testToRemove = Array.from(this.allDetectedTests).find(t => t.name === testName);
+                                if (testToRemove) {
+                                    this.allDetectedTests.delete(testToRemove);
+                                }
+                            });
+                        }
                     }
-                }
-            });
+                });
 
-            // Update display with all accumulated tests
-            this.updateTestResults(Array.from(this.allDetectedTests));
+                // Update display with all accumulated tests
+                this.updateTestResults(Array.from(this.allDetectedTests));
 
-        } catch (error) {
-            console.error('Error processing speech chunks:', error);
+            } catch (error) {
+                console.error('Error processing speech chunks:', error);
+            }
         }
 
         // Continue processing remaining chunks
@@ -876,6 +892,86 @@ class SpeechRecognitionApp {
         }, 100);
     }
 
+    connectMatchSession() {
+        if (this.matchSocket && this.matchSocket.readyState === WebSocket.OPEN) {
+            return Promise.resolve(true);
+        }
+        if (this.matchSocketReady) {
+            return this.matchSocketReady;
+        }
+
+        this.matchSocketReady = new Promise(resolve => {
+            let socket;
+            try {
+                const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+                socket = new WebSocket(`${protocol}//${window.location.host}/ws/session`);
+            } catch (error) {
+                console.error('Match session unavailable, using /match_stream:', error);
+                this.matchSocketReady = null;
+                resolve(false);
+                return;
+            }
+
+            socket.onopen = () => {
+                this.matchSocket = socket;
+                this.matchSocketReady = null;
+                resolve(true);
+            };
+            socket.onmessage = (event) => this.handleSessionEvent(JSON.parse(event.data));
+            socket.onerror = (error) => console.error('Match session error:', error);
+            socket.onclose = () => {
+                if (this.matchSocket === socket) {
+                    this.matchSocket = null;
+                } else {
+                    // Never opened: let the caller fall back to the HTTP endpoint
+                    this.matchSocketReady = null;
+                    resolve(false);
+                }
+                this.pendingFragments = 0;
+                this.awaitingReset = false;
+            };
+        });
+        return this.matchSocketReady;
+    }
+
+    sendSessionFragment(text) {
+        this.pendingFragments++;
+        this.matchSocket.send(JSON.stringify({
+            type: 'text',
+            text,
+            threshold: this.matchThreshold
+        }));
+    }
+
+    handleSessionEvent(event) {
+        if (event.type === 'reset') {
+            this.awaitingReset = false;
+            return;
+        }
+        if (event.type !== 'delta' && event.type !== 'error') {
+            return;
+        }
+
+        this.pendingFragments = Math.max(0, this.pendingFragments - 1);
+        if (event.type === 'error') {
+            console.error('Match session error for fragment:', event.fragment, event.detail || event.error);
+        } else if (!this.awaitingReset) {
+            this.applySessionDelta(event);
+        }
+        if (this.pendingFragments === 0 && !this.processingChunks && this.processingStatus) {
+            this.processingStatus.classList.add('hidden');
+        }
+    }
+
+    applySessionDelta(delta) {
+        console.log('Session delta:', delta);
+        const byName = new Map(Array.from(this.allDetectedTests).map(test => [test.name, test]));
+        delta.removed.forEach(name => byName.delete(name));
+        [...delta.added, ...delta.updated].forEach(test => byName.set(test.name, test));
+        this.allDetectedTests = new Set(byName.values());
+        this.updateTestResults(Array.from(this.allDetectedTests));
+    }
+
     async callMatchAPI(transcript) {
         try {
             console.log('Calling match API with:', transcript, 'threshold:', this.matchThreshold);
@@ -928,7 +1024,9 @@ class SpeechRecognitionApp {
             const category = test ? test.category : 'unknown';
 
             // Format method badge
-            const methodBadge = method === 'embedding' ?
+            const methodBadge = method === 'exact' ?
+                `<span class="method-badge exact">Exact</span>` :
+                method === 'embedding' ?
                 `<span class="method-badge embedding">Embedding</span>` :
                 `<span class="method-badge llm">LLM</span>`;
 
@@ -964,6 +1062,33 @@ class SpeechRecognitionApp {
         `;
     }
 
+    async waitForEmbeddingJob(jobId) {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+
+            const response = await fetch(`/generate_embeddings/jobs/${jobId}`);
+            if (!response.ok) {
+                throw new Error('Lost track of embedding generation job');
+            }
+            const job = await response.json();
+
+            if (job.status === 'completed') {
+                return { message: `Embeddings generated for ${job.processed_tests} tests` };
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'Embedding generation failed');
+            }
+
+            // Show progress while the job runs
+            const percent = Math.round(job.progress * 100);
+            const eta = job.eta_seconds != null ? `, ~${Math.ceil(job.eta_seconds)}s left` : '';
+            this.embeddingsStatus.classList.remove('hidden');
+            this.embeddingsStatus.innerHTML = `
+                <span>Generating embeddings: ${job.processed_tests}/${job.total_tests} tests (${percent}%${eta})</span>
+            `;
+        }
+    }
+
     async generateEmbeddings() {
         if (!this.generateEmbeddingsBtn || !this.embeddingsStatus) return;
 
@@ -988,7 +1113,12 @@ class SpeechRecognitionApp {
             });
 
             if (response.ok) {
-                const result = await response.json();
+                let result = await response.json();
+
+                // Bulk generation runs as a background job - poll until it finishes
+                if (result.job_id) {
+                    result = await this.waitForEmbeddingJob(result.job_id);
+                }
 
                 // Show success message
                 this.embeddingsStatus.classList.remove('hidden');
@@ -0,0 +1,59 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+# database.py reads DATABASE_URL at import: tests that touch it get a throwaway SQLite file
+_db_dir = tempfile.mkdtemp(prefix="medtest-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'tests.db')}"
+atexit.register(shutil.rmtree, _db_dir, ignore_errors=True)
+
+# app.py builds its OpenAI client at import and preloads the model at startup: tests need neither
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("MODEL_PRELOAD", "0")
+
+
+@pytest.fixture
+def db():
+    """Session on an emptied database (tests, phrases and cached LLM decisions)"""
+    from database import init_db, get_db_session, Test, Phrase, LLMDecision
+    init_db()
+    session = get_db_session()
+    for model in (Test, Phrase, LLMDecision):
+        session.query(model).delete()
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def add_test(db):
+    """Factory inserting a test with vectors for its name and synonyms
+
+    With an encoder, the rows go through the phrase store (as with
+    EMBEDDING_STORAGE=phrases) and the phrase ids are returned; otherwise the
+    test gets distinct unit vectors in its own packed BLOB.
+    """
+    from database import Test, TestRepository, PhraseRepository
+
+    def add(test_id, name, synonyms=(), encoder=None, model_name="test-model"):
+        phrases = [name] + list(synonyms)
+        if encoder is None:
+            TestRepository.create_test(db, {
+                "id": test_id, "name": name, "category": "Lab", "synonyms": list(synonyms),
+                "embeddings": np.eye(len(phrases), 4, dtype=np.float32).tolist(),
+            })
+            return None
+        ids, _ = PhraseRepository.ensure_phrases(db, phrases, encoder, model_name)
+        test = Test(id=test_id, name=name, category="Lab", synonyms=list(synonyms))
+        test.set_phrase_ids(ids)
+        db.add(test)
+        db.commit()
+        return ids
+
+    return add
@@ -0,0 +1,48 @@
+import numpy as np
+
+from ann_index import IVFBackend, build_ann_backend
+from embedding_index import EmbeddingIndex, normalize_rows
+
+DIM = 8
+
+
+def unit_rows(count, seed=0):
+    return normalize_rows(np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32))
+
+
+def make_index(count=30, seed=0):
+    vectors = unit_rows(count, seed)
+    tests = [{"id": f"t{i}", "name": f"Test {i:02d}", "embeddings": [vectors[i].tolist()]} for i in range(count)]
+    return EmbeddingIndex.from_tests(tests)
+
+
+def test_ivf_nlist_is_clamped_to_sample():
+    backend = IVFBackend(unit_rows(200), nlist=50, sample_size=20)
+    assert backend.nlist == 20
+    queries = unit_rows(3, seed=1)
+    assert all(len(rows) == 5 for rows in backend.search(unit_rows(200), queries, 5))
+
+
+def test_topk_skips_tests_the_ann_search_missed():
+    index = make_index()
+    index.attach_ann(build_ann_backend("ivf", index.matrix, nlist=10, nprobe=1), candidates=3)
+    query = unit_rows(1, seed=2)
+    scores = index.score_many(query)[0]
+    retrieved = np.isfinite(scores)
+    assert 0 < retrieved.sum() < len(index)
+
+    names = index.topk(None, top_k=len(index), scores=scores)
+    assert sorted(names) == sorted(np.array(index.names)[retrieved])
+    assert index.topk(None, top_k=2, scores=scores) == names[:2]
+    assert index.topk(None, top_k=5, scores=np.full(len(index), -np.inf, dtype=np.float32)) == []
+
+
+def test_upsert_appends_rows_to_shared_backend():
+    index = make_index()
+    index.attach_ann(build_ann_backend("ivf", index.matrix, nlist=4, nprobe=4), candidates=100)
+    vector = unit_rows(1, seed=3)[0]
+    updated = index.upsert("new", "Test 99", [vector.tolist()])
+    assert updated.ann is index.ann and index.ann.size == index.matrix.shape[0] + 1
+    # The original index never returns the appended row
+    assert "Test 99" not in index.topk(vector, top_k=len(index))
+    assert updated.topk(vector, top_k=1) == ["Test 99"]
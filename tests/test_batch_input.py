@@ -0,0 +1,36 @@
+import pytest
+
+from utils import parse_batch_line
+
+
+def test_object_with_id():
+    assert parse_batch_line('{"id": "visit-7", "transcript": "Check CBC"}', 1) == ("visit-7", "Check CBC")
+
+
+def test_object_without_id_uses_line_number():
+    assert parse_batch_line('{"transcript": "Check CBC", "extra": 1}\n', 12) == (12, "Check CBC")
+
+
+def test_bare_string():
+    assert parse_batch_line('"Check CBC and RBS"', 3) == (3, "Check CBC and RBS")
+
+
+def test_empty_transcript_is_accepted():
+    assert parse_batch_line('{"id": 1, "transcript": ""}', 1) == (1, "")
+
+
+@pytest.mark.parametrize("line", [
+    "",
+    "Check CBC",
+    '{"id": 1, "transcript": "Check CBC"',
+    '{"id": 1}',
+    '{"id": 1, "transcript": null}',
+    '{"id": 1, "transcript": ["Check CBC"]}',
+    '{"id": 1, "text": "Check CBC"}',
+    "[\"Check CBC\"]",
+    "42",
+    "null",
+])
+def test_malformed_lines_raise_value_error(line):
+    with pytest.raises(ValueError):
+        parse_batch_line(line, 1)
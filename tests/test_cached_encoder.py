@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from encoders import CachedEncoder
+
+DIM = 4
+ROW_BYTES = DIM * 4
+
+
+class CountingModel:
+    """Encodes a text as [len, first char code, ...], recording every encode call"""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        return np.stack([np.array([len(t), ord(t[0]), 0, 1], dtype=np.float32) for t in texts])
+
+
+def cached(**limits):
+    model = CountingModel()
+    return CachedEncoder(model, **limits), model
+
+
+def test_hits_and_misses_are_counted():
+    encoder, model = cached()
+    encoder.encode(["check CBC", "do RFT"])
+    encoder.encode(["Check cbc", "do LFT"])  # same normalized key as "check CBC"
+    assert model.calls == [["check CBC", "do RFT"], ["do LFT"]]
+    stats = encoder.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 3, 3)
+    assert stats["hit_ratio"] == 0.25
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    encoder, model = cached(max_entries=2)
+    encoder.encode(["a", "b"])
+    encoder.encode("a")  # "a" becomes most recently used
+    encoder.encode("c")  # evicts "b"
+    assert encoder.stats()["evictions"] == 1
+    encoder.encode(["a", "c"])
+    assert model.calls[-1] == ["c"]
+    encoder.encode("b")
+    assert model.calls[-1] == ["b"]
+
+
+def test_byte_cap_evicts_before_entry_cap():
+    encoder, _ = cached(max_entries=100, max_bytes=2 * ROW_BYTES)
+    encoder.encode(["a", "b", "c"])
+    stats = encoder.stats()
+    assert stats["entries"] == 2 and stats["bytes"] == 2 * ROW_BYTES
+    assert stats["evictions"] == 1
+
+
+def test_duplicates_in_one_batch_are_encoded_once():
+    encoder, model = cached()
+    out = encoder.encode(["CBC", "cbc", "RFT", "CBC"])
+    assert model.calls == [["CBC", "RFT"]]
+    assert out.shape == (4, DIM)
+    np.testing.assert_array_equal(out[0], out[1])
+    np.testing.assert_array_equal(out[0], out[3])
+    assert encoder.stats()["misses"] == 2
+
+
+def test_return_shapes_match_sentence_transformers():
+    encoder, _ = cached()
+    single = encoder.encode("CBC")
+    assert single.shape == (DIM,) and single.dtype == np.float32
+    assert encoder.encode(["CBC"]).shape == (1, DIM)
+    assert encoder.encode([]).shape == (0, 0)
+    # Cached vectors are shared between callers, so they are read-only
+    with pytest.raises(ValueError):
+        single[0] = 1.0
+
+
+def test_clear_keeps_counters():
+    encoder, model = cached()
+    encoder.encode("CBC")
+    encoder.clear()
+    encoder.encode("CBC")
+    assert len(model.calls) == 2
+    assert encoder.stats()["misses"] == 2 and encoder.stats()["entries"] == 1
@@ -0,0 +1,145 @@
+import time
+
+import numpy as np
+import pytest
+
+from embedding_index import EmbeddingIndex
+from utils import embedding_match_cascade, merge_trace_entry
+
+BAND = (0.5, 0.8)
+
+
+class FakeEncoder:
+    """Encoder with fixed vectors per text, recording what it was asked to encode"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        return np.stack([np.asarray(self.vectors[t.lower()], dtype=np.float32) for t in texts])
+
+
+def angle(degrees, dim=2):
+    v = np.zeros(dim, dtype=np.float32)
+    v[0], v[1] = np.cos(np.radians(degrees)), np.sin(np.radians(degrees))
+    return v
+
+
+# Catalog: CBC along x, RBS along y. The main model sees the same geometry in 3 dimensions,
+# rotated by 10 degrees, so both tiers give different scores for the same chunk.
+FAST = FakeEncoder({"clear cbc": angle(0), "between": angle(45), "nothing": angle(180), "cbc": angle(0), "rbs": angle(90)})
+MAIN_VECTORS = {"clear cbc": angle(10, 3), "between": angle(45, 3), "nothing": angle(180, 3),
+                "cbc": angle(0, 3), "rbs": angle(90, 3)}
+
+
+def indexes(fast=FAST):
+    tests = [{"id": "cbc", "name": "CBC"}, {"id": "rbs", "name": "RBS"}]
+    index = EmbeddingIndex.from_tests([dict(t, embeddings=[MAIN_VECTORS[t["id"]]]) for t in tests])
+    fast_index = EmbeddingIndex.from_tests([dict(t, embeddings=[fast.vectors[t["id"]]]) for t in tests])
+    return tests, index, fast_index
+
+
+def cascade(texts, threshold=0.75):
+    main, fast = FakeEncoder(MAIN_VECTORS), FakeEncoder(FAST.vectors)
+    tests, index, fast_index = indexes(fast)
+    matches, embs, tiers = embedding_match_cascade(texts, tests, main, fast, index, fast_index,
+                                                   threshold=threshold, band=BAND)
+    return matches, embs, tiers, main, fast
+
+
+def test_clear_chunk_is_decided_by_fast_tier_with_tagged_scores():
+    matches, embs, tiers, main, _ = cascade(["clear cbc"])
+    assert tiers == ["fast"]
+    assert matches == [[{"name": "CBC", "score": 1.0, "tier": "fast"}]]
+    assert embs == [None]
+    assert main.calls == []
+
+
+def test_band_and_unmatched_chunks_escalate_to_main_model():
+    matches, embs, tiers, main, _ = cascade(["between", "nothing"])
+    assert tiers == ["full", "full"]
+    # 0.707 for both tests is inside the band; the main model's scores are reported, untagged
+    assert matches == [[], []]
+    assert main.calls == [["between", "nothing"]]
+    np.testing.assert_allclose(embs[0], MAIN_VECTORS["between"])
+    np.testing.assert_allclose(embs[1], MAIN_VECTORS["nothing"])
+
+
+def test_threshold_outside_band_bypasses_fast_tier():
+    matches, embs, tiers, main, fast = cascade(["clear cbc", "between"], threshold=0.9)
+    assert fast.calls == []
+    assert tiers == ["full", "full"]
+    assert matches[0] == [{"name": "CBC", "score": round(float(np.cos(np.radians(10))), 3)}]
+    assert main.calls == [["clear cbc", "between"]]
+
+
+def test_mixed_batch_keeps_results_aligned():
+    texts = ["between", "clear cbc", "nothing", "clear cbc"]
+    matches, embs, tiers, main, _ = cascade(texts, threshold=0.6)
+    assert tiers == ["full", "fast", "full", "fast"]
+    assert [e is None for e in embs] == [False, True, False, True]
+    assert main.calls == [["between", "nothing"]]
+    assert [m["name"] for m in matches[0]] == ["CBC", "RBS"]
+    assert matches[1] == matches[3] == [{"name": "CBC", "score": 1.0, "tier": "fast"}]
+    assert matches[2] == []
+
+
+def merged(*entries):
+    matches = {}
+    for entry in entries:
+        merge_trace_entry(entry, matches, set())
+    return matches
+
+
+def embedding(name, score, tier=None):
+    match = {"name": name, "score": score}
+    if tier:
+        match["tier"] = tier
+    return {"chunk": name, "method": "embedding", "matches": [match]}
+
+
+def test_main_model_score_takes_precedence_over_fast_score():
+    assert merged(embedding("CBC", 0.95, "fast"), embedding("CBC", 0.8)) == \
+        {"CBC": {"method": "embedding", "score": 0.8}}
+    assert merged(embedding("CBC", 0.8), embedding("CBC", 0.95, "fast")) == \
+        {"CBC": {"method": "embedding", "score": 0.8}}
+    assert merged(embedding("CBC", 0.85, "fast"), embedding("CBC", 0.9, "fast")) == \
+        {"CBC": {"method": "embedding", "score": 0.9, "tier": "fast"}}
+
+
+@pytest.fixture
+def app_module(monkeypatch):
+    import app
+    from encoders import LazyEncoder
+    fast = LazyEncoder(lambda: FakeEncoder(FAST.vectors))
+    monkeypatch.setattr(app, "CASCADE_MODEL", "fake-fast-model")
+    monkeypatch.setattr(app, "fast_model", fast)
+    return app
+
+
+def test_cascade_index_is_built_in_background(app_module, db):
+    from catalog import Catalog
+    tests, index, _ = indexes()
+    catalog = Catalog(tests, index)
+
+    # Model not loaded yet: requests go to the main model while it loads
+    assert app_module._cascade_index(catalog) is None
+    assert app_module.fast_model.wait(5)
+
+    # Model ready: the index is built in a background thread, never by the request
+    assert app_module._cascade_index(catalog) is None
+    deadline = time.time() + 5
+    while catalog.fast_index is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert catalog.fast_index is not None and catalog.fast_index.names == ["CBC", "RBS"]
+    assert app_module._cascade_index(catalog) is catalog.fast_index
+
+
+def test_cascade_disabled_without_model(app_module, monkeypatch):
+    from catalog import Catalog
+    monkeypatch.setattr(app_module, "CASCADE_MODEL", "")
+    tests, index, _ = indexes()
+    assert app_module._cascade_index(Catalog(tests, index)) is None
+    assert not app_module.fast_model.loading and not app_module.fast_model.ready
@@ -0,0 +1,52 @@
+import pytest
+
+from lexical_index import LexicalIndex
+from utils import classify_chunk
+
+TESTS = [
+    {"id": "cbc", "name": "CBC", "synonyms": ["complete blood count", "hemogram"]},
+    {"id": "lft", "name": "LFT", "synonyms": ["liver function test"]},
+    {"id": "bp", "name": "BP monitoring", "synonyms": ["blood pressure"]},
+    {"id": "cafe", "name": "Café test", "synonyms": ["Crème  Panel"]},
+]
+
+
+@pytest.fixture(params=["index", "scan"])
+def classify(request):
+    index = LexicalIndex.from_tests(TESTS) if request.param == "index" else None
+    return lambda chunk: classify_chunk(chunk, TESTS, index)
+
+
+def exact(chunk, *names):
+    return {"chunk": chunk, "method": "exact", "matches": [{"name": name, "score": 1.0} for name in names]}
+
+
+@pytest.mark.parametrize("chunk, name", [
+    ("CBC", "CBC"),
+    ("Hemogram.", "CBC"),
+    ("Complete   Blood Count", "CBC"),
+    ("Check CBC test", "CBC"),  # order filler stripped on both sides
+    ("do the liver function test", None),  # "the" is not filler: goes on to embeddings
+    ("liver function test", "LFT"),  # a synonym ending in "test" matches as-is first
+    ("Café test", "Café test"),
+    ("check cafe test", "Café test"),  # accents are ignored on both sides
+    ("crème panel", "Café test"),
+])
+def test_exact_chunks(classify, chunk, name):
+    assert classify(chunk) == (exact(chunk, name) if name else None)
+
+
+def test_negation_gate_comes_first(classify):
+    assert classify("Don't do CBC") == {"chunk": "Don't do CBC", "method": "negation", "removed_tests": ["CBC"]}
+    assert classify("skip it") == {"chunk": "skip it", "method": "skipped", "reason": "negation_no_test"}
+
+
+def test_symptom_gate_comes_before_exact(classify):
+    # "blood pressure" is a synonym, but "pressure" marks it as a symptom description
+    assert classify("blood pressure") == {"chunk": "blood pressure", "method": "skipped", "reason": "symptom_not_test"}
+
+
+def test_intent_gate_after_exact(classify):
+    assert classify("the weather is nice") == {"chunk": "the weather is nice", "method": "skipped", "reason": "no_intent"}
+    assert classify("please check") == {"chunk": "please check", "method": "skipped", "reason": "action_without_test"}
+    assert classify("check the CBC levels") is None
@@ -0,0 +1,158 @@
+import numpy as np
+import pytest
+
+from embedding_index import EmbeddingIndex
+
+DIM = 16
+
+
+def make_tests(seed=0, count=12, shared=True):
+    """Tests with random phrase vectors; with shared=True some phrase ids appear in several tests"""
+    rnd = np.random.default_rng(seed)
+    phrases = {pid: rnd.normal(size=DIM).astype(np.float32) for pid in range(40)}
+    tests = []
+    for t in range(count):
+        own = [100 + 10 * t + k for k in range(rnd.integers(1, 4))]
+        common = [int(p) for p in rnd.choice(8, size=2, replace=False)] if shared and t % 2 == 0 else []
+        pids = own + common
+        for pid in own:
+            phrases.setdefault(pid, rnd.normal(size=DIM).astype(np.float32))
+        tests.append({
+            "id": f"t{t}", "name": f"Test {t:02d}",
+            "embeddings": [phrases[pid].tolist() for pid in pids], "phrase_ids": pids,
+        })
+    return tests, phrases
+
+
+def queries(seed=1, count=20):
+    return np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32)
+
+
+def assert_same_index(index, tests):
+    rebuilt = EmbeddingIndex.from_tests(sorted(tests, key=lambda t: (t["name"], t["id"])))
+    assert index.ids == rebuilt.ids
+    assert index.names == rebuilt.names
+    assert index.total_rows == rebuilt.total_rows
+    np.testing.assert_allclose(index.score_many(queries()), rebuilt.score_many(queries()), atol=1e-6)
+
+
+def test_from_tests_stores_shared_phrases_once():
+    tests, _ = make_tests()
+    index = EmbeddingIndex.from_tests(tests)
+    distinct = {pid for test in tests for pid in test["phrase_ids"]}
+    assert index.matrix.shape[0] == len(distinct)
+    assert index.total_rows == sum(len(test["phrase_ids"]) for test in tests)
+
+
+def test_scores_match_per_test_max():
+    tests, _ = make_tests()
+    index = EmbeddingIndex.from_tests(tests)
+    q = queries()
+    expected = np.array([
+        [max(float(np.dot(qv / np.linalg.norm(qv), np.asarray(e) / np.linalg.norm(e))) for e in t["embeddings"])
+         for t in tests]
+        for qv in q
+    ])
+    np.testing.assert_allclose(index.score_many(q), expected, atol=1e-5)
+
+
+def test_upsert_new_and_existing_tests_match_rebuild():
+    tests, phrases = make_tests()
+    index = EmbeddingIndex.from_tests(tests)
+
+    # Replace a test's phrases: keep one shared phrase, drop the rest, add a new one
+    changed = dict(tests[2], embeddings=[phrases[3].tolist(), phrases[7].tolist(), np.ones(DIM).tolist()],
+                   phrase_ids=[3, 7, 999])
+    index = index.upsert(changed["id"], changed["name"], changed["embeddings"], changed["phrase_ids"])
+    tests[2] = changed
+    assert_same_index(index, tests)
+
+    # A new test placed between existing names, reusing a phrase of another test
+    added = {"id": "new", "name": "Test 05a", "embeddings": [phrases[0].tolist()], "phrase_ids": [0]}
+    index = index.upsert(added["id"], added["name"], added["embeddings"], added["phrase_ids"])
+    tests.append(added)
+    assert_same_index(index, tests)
+
+    # A rename moves the test to its new name position
+    renamed = dict(tests[0], name="Test 99")
+    index = index.upsert(renamed["id"], renamed["name"], renamed["embeddings"], renamed["phrase_ids"])
+    tests[0] = renamed
+    assert_same_index(index, tests)
+
+
+def test_upsert_reuses_rows_of_shared_phrases():
+    tests, phrases = make_tests()
+    index = EmbeddingIndex.from_tests(tests)
+    rows_before = index.matrix.shape[0]
+    updated = index.upsert("t1", "Test 01", [phrases[0].tolist(), phrases[1].tolist()], [0, 1])
+    assert updated.matrix.shape[0] == rows_before
+    updated = updated.upsert("t1", "Test 01", [np.ones(DIM).tolist()], [12345])
+    assert updated.matrix.shape[0] == rows_before + 1
+
+
+def test_remove_matches_rebuild_and_keeps_shared_phrases():
+    tests, _ = make_tests()
+    index = EmbeddingIndex.from_tests(tests)
+    for test_id in ["t0", "t5", "t11"]:
+        index = index.remove(test_id)
+        tests = [t for t in tests if t["id"] != test_id]
+        assert_same_index(index, tests)
+    assert index.remove("unknown") is index
+
+
+def test_upsert_without_embeddings_removes_test():
+    tests, _ = make_tests()
+    index = EmbeddingIndex.from_tests(tests).upsert("t3", "Test 03", [])
+    assert_same_index(index, [t for t in tests if t["id"] != "t3"])
+
+
+def test_updates_leave_original_untouched():
+    tests, phrases = make_tests()
+    index = EmbeddingIndex.from_tests(tests)
+    before = index.score_many(queries())
+    index.upsert("t4", "Test 04", [np.ones(DIM).tolist()], [555])
+    index.remove("t6")
+    np.testing.assert_array_equal(index.score_many(queries()), before)
+    assert len(index) == len(tests)
+
+
+def test_tests_without_phrase_ids():
+    tests, _ = make_tests(shared=False)
+    for test in tests:
+        del test["phrase_ids"]
+    index = EmbeddingIndex.from_tests(tests)
+    assert index.rows is None
+    index = index.upsert("t2", "Test 02", [np.ones(DIM).tolist()])
+    tests[2] = dict(tests[2], embeddings=[np.ones(DIM).tolist()])
+    assert_same_index(index, tests)
+
+
+@pytest.mark.parametrize("kind", ["float16", "int8"])
+@pytest.mark.parametrize("threshold", [0.2, 0.4, 0.6])
+def test_quantized_scan_returns_exact_match_set(kind, threshold):
+    tests, _ = make_tests(seed=3, count=40)
+    exact = EmbeddingIndex.from_tests(tests)
+    quantized = EmbeddingIndex.from_tests(tests).quantize(kind, rescore_top=4, spill=False)
+    q = queries(seed=4, count=50)
+    exact_scores = exact.score_many(q)
+    approx_scores = quantized.score_many(q, threshold=threshold)
+    for qi in range(len(q)):
+        assert quantized.match(None, threshold, scores=approx_scores[qi]) == \
+            exact.match(None, threshold, scores=exact_scores[qi])
+        # The best tests are re-scored exactly, so the LLM candidates are the same (up to exact ties)
+        top = [exact.names.index(name) for name in quantized.topk(None, 4, scores=approx_scores[qi])]
+        np.testing.assert_allclose(exact_scores[qi][top], np.sort(exact_scores[qi])[::-1][:4], atol=1e-6)
+
+
+@pytest.mark.parametrize("kind", ["float16", "int8"])
+def test_quantized_upsert_matches_exact(kind):
+    tests, phrases = make_tests(seed=5)
+    quantized = EmbeddingIndex.from_tests(tests).quantize(kind, spill=False)
+    quantized = quantized.upsert("t2", "Test 02", [phrases[0].tolist(), np.ones(DIM).tolist()], [0, 777])
+    tests[2] = dict(tests[2], embeddings=[phrases[0].tolist(), np.ones(DIM).tolist()], phrase_ids=[0, 777])
+    exact = EmbeddingIndex.from_tests(sorted(tests, key=lambda t: t["name"]))
+    q = queries()
+    approx_scores = quantized.score_many(q, threshold=0.3)
+    exact_scores = exact.score_many(q)
+    for qi in range(len(q)):
+        assert quantized.match(None, 0.3, scores=approx_scores[qi]) == exact.match(None, 0.3, scores=exact_scores[qi])
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from lexical_index import LexicalIndex
+from utils import normalize_text, has_test_reference, extract_negated_tests
+
+TESTS = [
+    {"id": "cbc", "name": "CBC", "synonyms": ["complete blood count", "hemogram"]},
+    {"id": "rbs", "name": "RBS", "synonyms": ["random blood sugar", "sugar"]},
+    {"id": "fbs", "name": "FBS", "synonyms": ["fasting blood sugar", "fasting sugar"]},
+    {"id": "lft", "name": "LFT", "synonyms": ["liver function test"]},
+    {"id": "ecg", "name": "ECG", "synonyms": ["ekg", "electrocardiogram"]},
+    {"id": "tsh", "name": "TSH", "synonyms": ["thyroid"]},
+    {"id": "t3", "name": "T3", "synonyms": ["thyroid", "t3 total"]},  # shares "thyroid" with TSH
+]
+
+WORDS = ["check", "do", "the", "blood", "sugar", "count", "fasting", "liver", "function", "test",
+         "cbc", "lft", "ekg", "ecg", "thyroid", "t3", "total", "hemogram", "random", "complete",
+         "please", "and", "no", "sugarcbc", "ecgs"]
+
+
+def scan_names(text, tests):
+    """The original per-test substring scan, as a set of test names"""
+    norm = normalize_text(text)
+    return {
+        test["name"] for test in tests
+        if test["name"].lower() in norm or any(syn.lower() in norm for syn in test.get("synonyms", []))
+    }
+
+
+def random_texts(count, seed=0):
+    rnd = random.Random(seed)
+    return [" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 8))) for _ in range(count)]
+
+
+@pytest.mark.parametrize("text", random_texts(300))
+def test_find_names_matches_substring_scan(text):
+    index = LexicalIndex.from_tests(TESTS)
+    assert set(index.find_names(normalize_text(text))) == scan_names(text, TESTS)
+    assert has_test_reference(text, TESTS, index) == has_test_reference(text, TESTS)
+
+
+def test_overlapping_and_nested_patterns():
+    index = LexicalIndex.from_tests(TESTS)
+    # "fasting blood sugar" contains "sugar"; "t3 total" contains "t3"
+    assert index.find_names("fasting blood sugar and t3 total") == ["FBS", "RBS", "T3"]
+    assert index.find_names("thyroid") == ["T3", "TSH"]
+    assert index.find_names("nothing relevant") == []
+
+
+def test_empty_pattern_matches_every_text():
+    tests = TESTS + [{"id": "blank", "name": "Blank", "synonyms": [""]}]
+    index = LexicalIndex.from_tests(tests)
+    for text in ["", "anything at all", "cbc"]:
+        assert set(index.find_names(normalize_text(text))) == scan_names(text, tests)
+        assert index.contains_any(normalize_text(text))
+
+
+def test_incremental_updates_match_rebuild():
+    index = LexicalIndex.from_tests(TESTS)
+    index.remove_test("tsh")
+    index.add_test("rbs", "RBS", ["random sugar"])  # replaces "random blood sugar" and "sugar"
+    index.add_test("hba1c", "HbA1c", ["glycated hemoglobin", "sugar"])
+    tests = [t for t in TESTS if t["id"] not in ("tsh", "rbs")] + [
+        {"id": "rbs", "name": "RBS", "synonyms": ["random sugar"]},
+        {"id": "hba1c", "name": "HbA1c", "synonyms": ["glycated hemoglobin", "sugar"]},
+    ]
+    rebuilt = LexicalIndex.from_tests(tests)
+    for text in random_texts(200, seed=1) + ["glycated hemoglobin", "random sugar", "thyroid"]:
+        norm = normalize_text(text)
+        assert index.find_names(norm) == rebuilt.find_names(norm)
+        assert set(index.find_names(norm)) == scan_names(text, tests)
+    assert index.pattern_count == rebuilt.pattern_count
+
+
+def test_negation_gate_uses_same_semantics():
+    index = LexicalIndex.from_tests(TESTS)
+    chunk = "Don't do the liver function test or ECG"
+    assert sorted(extract_negated_tests(chunk, TESTS, index)) == sorted(extract_negated_tests(chunk, TESTS))
+
+
+def test_find_exact_collapses_whitespace():
+    index = LexicalIndex.from_tests(TESTS)
+    assert index.find_exact("complete blood count") == ["CBC"]
+    assert index.find_exact("thyroid") == ["T3", "TSH"]
+    assert index.find_exact("blood count") == []
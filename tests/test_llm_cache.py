@@ -0,0 +1,28 @@
+import pytest
+
+from database import get_db_session, LLMDecision, LLMDecisionCache
+
+
+@pytest.fixture
+def cache(db):
+    return LLMDecisionCache(ttl_seconds=3600)
+
+
+def set_age(key, seconds):
+    db = get_db_session()
+    try:
+        row = db.get(LLMDecision, key)
+        row.created_at -= seconds
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_purge_expired_drops_only_old_decisions(cache):
+    cache.put("old", "sugar test", ["FBS", "RBS"], "v1", ["FBS"])
+    cache.put("fresh", "blood count", ["CBC"], "v1", ["CBC"])
+    set_age("old", 7200)
+    assert cache.get("old") is None  # already ignored before the purge
+    assert cache.purge_expired() == 1
+    assert cache.get("fresh") == ["CBC"]
+    assert cache.purge_expired() == 0
@@ -0,0 +1,130 @@
+import json
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from catalog import Catalog
+from encoders import LazyEncoder
+
+TRANSCRIPT = "Check CBC. Order the sugar test. Don't do LFT. Check thyroid levels."
+CHUNKS = ["Check CBC", "Order the sugar test", "Don't do LFT", "Check thyroid levels"]
+
+TESTS = [
+    {"id": "cbc", "name": "CBC", "category": "Lab", "synonyms": ["complete blood count"], "embeddings": [[1, 0, 0, 0]]},
+    {"id": "lft", "name": "LFT", "category": "Lab", "synonyms": ["liver function test"], "embeddings": [[0, 0, 1, 0]]},
+    {"id": "rbs", "name": "RBS", "category": "Lab", "synonyms": ["sugar"], "embeddings": [[0, 1, 0, 0]]},
+    {"id": "tsh", "name": "TSH", "category": "Lab", "synonyms": ["thyroid"], "embeddings": [[0.8, 0, 0, 0.6]]},
+]
+
+
+class KeywordEncoder:
+    """Chunks mentioning sugar land on RBS; anything else scores below every threshold"""
+
+    def encode(self, texts, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        out = np.stack([np.array([0, 1, 0, 0] if "sugar" in t.lower() else [0, 0, 0, 1], dtype=np.float32)
+                        for t in texts])
+        return out[0] if single else out
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import app
+    model = LazyEncoder(KeywordEncoder)
+    model.get()
+    catalog = Catalog.from_tests(TESTS)
+
+    async def fake_llm_fallback(chunk, tests, *args, **kwargs):
+        return {"matches": ["TSH"] if "thyroid" in chunk else ["Other"]}
+
+    monkeypatch.setattr(app, "model", model)
+    monkeypatch.setattr(app, "query_encoder", KeywordEncoder())
+    monkeypatch.setattr(app, "get_catalog", lambda db=None: catalog)
+    monkeypatch.setattr(app, "llm_fallback_async", fake_llm_fallback)
+    monkeypatch.setattr(app, "CASCADE_MODEL", "")
+    monkeypatch.setattr(app, "MATCH_REQUEST_LOG", None)
+    return TestClient(app.app)
+
+
+def parse_ndjson(body):
+    return [(line["event"], line["data"]) for line in map(json.loads, body.splitlines())]
+
+
+def parse_sse(body):
+    assert body.endswith("\n\n")
+    events = []
+    for message in body[:-2].split("\n\n"):
+        event_line, data_line = message.split("\n")
+        assert event_line.startswith("event: ") and data_line.startswith("data: ")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return events
+
+
+def check_events(events, expected_summary):
+    names = [name for name, _ in events]
+    assert names == ["chunks"] + ["chunk"] * len(CHUNKS) + ["summary"]
+    assert events[0][1] == {"transcript": TRANSCRIPT, "chunks": CHUNKS}
+    chunk_events = [data for name, data in events if name == "chunk"]
+    assert sorted(data["index"] for data in chunk_events) == list(range(len(CHUNKS)))
+    by_index = {data["index"]: data for data in chunk_events}
+    assert by_index[0]["detected"] == ["CBC"] and by_index[0]["entry"]["method"] == "exact"
+    assert by_index[2]["removed"] == ["LFT"]
+    assert by_index[3]["detected"] == ["TSH"] and by_index[3]["entry"]["method"] == "llm"
+    # The LLM fallback resolves last
+    assert chunk_events[-1]["index"] == 3
+    assert events[-1][1] == expected_summary
+
+
+def test_plain_response(client):
+    response = client.post("/match_stream", json={"transcript": TRANSCRIPT})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["detected_tests"] == [
+        {"name": "CBC", "method": "exact", "score": 1.0},
+        {"name": "RBS", "method": "embedding", "score": 1.0},
+        {"name": "TSH", "method": "llm", "score": None},
+    ]
+    assert body["removed_tests"] == ["LFT"]
+    assert [entry["chunk"] for entry in body["trace"]] == CHUNKS
+
+
+def test_ndjson_stream_ends_with_plain_body(client):
+    plain = client.post("/match_stream", json={"transcript": TRANSCRIPT}).json()
+    response = client.post("/match_stream", json={"transcript": TRANSCRIPT, "stream": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert response.headers["cache-control"] == "no-cache"
+    check_events(parse_ndjson(response.text), plain)
+
+
+def test_sse_stream_ends_with_plain_body(client):
+    plain = client.post("/match_stream", json={"transcript": TRANSCRIPT}).json()
+    response = client.post("/match_stream", json={"transcript": TRANSCRIPT, "stream": "sse"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    check_events(parse_sse(response.text), plain)
+
+
+def test_accept_header_selects_sse(client):
+    response = client.post("/match_stream", json={"transcript": TRANSCRIPT},
+                           headers={"Accept": "text/event-stream"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert parse_sse(response.text)[0][0] == "chunks"
+
+    # An explicit stream field wins over the Accept header
+    response = client.post("/match_stream", json={"transcript": TRANSCRIPT, "stream": "ndjson"},
+                           headers={"Accept": "text/event-stream"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+
+def test_unknown_stream_format_is_rejected(client):
+    response = client.post("/match_stream", json={"transcript": TRANSCRIPT, "stream": "xml"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "stream must be one of: sse, ndjson"
+
+
+def test_summary_timings_are_opt_in(client):
+    response = client.post("/match_stream", json={"transcript": TRANSCRIPT, "stream": "ndjson", "timings": True})
+    summary = parse_ndjson(response.text)[-1][1]
+    assert "timings" in summary and "total_ms" in summary["timings"]
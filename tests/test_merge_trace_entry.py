@@ -0,0 +1,66 @@
+from utils import merge_trace_entry
+
+
+def merge(entries):
+    matches, removed = {}, set()
+    for entry in entries:
+        merge_trace_entry(entry, matches, removed)
+    return matches, removed
+
+
+def embedding(name, score):
+    return {"chunk": name, "method": "embedding", "matches": [{"name": name, "score": score}]}
+
+
+def exact(name):
+    return {"chunk": name, "method": "exact", "matches": [{"name": name, "score": 1.0}]}
+
+
+def llm(*names):
+    return {"chunk": "vague order", "method": "llm", "matches": list(names)}
+
+
+def negation(*names):
+    return {"chunk": "don't do it", "method": "negation", "removed_tests": list(names)}
+
+
+def test_keeps_highest_score():
+    matches, _ = merge([embedding("CBC", 0.8), embedding("CBC", 0.9), embedding("CBC", 0.85)])
+    assert matches == {"CBC": {"method": "embedding", "score": 0.9}}
+
+
+def test_exact_match_beats_embedding_match():
+    matches, _ = merge([embedding("CBC", 0.8), exact("CBC")])
+    assert matches["CBC"] == {"method": "exact", "score": 1.0}
+
+
+def test_llm_match_does_not_overwrite_scored_match():
+    matches, _ = merge([embedding("CBC", 0.8), llm("CBC", "RBS")])
+    assert matches == {"CBC": {"method": "embedding", "score": 0.8}, "RBS": {"method": "llm", "score": None}}
+
+
+def test_scored_match_replaces_earlier_llm_match():
+    # Regression: comparing a float score with the LLM entry's None raised TypeError
+    matches, _ = merge([llm("CBC"), embedding("CBC", 0.8)])
+    assert matches == {"CBC": {"method": "embedding", "score": 0.8}}
+    matches, _ = merge([llm("CBC"), exact("CBC")])
+    assert matches == {"CBC": {"method": "exact", "score": 1.0}}
+
+
+def test_negation_removes_earlier_and_blocks_later_detections():
+    matches, removed = merge([embedding("CBC", 0.9), llm("RBS"), negation("CBC", "RBS"),
+                              exact("CBC"), llm("RBS"), embedding("LFT", 0.8)])
+    assert matches == {"LFT": {"method": "embedding", "score": 0.8}}
+    assert removed == {"CBC", "RBS"}
+
+
+def test_order_matters_for_negations():
+    assert merge([negation("CBC"), exact("CBC")])[0] == {}
+    # The same entries in the other order: the negation removes the detection
+    assert merge([exact("CBC"), negation("CBC")])[0] == {}
+    assert merge([negation("RBS"), exact("CBC")])[0] == {"CBC": {"method": "exact", "score": 1.0}}
+
+
+def test_skipped_entries_are_ignored():
+    matches, removed = merge([{"chunk": "fever", "method": "skipped", "reason": "symptom_not_test"}])
+    assert matches == {} and removed == set()
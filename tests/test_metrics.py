@@ -0,0 +1,66 @@
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry, _Metric
+
+
+def test_registry_renders_exposition_text():
+    registry = Registry()
+    requests = Counter("app_requests_total", "Requests", ("path",), registry=registry)
+    ready = Gauge("app_ready", "Model ready", registry=registry)
+    latency = Histogram("app_latency_seconds", "Latency", ("stage",), registry=registry, buckets=(0.1, 0.5, 1.0))
+
+    requests.inc(path="/match_stream")
+    requests.inc(2, path="/match_stream")
+    requests.inc(path='/a"b')
+    ready.set(1)
+    for value in (0.05, 0.1, 0.3, 0.7, 2.0):
+        latency.observe(value, stage="encode")
+    latency.observe(0.2, stage="scan")
+
+    assert registry.render().splitlines() == [
+        "# HELP app_requests_total Requests",
+        "# TYPE app_requests_total counter",
+        'app_requests_total{path="/a\\"b"} 1',
+        'app_requests_total{path="/match_stream"} 3',
+        "# HELP app_ready Model ready",
+        "# TYPE app_ready gauge",
+        "app_ready 1",
+        "# HELP app_latency_seconds Latency",
+        "# TYPE app_latency_seconds histogram",
+        # Buckets are cumulative and end with +Inf, which equals _count
+        'app_latency_seconds_bucket{stage="encode",le="0.1"} 2',
+        'app_latency_seconds_bucket{stage="encode",le="0.5"} 3',
+        'app_latency_seconds_bucket{stage="encode",le="1"} 4',
+        'app_latency_seconds_bucket{stage="encode",le="+Inf"} 5',
+        'app_latency_seconds_sum{stage="encode"} 3.15',
+        'app_latency_seconds_count{stage="encode"} 5',
+        'app_latency_seconds_bucket{stage="scan",le="0.1"} 0',
+        'app_latency_seconds_bucket{stage="scan",le="0.5"} 1',
+        'app_latency_seconds_bucket{stage="scan",le="1"} 1',
+        'app_latency_seconds_bucket{stage="scan",le="+Inf"} 1',
+        'app_latency_seconds_sum{stage="scan"} 0.2',
+        'app_latency_seconds_count{stage="scan"} 1',
+    ]
+
+
+def test_gauge_callback_is_read_at_render_time():
+    registry = Registry()
+    hits = {"query": 3}
+    Gauge("cache_hits_total", "Hits", ("cache",), registry=registry, kind="counter",
+          callback=lambda: {(name,): value for name, value in hits.items()})
+    hits["query"] = 4
+    assert registry.render().splitlines()[1:] == ["# TYPE cache_hits_total counter", 'cache_hits_total{cache="query"} 4']
+
+
+def test_labels_must_match_and_names_be_unique():
+    registry = Registry()
+    counter = Counter("x_total", "X", ("method",), registry=registry)
+    with pytest.raises(ValueError):
+        counter.inc(other="y")
+    with pytest.raises(ValueError):
+        Counter("x_total", "Again", registry=registry)
+
+
+def test_metric_base_is_abstract():
+    with pytest.raises(TypeError):
+        _Metric("m", "M", registry=Registry())
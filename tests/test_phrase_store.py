@@ -0,0 +1,62 @@
+import numpy as np
+
+from database import Test as MedicalTest, Phrase, PhraseRepository
+
+MODEL = "test-model"
+
+
+class FakeEncoder:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return np.stack([np.full(4, len(t), dtype=np.float32) for t in texts])
+
+
+def age_all_phrases(db, seconds=10_000):
+    db.query(Phrase).update({Phrase.used_at: Phrase.used_at - seconds})
+    db.commit()
+
+
+def phrase_texts(db):
+    return sorted(row.text for row in db.query(Phrase.text).all())
+
+
+def test_shared_phrases_are_encoded_once(db, add_test):
+    add_test("cbc", "CBC", ["hemogram", "blood test"], encoder=FakeEncoder())
+    encoder = FakeEncoder()
+    ids, encoded = PhraseRepository.ensure_phrases(db, ["RBS", "Blood  Test", "blood test"], encoder, MODEL)
+    assert encoded == 1 and encoder.encoded == ["rbs"]
+    assert ids[1] == ids[2]
+
+
+def test_prune_deletes_old_unreferenced_phrases(db, add_test):
+    add_test("cbc", "CBC", ["hemogram"], encoder=FakeEncoder())
+    PhraseRepository.ensure_phrases(db, ["removed synonym"], FakeEncoder(), MODEL)
+    age_all_phrases(db)
+    assert PhraseRepository.delete_unreferenced(db) == 1
+    assert phrase_texts(db) == ["cbc", "hemogram"]
+
+
+def test_prune_spares_phrases_handed_out_before_their_test_commits(db, add_test):
+    add_test("cbc", "CBC", encoder=FakeEncoder())
+    PhraseRepository.ensure_phrases(db, ["old orphan"], FakeEncoder(), MODEL)
+    age_all_phrases(db)
+
+    # A concurrent create: phrases exist (one new, one reused orphan) but phrase_ids are not committed yet
+    ids, _ = PhraseRepository.ensure_phrases(db, ["new test", "old orphan"], FakeEncoder(), MODEL)
+    assert PhraseRepository.delete_unreferenced(db) == 0
+
+    test = MedicalTest(id="new", name="new test", category="Lab", synonyms=["old orphan"])
+    test.set_phrase_ids(ids)
+    db.add(test)
+    db.commit()
+    assert len(PhraseRepository.get_vectors(db, ids)) == 2
+
+
+def test_prune_without_grace_period(db, add_test):
+    add_test("cbc", "CBC", encoder=FakeEncoder())
+    PhraseRepository.ensure_phrases(db, ["orphan"], FakeEncoder(), MODEL)
+    assert PhraseRepository.delete_unreferenced(db) == 0
+    assert PhraseRepository.delete_unreferenced(db, grace_seconds=-1) == 1
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import database
+from database import Test as MedicalTest, TestRepository
+from utils import normalize_phrase
+
+
+class CountingEncoder:
+    """Encodes a text as a vector derived from its characters, counting texts encoded"""
+
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, texts, **kwargs):
+        self.encoded += len(texts)
+        return np.stack([np.array([len(t), sum(map(ord, t)) % 97, 1.0], dtype=np.float32) for t in texts])
+
+
+def regenerate(db, test, model_name):
+    encoder = CountingEncoder()
+    phrases, encoded = TestRepository.regenerate_embeddings(db, test, encoder, model_name)
+    assert encoded == encoder.encoded
+    return phrases, encoded
+
+
+@pytest.mark.parametrize("storage", ["float32", "phrases"])
+def test_only_new_phrases_are_encoded(db, monkeypatch, storage):
+    monkeypatch.setattr(database, "EMBEDDING_STORAGE", storage)
+    test = MedicalTest(id="cbc", name="CBC", category="Lab",
+                       synonyms=["complete blood count", "hemogram", "full blood count"])
+    db.add(test)
+    db.commit()
+
+    assert regenerate(db, test, "model-a") == (4, 4)
+
+    test.synonyms = test.synonyms + ["blood picture"]
+    assert regenerate(db, test, "model-a") == (5, 1)
+    assert regenerate(db, test, "model-a") == (5, 0)
+
+    # Vectors of another model are never reused
+    assert regenerate(db, test, "model-b") == (5, 5)
+
+    stored = TestRepository.get_test_with_embeddings(db, "cbc")
+    phrases = [test.name] + test.synonyms
+    if storage == "phrases":
+        # The phrase store encodes normalized phrases
+        phrases = [normalize_phrase(p) for p in phrases]
+    expected = CountingEncoder().encode(phrases)
+    np.testing.assert_allclose(np.asarray(stored["embeddings"]), expected)
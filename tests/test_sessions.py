@@ -0,0 +1,101 @@
+import pytest
+
+from sessions import MatchSession, parse_session_message
+
+
+def embedding(name, score, chunk=None):
+    return {"chunk": chunk or name, "method": "embedding", "matches": [{"name": name, "score": score}]}
+
+
+def test_first_fragment_adds_tests():
+    session = MatchSession()
+    delta = session.apply("Check CBC and RBS.", [embedding("CBC", 0.9), embedding("RBS", 0.8)])
+    assert delta["type"] == "delta" and delta["seq"] == 1
+    assert delta["fragment"] == "Check CBC and RBS."
+    assert delta["added"] == [{"name": "CBC", "method": "embedding", "score": 0.9},
+                              {"name": "RBS", "method": "embedding", "score": 0.8}]
+    assert delta["updated"] == [] and delta["removed"] == [] and delta["removed_tests"] == []
+
+
+def test_later_fragments_report_only_changes():
+    session = MatchSession()
+    session.apply("Check CBC.", [embedding("CBC", 0.8)])
+    delta = session.apply("CBC again, and LFT.", [embedding("CBC", 0.95), embedding("LFT", 0.9)])
+    assert delta["seq"] == 2
+    assert delta["added"] == [{"name": "LFT", "method": "embedding", "score": 0.9}]
+    assert delta["updated"] == [{"name": "CBC", "method": "embedding", "score": 0.95}]
+
+    # A lower score changes nothing
+    delta = session.apply("Also CBC.", [embedding("CBC", 0.7)])
+    assert delta["added"] == [] and delta["updated"] == [] and delta["removed"] == []
+    assert delta["trace"] == [embedding("CBC", 0.7)]
+
+
+def test_negation_removes_earlier_detection_and_blocks_later_ones():
+    session = MatchSession()
+    session.apply("Check CBC.", [embedding("CBC", 0.9)])
+    delta = session.apply("Don't do CBC.", [{"chunk": "Don't do CBC", "method": "negation", "removed_tests": ["CBC"]}])
+    assert delta["removed"] == ["CBC"]
+    assert delta["removed_tests"] == ["CBC"]
+
+    delta = session.apply("Check CBC.", [embedding("CBC", 0.9)])
+    assert delta["added"] == [] and delta["removed_tests"] == []
+
+
+def test_llm_match_upgraded_by_scored_match():
+    session = MatchSession()
+    delta = session.apply("The usual sugar test.", [{"chunk": "usual", "method": "llm", "matches": ["FBS"]}])
+    assert delta["added"] == [{"name": "FBS", "method": "llm", "score": None}]
+    delta = session.apply("Fasting sugar.", [embedding("FBS", 0.9)])
+    assert delta["updated"] == [{"name": "FBS", "method": "embedding", "score": 0.9}]
+
+
+def test_summary_matches_single_pass_result():
+    entries = [embedding("CBC", 0.9), {"chunk": "no LFT", "method": "negation", "removed_tests": ["LFT"]},
+               embedding("LFT", 0.8), embedding("RBS", 0.85)]
+    incremental = MatchSession()
+    for entry in entries:
+        incremental.apply(entry["chunk"], [entry])
+    whole = MatchSession()
+    whole.apply("whole transcript", entries)
+    assert incremental.summary()["detected_tests"] == whole.summary()["detected_tests"]
+    assert incremental.summary()["removed_tests"] == whole.summary()["removed_tests"] == ["LFT"]
+    assert incremental.summary()["trace"] == entries
+    assert incremental.summary()["transcript"] == "CBC no LFT LFT RBS"
+    assert whole.summary("given")["transcript"] == "given"
+
+
+def test_reset_forgets_everything_but_seq():
+    session = MatchSession()
+    session.apply("Check CBC.", [embedding("CBC", 0.9)])
+    session.reset()
+    assert session.summary() == {"transcript": "", "detected_tests": [], "removed_tests": [], "trace": []}
+    delta = session.apply("Check CBC.", [embedding("CBC", 0.9)])
+    assert delta["added"] == [{"name": "CBC", "method": "embedding", "score": 0.9}]
+    assert delta["seq"] == 2
+
+
+def test_parse_session_message_defaults_and_normalizes():
+    assert parse_session_message('{"text": "  Check CBC. "}') == {"type": "text", "text": "Check CBC.", "threshold": None}
+    assert parse_session_message(b'{"type": "text", "text": "x", "threshold": 1}')["threshold"] == 1.0
+    assert parse_session_message('{"type": "summary"}') == {"type": "summary", "text": "", "threshold": None}
+
+
+@pytest.mark.parametrize("raw", [
+    None, "", "not json", "[1, 2]", '"text"', "42", b"\xff\xfe",
+    '{"type": "shout"}', '{"type": ["text"]}', '{"text": 5}',
+    '{"threshold": "high"}', '{"threshold": true}', '{"threshold": [0.8]}', '{"threshold": NaN}',
+])
+def test_parse_session_message_rejects_malformed_frames(raw):
+    with pytest.raises(ValueError):
+        parse_session_message(raw)
+
+
+def test_fast_tier_scores_are_tagged_and_yield_to_main_model():
+    session = MatchSession()
+    fast = {"chunk": "CBC", "method": "embedding", "tier": "fast",
+            "matches": [{"name": "CBC", "score": 0.95, "tier": "fast"}]}
+    delta = session.apply("CBC.", [fast])
+    assert delta["added"] == [{"name": "CBC", "method": "embedding", "score": 0.95, "tier": "fast"}]
+    delta = session.apply("CBC again.", [embedding("CBC", 0.8)])
+    assert delta["updated"] == [{"name": "CBC", "method": "embedding", "score": 0.8}]
@@ -0,0 +1,37 @@
+from database import TestRepository
+from embedding_snapshot import read_snapshot_header, load_snapshot
+from match_batch import prepare_snapshot
+
+
+def snapshot_names(path):
+    tests, _, _ = load_snapshot(path)
+    return [test["name"] for test in tests]
+
+
+def test_fingerprint_follows_catalog_changes(db, add_test):
+    add_test("cbc", "CBC", ["complete blood count"])
+    before = TestRepository.get_catalog_fingerprint(db)
+    assert TestRepository.get_catalog_fingerprint(db) == before
+    TestRepository.update_test(db, "cbc", {"synonyms": ["hemogram"]})
+    changed = TestRepository.get_catalog_fingerprint(db)
+    assert changed != before
+    TestRepository.delete_test(db, "cbc")
+    assert TestRepository.get_catalog_fingerprint(db) not in (before, changed)
+
+
+def test_prepare_snapshot_reuses_only_matching_file(db, add_test, tmp_path):
+    path = str(tmp_path / "embeddings.snapshot")
+    add_test("cbc", "CBC")
+    prepare_snapshot(path)
+    version, source = read_snapshot_header(path)
+    assert source == TestRepository.get_catalog_fingerprint(db)
+
+    # Unchanged database: the file is reused as is
+    prepare_snapshot(path)
+    assert read_snapshot_header(path) == (version, source)
+
+    # A file left over from an older database state is exported again
+    add_test("rbs", "RBS", ["random blood sugar"])
+    prepare_snapshot(path)
+    assert read_snapshot_header(path)[0] != version
+    assert snapshot_names(path) == ["CBC", "RBS"]
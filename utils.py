@@ -7,10 +7,17 @@ embedding-based matching, and LLM fallback mechanisms.
 
 import re
 import json
+import time
+import asyncio
+import contextlib
+import hashlib
 import unicodedata
-import torch
-from sentence_transformers import util
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
+
+import numpy as np
+
+from embedding_index import EmbeddingIndex
+from lexical_index import LexicalIndex
 
 
 # -----------------------------
@@ -29,6 +36,11 @@ ORDER_KEYWORDS = [
     "check", "test", "do", "order", "send", "investigate", "take", "include", "add"
 ]
 
+# LLM used for ambiguous chunks; bump LLM_PROMPT_VERSION whenever the prompt changes
+# so cached decisions from the old prompt are no longer used
+LLM_MODEL = "gpt-4o-mini"
+LLM_PROMPT_VERSION = "1"
+
 # Words that indicate symptoms rather than test names
 SYMPTOM_WORDS = [
     "pain", "pressure", "heaviness", "fatigue", "breathlessness",
@@ -156,7 +168,8 @@ def is_order_intent(text: str) -> bool:
     return any(word in norm for word in ORDER_KEYWORDS)
 
 
-def has_test_reference(text: str, tests: List[Dict[str, Any]]) -> bool:
+def has_test_reference(text: str, tests: List[Dict[str, Any]],
+                       lexical_index: Optional[LexicalIndex] = None) -> bool:
     """
     Check if text directly mentions any known test name or synonym.
 
@@ -165,6 +178,8 @@ def has_test_reference(text: str, tests: List[Dict[str, Any]]) -> bool:
     Args:
         text: Text to search for test references
         tests: List of test dictionaries with 'name' and 'synonyms' fields
+        lexical_index: Prebuilt LexicalIndex over tests (single pass over text);
+            falls back to scanning every test when omitted
 
     Returns:
         True if any test name or synonym is found in text, False otherwise
@@ -175,6 +190,9 @@ def has_test_reference(text: str, tests: List[Dict[str, Any]]) -> bool:
     """
     norm = normalize_text(text)
 
+    if lexical_index is not None:
+        return lexical_index.contains_any(norm)
+
     for test in tests:
         # Check test name
         if test["name"].lower() in norm:
@@ -188,7 +206,64 @@ def has_test_reference(text: str, tests: List[Dict[str, Any]]) -> bool:
     return False
 
 
-def extract_negated_tests(text: str, tests: List[Dict[str, Any]]) -> List[str]:
+def _exact_candidates(norm: str) -> List[str]:
+    """Chunk as-is, then without leading and/or trailing ORDER_KEYWORDS words"""
+    words = norm.strip(" .,;:!?").split()
+    start, end = 0, len(words)
+    while start < end and words[start] in ORDER_KEYWORDS:
+        start += 1
+    while end > start and words[end - 1] in ORDER_KEYWORDS:
+        end -= 1
+
+    candidates = []
+    for first, last in ((0, len(words)), (start, len(words)), (0, end), (start, end)):
+        phrase = " ".join(words[first:last])
+        if phrase and phrase not in candidates:
+            candidates.append(phrase)
+    return candidates
+
+
+def exact_match(text: str, tests: List[Dict[str, Any]],
+                lexical_index: Optional[LexicalIndex] = None) -> List[str]:
+    """
+    Find tests whose name or a synonym is exactly the chunk (minus order filler).
+
+    The chunk is tried as-is, then with leading/trailing ORDER_KEYWORDS words
+    stripped ("check CBC test" -> "cbc"), so a synonym that itself ends in
+    "test" still matches first. Both sides are compared in normalize_phrase
+    form (case- and accent-insensitive, whitespace collapsed).
+
+    Args:
+        text: Transcript chunk
+        tests: List of test dictionaries with 'name' and 'synonyms' fields
+        lexical_index: Prebuilt LexicalIndex over tests (one dict lookup per
+            candidate); falls back to scanning every test when omitted
+
+    Returns:
+        Names of the matching tests in catalog order; empty if the chunk is
+        not exactly a known name/synonym
+
+    Example:
+        >>> exact_match("check CBC", tests)
+        ["Complete Blood Count"]
+        >>> exact_match("check blood counts", tests)
+        []
+    """
+    for phrase in _exact_candidates(normalize_text(text)):
+        if lexical_index is not None:
+            names = lexical_index.find_exact(phrase)
+        else:
+            names = [
+                test["name"] for test in tests
+                if any(normalize_phrase(p) == phrase for p in [test["name"]] + test.get("synonyms", []))
+            ]
+        if names:
+            return names
+    return []
+
+
+def extract_negated_tests(text: str, tests: List[Dict[str, Any]],
+                          lexical_index: Optional[LexicalIndex] = None) -> List[str]:
     """
     Extract test names that are being negated/cancelled in the text.
 
@@ -198,6 +273,8 @@ def extract_negated_tests(text: str, tests: List[Dict[str, Any]]) -> List[str]:
     Args:
         text: Text containing negation/cancellation intent
         tests: List of test dictionaries with 'name' and 'synonyms' fields
+        lexical_index: Prebuilt LexicalIndex over tests (single pass over text);
+            falls back to scanning every test when omitted
 
     Returns:
         List of test names that should be removed
@@ -214,6 +291,9 @@ def extract_negated_tests(text: str, tests: List[Dict[str, Any]]) -> List[str]:
     if not has_negation:
         return []
 
+    if lexical_index is not None:
+        return lexical_index.find_names(norm)
+
     # Find which tests are mentioned in this negated context
     for test in tests:
         # Check test name
@@ -230,11 +310,124 @@ def extract_negated_tests(text: str, tests: List[Dict[str, Any]]) -> List[str]:
     return negated_tests
 
 
+def classify_chunk(chunk: str, tests: List[Dict[str, Any]],
+                   lexical_index: Optional[LexicalIndex] = None) -> Optional[Dict[str, Any]]:
+    """
+    Run the lexical gates (negation, symptom, exact phrase, intent) on a single chunk.
+
+    Chunks that can be resolved without embeddings get their final trace
+    entry here, including chunks that are exactly a known name/synonym
+    (method "exact", score 1.0); chunks that need embedding scoring return None.
+
+    Args:
+        chunk: Transcript chunk produced by split_into_chunks
+        tests: List of test dictionaries with 'name' and 'synonyms' fields
+        lexical_index: Prebuilt LexicalIndex over tests (optional)
+
+    Returns:
+        Trace entry dict for negated/skipped chunks, or None if the chunk
+        should go on to embedding matching
+
+    Example:
+        >>> classify_chunk("avoid CBC", tests)
+        {"chunk": "avoid CBC", "method": "negation", "removed_tests": ["CBC"]}
+        >>> classify_chunk("check CBC", tests)
+        {"chunk": "check CBC", "method": "exact", "matches": [{"name": "Complete Blood Count", "score": 1.0}]}
+        >>> classify_chunk("check the blood counts", tests) is None
+        True
+    """
+    norm_chunk = normalize_text(chunk)
+
+    # Check for negation/cancellation
+    if any(word in norm_chunk for word in NEGATION_WORDS):
+        negated = extract_negated_tests(chunk, tests, lexical_index)
+        if negated:
+            return {"chunk": chunk, "method": "negation", "removed_tests": negated}
+        return {"chunk": chunk, "method": "skipped", "reason": "negation_no_test"}
+
+    if any(word in norm_chunk for word in SYMPTOM_WORDS):
+        return {"chunk": chunk, "method": "skipped", "reason": "symptom_not_test"}
+
+    exact = exact_match(chunk, tests, lexical_index)
+    if exact:
+        return {"chunk": chunk, "method": "exact", "matches": [{"name": name, "score": 1.0} for name in exact]}
+
+    if not is_order_intent(chunk):
+        if not has_test_reference(chunk, tests, lexical_index):
+            return {"chunk": chunk, "method": "skipped", "reason": "no_intent"}
+    else:
+        if not has_test_reference(chunk, tests, lexical_index):
+            return {"chunk": chunk, "method": "skipped", "reason": "action_without_test"}
+
+    return None
+
+
+def _score_rank(match: Dict[str, Any]) -> Tuple[bool, float]:
+    """Sort key of a scored match: main-model scores above small-model ones, then by score"""
+    return (match.get("tier") != "fast", match["score"])
+
+
+def merge_trace_entry(entry: Dict[str, Any], aggregated_matches: Dict[str, Dict[str, Any]], removed_tests: set) -> None:
+    """
+    Fold one chunk's trace entry into the running transcript result.
+
+    Entries must be merged in transcript order so that a negation only
+    removes tests detected before it and blocks tests detected after it.
+    Scores of matches tagged "tier": "fast" come from the cascade's small
+    model and are not comparable with main-model scores: any main-model (or
+    exact) score replaces them, and they never replace one.
+
+    Args:
+        entry: Trace entry with "method" of negation, exact, embedding, llm or skipped
+        aggregated_matches: Test name -> {"method", "score"} (plus "tier" for
+            small-model scores), updated in place
+        removed_tests: Set of removed test names, updated in place
+    """
+    method = entry["method"]
+
+    if method == "negation":
+        for test_name in entry["removed_tests"]:
+            removed_tests.add(test_name)
+            aggregated_matches.pop(test_name, None)
+
+    elif method in ("exact", "embedding"):
+        for m in entry["matches"]:
+            # Don't add tests that were previously removed
+            if m["name"] not in removed_tests:
+                # Keep highest score if test detected multiple times (a scored match replaces an LLM one)
+                previous = aggregated_matches.get(m["name"])
+                if previous is None or previous["score"] is None or _score_rank(m) > _score_rank(previous):
+                    aggregated_matches[m["name"]] = {
+                        "method": method,
+                        "score": m["score"]
+                    }
+                    if "tier" in m:
+                        aggregated_matches[m["name"]]["tier"] = m["tier"]
+
+    elif method == "llm":
+        for m in entry["matches"]:
+            # Don't add tests that were previously removed
+            if m not in removed_tests:
+                # Don't overwrite embedding matches with LLM matches
+                if m not in aggregated_matches:
+                    aggregated_matches[m] = {
+                        "method": "llm",
+                        "score": None
+                    }
+
+
 # -----------------------------
 # Embedding Matching Functions
 # -----------------------------
 
-def embedding_match(text: str, tests: List[Dict[str, Any]], model, threshold: float = 0.75) -> List[Dict[str, Any]]:
+def add_timing(timings: Optional[Dict[str, float]], key: str, started: float) -> None:
+    """Accumulate the ms elapsed since `started` (time.perf_counter()) under timings[key]"""
+    if timings is not None:
+        timings[key] = timings.get(key, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def embedding_match(text: str, tests: List[Dict[str, Any]], model, threshold: float = 0.75,
+                    index: Optional[EmbeddingIndex] = None) -> List[Dict[str, Any]]:
     """
     Match text against test embeddings using cosine similarity.
 
@@ -246,34 +439,144 @@ def embedding_match(text: str, tests: List[Dict[str, Any]], model, threshold: fl
         tests: List of tests with pre-computed embeddings
         model: SentenceTransformer model for encoding
         threshold: Minimum cosine similarity score (0-1) to consider a match
+        index: Prebuilt EmbeddingIndex over tests (built on the fly if omitted)
 
     Returns:
         List of matching tests with format: [{"name": str, "score": float}, ...]
-        Sorted by score in descending order
+        In catalog order
 
     Example:
         >>> embedding_match("complete blood count", tests, model, 0.75)
         [{"name": "CBC", "score": 0.92}]
     """
-    query_emb = model.encode(text, convert_to_tensor=True)
-    results = []
+    if index is None:
+        index = EmbeddingIndex.from_tests(tests)
 
-    for test in tests:
-        # Convert stored embeddings to tensor
-        emb_tensor = torch.tensor(test["embeddings"])
+    query_emb = model.encode(text)
+    return index.match(query_emb, threshold=threshold)
+
+
+def embedding_match_batch(texts: List[str], tests: List[Dict[str, Any]], model, threshold: float = 0.75,
+                          index: Optional[EmbeddingIndex] = None, timings: Optional[Dict[str, float]] = None):
+    """
+    Match several chunks at once with a single encode call and matrix multiply.
+
+    Args:
+        texts: Query texts to match
+        tests: List of tests with pre-computed embeddings
+        model: SentenceTransformer model for encoding
+        threshold: Minimum cosine similarity score (0-1) to consider a match
+        index: Prebuilt EmbeddingIndex over tests (built on the fly if omitted)
+        timings: Optional dict; "encode_ms" and "scan_ms" are added to it
+
+    Returns:
+        Tuple (matches, query_embs): per-text match lists in the same format as
+        embedding_match, and the (len(texts), dim) query embeddings so callers
+        can reuse them (e.g. for llm_fallback_async) without re-encoding
 
-        # Calculate cosine similarity with all synonym embeddings
-        scores = util.cos_sim(query_emb, emb_tensor)
-        best_score = torch.max(scores).item()
+    Example:
+        >>> matches, embs = embedding_match_batch(["check CBC", "do RFT"], tests, model)
+        >>> matches
+        [[{"name": "CBC", "score": 0.91}], [{"name": "RFT", "score": 0.88}]]
+    """
+    if index is None:
+        index = EmbeddingIndex.from_tests(tests)
+    if not texts:
+        return [], None
+
+    started = time.perf_counter()
+    query_embs = model.encode(list(texts))
+    add_timing(timings, "encode_ms", started)
+
+    started = time.perf_counter()
+    scores = index.score_many(query_embs, threshold=threshold)
+    matches = [
+        index.match(query_embs[i], threshold=threshold, scores=scores[i])
+        for i in range(len(texts))
+    ]
+    add_timing(timings, "scan_ms", started)
+    return matches, query_embs
+
+
+def embedding_match_cascade(texts: List[str], tests: List[Dict[str, Any]], model, fast_model,
+                            index: EmbeddingIndex, fast_index: EmbeddingIndex, threshold: float = 0.75,
+                            band: Tuple[float, float] = (0.5, 0.8), timings: Optional[Dict[str, float]] = None):
+    """
+    Two-tier matching: a small encoder decides clear-cut chunks, the main one the rest.
 
-        # Add to results if above threshold
-        if best_score >= threshold:
-            results.append({"name": test["name"], "score": round(best_score, 3)})
+    Every chunk is scored with fast_model against fast_index first. A chunk is
+    decided by the fast tier when some test scores at or above band[1] and no
+    test falls inside the uncertainty band [band[0], band[1]); its matches are
+    the tests at or above threshold, tagged "tier": "fast" since their scores
+    are on the small model's scale. All other chunks (borderline ones, and those
+    without a confident match, which need main-model embeddings for the LLM
+    fallback anyway) are re-scored with embedding_match_batch.
 
-    return results
+    The band is only calibrated for thresholds inside it: with a threshold
+    outside [band[0], band[1]] every chunk goes to the main model.
+
+    Args:
+        texts: Query texts to match
+        tests: List of tests with pre-computed embeddings
+        model: Main encoder (the one index was built with)
+        fast_model: Small encoder (the one fast_index was built with)
+        index: EmbeddingIndex over tests with main-model vectors
+        fast_index: EmbeddingIndex over tests with fast-model vectors
+        threshold: Match threshold of the main model
+        band: (low, high) fast-model scores treated as uncertain, calibrated
+            for `threshold` (see benchmarks/cascade_benchmark.py)
+        timings: Optional dict; "encode_ms" and "scan_ms" of both tiers are added to it
 
+    Returns:
+        Tuple (matches, query_embs, tiers): per-text match lists as in
+        embedding_match_batch, main-model embeddings (None for chunks the fast
+        tier decided) and the tier that decided each chunk ("fast" or "full")
 
-def embedding_topk(text: str, tests: List[Dict[str, Any]], model, top_k: int = 5) -> List[str]:
+    Example:
+        >>> matches, embs, tiers = embedding_match_cascade(["check CBC", "do the usual"], tests,
+        ...     model, fast_model, index, fast_index)
+        >>> tiers
+        ["fast", "full"]
+    """
+    if not texts:
+        return [], [], []
+
+    low, high = band
+    matches: List[Optional[List[Dict[str, Any]]]] = [None] * len(texts)
+    query_embs = [None] * len(texts)
+    tiers = ["full"] * len(texts)
+
+    if low <= threshold <= high:
+        started = time.perf_counter()
+        fast_embs = fast_model.encode(list(texts))
+        add_timing(timings, "encode_ms", started)
+        started = time.perf_counter()
+        fast_scores = fast_index.score_many(fast_embs, threshold=low)
+
+        escalated = []
+        for i, scores in enumerate(fast_scores):
+            if np.any(scores >= high) and not np.any((scores >= low) & (scores < high)):
+                matches[i] = [dict(m, tier="fast") for m in fast_index.match(None, threshold=threshold, scores=scores)]
+                tiers[i] = "fast"
+            else:
+                escalated.append(i)
+        add_timing(timings, "scan_ms", started)
+    else:
+        escalated = list(range(len(texts)))
+
+    if escalated:
+        full_matches, full_embs = embedding_match_batch(
+            [texts[i] for i in escalated], tests, model, threshold=threshold, index=index, timings=timings
+        )
+        for j, i in enumerate(escalated):
+            matches[i] = full_matches[j]
+            query_embs[i] = full_embs[j]
+
+    return matches, query_embs, tiers
+
+
+def embedding_topk(text: str, tests: List[Dict[str, Any]], model, top_k: int = 5,
+                   index: Optional[EmbeddingIndex] = None, query_emb=None) -> List[str]:
     """
     Get top-k most similar tests based on embedding similarity.
 
@@ -285,6 +588,8 @@ def embedding_topk(text: str, tests: List[Dict[str, Any]], model, top_k: int = 5
         tests: List of tests with pre-computed embeddings
         model: SentenceTransformer model for encoding
         top_k: Number of top matches to return
+        index: Prebuilt EmbeddingIndex over tests (built on the fly if omitted)
+        query_emb: Precomputed embedding of text (skips encoding when given)
 
     Returns:
         List of test names, ordered by similarity score (highest first)
@@ -293,53 +598,147 @@ def embedding_topk(text: str, tests: List[Dict[str, Any]], model, top_k: int = 5
         >>> embedding_topk("blood sugar", tests, model, top_k=3)
         ["RBS", "FBS", "HBA1c"]
     """
-    query_emb = model.encode(text, convert_to_tensor=True)
-    scored = []
-
-    for test in tests:
-        emb_tensor = torch.tensor(test["embeddings"])
-        scores = util.cos_sim(query_emb, emb_tensor)
-        best_score = torch.max(scores).item()
-        scored.append({"name": test["name"], "score": best_score})
+    if index is None:
+        index = EmbeddingIndex.from_tests(tests)
 
-    # Sort by score descending and return top-k test names
-    scored.sort(key=lambda x: x["score"], reverse=True)
-    return [s["name"] for s in scored[:top_k]]
+    if query_emb is None:
+        query_emb = model.encode(text)
+    return index.topk(query_emb, top_k=top_k)
 
 
 # -----------------------------
-# LLM Fallback Function
+# Embedding Generation Functions
 # -----------------------------
 
-def llm_fallback(text: str, tests: List[Dict[str, Any]], model, openai_client, top_k: int = 5) -> Dict[str, List[str]]:
+def phrase_hash(phrase: str, model_name: str) -> str:
     """
-    Use LLM to select most appropriate test from embedding-based candidates.
+    Content hash identifying the embedding of a phrase under a given model.
 
-    When embedding matching is ambiguous, this function:
-    1. Gets top-k most similar tests using embeddings
-    2. Asks GPT-4o-mini to select the most appropriate test(s)
-    3. Applies rules for panel selection, negation handling, etc.
+    Args:
+        phrase: Test name or synonym exactly as it is encoded
+        model_name: Name of the embedding model
+
+    Returns:
+        Hex sha1 digest of (model name, phrase)
+
+    Example:
+        >>> phrase_hash("CBC", "all-mpnet-base-v2")[:8]
+        '6fd382d7'
+    """
+    return hashlib.sha1(f"{model_name}\n{phrase}".encode("utf-8")).hexdigest()
+
+
+def normalize_phrase(phrase: str) -> str:
+    """
+    Canonical form of a name/synonym for the shared phrase store.
 
     Args:
-        text: Doctor's text/speech to analyze
-        tests: List of all available tests
-        model: SentenceTransformer model for embedding generation
-        openai_client: OpenAI client instance
-        top_k: Number of candidate tests to consider
+        phrase: Test name or synonym
 
     Returns:
-        Dictionary with "matches" key containing list of test names
-        Returns {"matches": ["Other"]} if no clear match
+        normalize_text(phrase) with whitespace runs collapsed
+
+    Example:
+        >>> normalize_phrase("  Chest  X-Ray ")
+        'chest x-ray'
+    """
+    return " ".join(normalize_text(phrase).split())
+
+
+def phrase_key(phrase: str, model_name: str) -> str:
+    """
+    Key of a phrase in the shared phrase store: the hash of its normalized text.
+
+    Args:
+        phrase: Test name or synonym
+        model_name: Name of the embedding model
+
+    Returns:
+        phrase_hash of the normalized phrase
+    """
+    return phrase_hash(normalize_phrase(phrase), model_name)
+
+
+def generate_test_embeddings(name: str, synonyms: List[str], model, model_name: str,
+                             existing_embeddings=None,
+                             existing_hashes: Optional[List[str]] = None) -> Tuple[np.ndarray, List[str], int]:
+    """
+    Build a test's embedding rows (name first, then synonyms), encoding only new phrases.
+
+    Rows whose phrase hash matches a previously stored row are reused as-is;
+    only new or changed phrases are sent to the model, in one encode call.
+
+    Args:
+        name: Test name
+        synonyms: Test synonyms
+        model: SentenceTransformer model for encoding
+        model_name: Model name, part of every phrase hash
+        existing_embeddings: Currently stored rows of the test (optional)
+        existing_hashes: Hashes aligned with existing_embeddings (optional)
+
+    Returns:
+        Tuple (embeddings, hashes, encoded): (rows, dim) float32 array, per-row
+        hashes, and the number of phrases actually encoded
 
     Example:
-        >>> llm_fallback("kidney function", tests, model, client)
-        {"matches": ["RFT"]}
+        >>> embs, hashes, encoded = generate_test_embeddings("CBC", ["hemogram", "new synonym"], model,
+        ...     "all-mpnet-base-v2", test.get_embeddings(), test.embedding_hashes)
+        >>> encoded
+        1
     """
-    # Get top candidate tests using embeddings
-    candidate_tests = embedding_topk(text, tests, model, top_k=top_k)
+    phrases = [name] + list(synonyms or [])
+    hashes = [phrase_hash(phrase, model_name) for phrase in phrases]
+
+    vectors: Dict[str, Any] = {}
+    if existing_embeddings is not None and existing_hashes and len(existing_hashes) == len(existing_embeddings):
+        for h, emb in zip(existing_hashes, existing_embeddings):
+            vectors.setdefault(h, emb)
+
+    missing = {}
+    for phrase, h in zip(phrases, hashes):
+        if h not in vectors and h not in missing:
+            missing[h] = phrase
+
+    if missing:
+        encoded = model.encode(list(missing.values()))
+        for h, emb in zip(missing.keys(), encoded):
+            vectors[h] = emb
 
-    # Construct prompt for LLM
-    prompt = f"""
+    embeddings = np.stack([np.asarray(vectors[h], dtype=np.float32) for h in hashes])
+    return embeddings, hashes, len(missing)
+
+
+# -----------------------------
+# LLM Fallback Function
+# -----------------------------
+
+def llm_cache_key(text: str, candidate_tests: List[str]) -> str:
+    """
+    Hash the inputs that fully determine an LLM fallback decision.
+
+    Args:
+        text: Chunk sent to the LLM
+        candidate_tests: Candidate test names in prompt order
+
+    Returns:
+        Hex sha256 digest of (prompt version, model, text, candidates)
+    """
+    payload = json.dumps([LLM_PROMPT_VERSION, LLM_MODEL, text, candidate_tests], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def build_llm_prompt(text: str, candidate_tests: List[str]) -> str:
+    """
+    Build the test-selection prompt sent to the LLM.
+
+    Args:
+        text: Doctor's text/speech to analyze
+        candidate_tests: Candidate test names from embedding_topk
+
+    Returns:
+        Prompt string
+    """
+    return f"""
 Doctor said: "{text}"
 
 Candidate tests: {", ".join(candidate_tests)}
@@ -357,16 +756,131 @@ If nothing fits, return:
 {{ "matches": ["Other"] }}
 """
 
-    # Call OpenAI API
-    response = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0
-    )
 
-    # Parse response
+def parse_llm_response(response) -> Optional[Dict[str, Any]]:
+    """
+    Parse the JSON answer out of a chat completion response.
+
+    Args:
+        response: OpenAI chat completion response
+
+    Returns:
+        Parsed JSON object, or None if the content is not valid JSON
+    """
     try:
         content = response.choices[0].message.content.strip()
         return json.loads(content)
     except Exception:
+        return None
+
+
+def _is_cacheable(result) -> bool:
+    """Only well-formed {"matches": [...]} answers are worth caching"""
+    return isinstance(result, dict) and isinstance(result.get("matches"), list)
+
+
+async def llm_fallback_async(text: str, tests: List[Dict[str, Any]], model, async_openai_client, top_k: int = 5,
+                             index: Optional[EmbeddingIndex] = None, query_emb=None, cache=None,
+                             semaphore: Optional[asyncio.Semaphore] = None,
+                             timings: Optional[Dict[str, float]] = None) -> Dict[str, List[str]]:
+    """
+    Use LLM to select most appropriate test from embedding-based candidates.
+
+    When embedding matching is ambiguous, this function:
+    1. Gets top-k most similar tests using embeddings
+    2. Asks GPT-4o-mini to select the most appropriate test(s)
+    3. Applies rules for panel selection, negation handling, etc.
+
+    The OpenAI call goes through the async client and the blocking cache
+    lookups run in a worker thread, so several fallbacks can run concurrently
+    without blocking the event loop.
+
+    Args:
+        text: Doctor's text/speech to analyze
+        tests: List of all available tests
+        model: SentenceTransformer model for embedding generation
+        async_openai_client: openai.AsyncOpenAI client instance
+        top_k: Number of candidate tests to consider
+        index: Prebuilt EmbeddingIndex over tests (built on the fly if omitted)
+        query_emb: Precomputed embedding of text (skips encoding when given)
+        cache: Optional decision cache with get(key) / put(key, text, candidates,
+            prompt_version, matches), e.g. database.LLMDecisionCache
+        semaphore: Optional semaphore capping concurrent OpenAI calls
+        timings: Optional dict; "scan_ms" (candidate search), "llm_queue_ms"
+            (waiting for the semaphore) and "llm_ms" (the OpenAI call) are
+            added to it, the latter two only when the cache missed
+
+    Returns:
+        Dictionary with "matches" key containing list of test names
+        Returns {"matches": ["Other"]} if no clear match
+
+    Example:
+        >>> await asyncio.gather(*(llm_fallback_async(c, tests, model, client) for c in chunks))
+        [{"matches": ["RFT"]}, {"matches": ["Other"]}]
+    """
+    started = time.perf_counter()
+    candidate_tests = embedding_topk(text, tests, model, top_k=top_k, index=index, query_emb=query_emb)
+    add_timing(timings, "scan_ms", started)
+    if not candidate_tests:
+        # Nothing retrieved (empty catalog or ANN miss): no test the LLM could pick
+        return {"matches": ["Other"]}
+
+    cache_key = llm_cache_key(text, candidate_tests) if cache is not None else None
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, cache_key)
+        if cached is not None:
+            return {"matches": cached}
+
+    started = time.perf_counter()
+    async with semaphore or contextlib.nullcontext():
+        add_timing(timings, "llm_queue_ms", started)
+        started = time.perf_counter()
+        try:
+            response = await async_openai_client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=[{"role": "user", "content": build_llm_prompt(text, candidate_tests)}],
+                temperature=0
+            )
+        finally:
+            add_timing(timings, "llm_ms", started)
+
+    result = parse_llm_response(response)
+    if result is None:
         return {"matches": ["Other"]}
+
+    if cache is not None and _is_cacheable(result):
+        await asyncio.to_thread(cache.put, cache_key, text, candidate_tests, LLM_PROMPT_VERSION, result["matches"])
+    return result
+
+
+# -----------------------------
+# Batch Input Functions
+# -----------------------------
+
+def parse_batch_line(line: str, line_no: int) -> Tuple[Any, str]:
+    """
+    Parse one JSONL line of a batch matching input.
+
+    Args:
+        line: A JSON object with "transcript" (and optional "id"), or a JSON string
+        line_no: 1-based line number, used as the id when the line has none
+
+    Returns:
+        Tuple (id, transcript)
+
+    Raises:
+        ValueError: If the line is not valid JSON or has no transcript
+
+    Example:
+        >>> parse_batch_line('{"id": "visit-7", "transcript": "Check CBC"}', 1)
+        ("visit-7", "Check CBC")
+    """
+    try:
+        item = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e}")
+    if isinstance(item, str):
+        return line_no, item
+    if not isinstance(item, dict) or not isinstance(item.get("transcript"), str):
+        raise ValueError('expected a JSON string or an object with a "transcript" string')
+    return item.get("id", line_no), item["transcript"]